@@ -0,0 +1,244 @@
+"""Headless meal planning for a whole client roster
+
+Usage: python planner.py batch ROSTER OUTPUT [--workers N] [--chunk-size N]
+
+ROSTER is a CSV or Parquet file with the columns name, weight, goal, activity_level,
+meals_per_day, proteins, carbs, vegetables and fats. Each food column lists the picks
+for every meal separated by "|", with the foods of one meal separated by ";", e.g.
+"Salmon|Chicken Breast (skinless);Egg Whites". A column with a single group applies it
+to every meal. OUTPUT (.csv, .parquet or .arrow) gets one row per planned food with
+unrounded values in export.PLAN_SCHEMA, in roster and meal order; a .zip OUTPUT is a
+bundle that also holds every client's macro targets. weight and meals_per_day must be
+whole numbers; rows that break a rule are skipped and reported.
+"""
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from export import PLAN_SCHEMA, TARGETS_SCHEMA, BundleWriter, TableWriter, targets_batch
+from macro_targets import ACTIVITY_LEVELS, GOALS, MACRO_CACHE
+from planner import (CALORIES, CARBS, FAT, FOOD_CATALOG, PROTEIN, CATEGORY_ORDER, iter_portion_stacks,
+                     missing_categories)
+
+ROSTER_COLUMNS = ["name", "weight", "goal", "activity_level", "meals_per_day",
+                  "proteins", "carbs", "vegetables", "fats"]
+MAX_ERROR_SAMPLE = 20  # Skipped-row messages kept for the report; the rest are only counted
+
+
+@lru_cache(maxsize=4096)
+def parse_picks(value, meals_per_day):
+    """Split a roster food cell into one tuple of food ids per meal (cells repeat, so this is cached)"""
+    groups = tuple(tuple(food.strip() for food in group.split(";") if food.strip())
+                   for group in (value or "").split("|"))
+    if len(groups) == 1:
+        groups *= meals_per_day
+    elif len(groups) != meals_per_day:
+        raise ValueError(f"expected 1 or {meals_per_day} meal groups, got {len(groups)}")
+    unknown = [food for group in groups for food in group if food not in FOOD_CATALOG]
+    if unknown:
+        raise ValueError(f"unknown foods: {', '.join(unknown)}")
+    return tuple(tuple(FOOD_CATALOG.id_of(food) for food in group) for group in groups)
+
+
+def whole_number(client, column):
+    """A roster cell as an int: a numeric cell or text with no fractional part, else ValueError"""
+    value = client[column]
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{column} must be a whole number, got {value!r}")
+    if not number.is_integer():
+        raise ValueError(f"{column} must be a whole number, got {value!r}")
+    return int(number)
+
+
+def client_meals(client):
+    """Validated weight and per-meal food selections for one roster row"""
+    weight = whole_number(client, "weight")
+    if weight < 1:
+        raise ValueError("weight must be a positive whole number")
+    if client["goal"] not in GOALS:
+        raise ValueError(f"goal must be one of {', '.join(GOALS)}")
+    if client["activity_level"] not in ACTIVITY_LEVELS:
+        raise ValueError(f"activity_level must be one of {', '.join(ACTIVITY_LEVELS)}")
+    meals_per_day = whole_number(client, "meals_per_day")
+    if not 1 <= meals_per_day <= 6:
+        raise ValueError("meals_per_day must be between 1 and 6")
+
+    picks = [parse_picks(client[category], meals_per_day) for category in CATEGORY_ORDER]
+    meals = [dict(zip(CATEGORY_ORDER, meal_picks)) for meal_picks in zip(*picks)]
+    for meal_idx, foods in enumerate(meals):
+        missing = missing_categories(foods)
+        if missing:
+            raise ValueError(f"meal {meal_idx + 1}: select at least one food for: {', '.join(missing)}")
+    return weight, meals
+
+
+def plan_chunk(clients):
+    """Plan every meal of a chunk of roster rows; returns (columns, daily targets, errors)"""
+    accepted, weights, client_meal_lists, errors = [], [], [], []
+    for client in clients:
+        try:
+            weight, meal_list = client_meals(client)
+        except (TypeError, ValueError, KeyError) as e:
+            errors.append(f"{client.get('name')}: {e}")
+            continue
+        accepted.append(client)
+        weights.append(weight)
+        client_meal_lists.append(meal_list)
+
+    # Daily targets for the whole chunk in one gather from the macro table,
+    # split per meal the same way as the meal planner
+    values = MACRO_CACHE.get_many(weights,
+                                  [client["goal"] for client in accepted],
+                                  [client["activity_level"] for client in accepted])
+    meals_per_day = np.array([len(client_meal_list) for client_meal_list in client_meal_lists], dtype=np.float64)
+    client_targets = np.round(values[:, [5, 8, 11]] / meals_per_day[:, None])
+    daily_targets = [(client["name"], client_values) for client, client_values in zip(accepted, values)]
+
+    meals, targets, owners = [], [], []
+    for client, client_meal_list, meal_targets in zip(accepted, client_meal_lists, client_targets):
+        for meal_idx, foods in enumerate(client_meal_list):
+            meals.append(foods)
+            targets.append(meal_targets)
+            owners.append((client["name"], meal_idx + 1))
+
+    columns = {name: [] for name in PLAN_SCHEMA.names}
+    if meals:
+        protein, carbs, fat = np.array(targets, dtype=np.float64).T
+        row_meals = []
+        for meal_indices, _, food_rows, portions, nutrients in iter_portion_stacks(meals, protein, carbs, fat):
+            row_meals.append(np.repeat(meal_indices, food_rows.shape[1]))
+            columns["food"].append(food_rows.ravel())
+            columns["amount_g"].append(portions.ravel())
+            for name, nutrient in (("calories", CALORIES), ("protein_g", PROTEIN), ("carbs_g", CARBS),
+                                   ("fat_g", FAT)):
+                columns[name].append(nutrients[:, :, nutrient].ravel())
+
+        # Stacks come out grouped by selection shape; put the rows back in (client, meal) order
+        row_meals = np.concatenate(row_meals)
+        order = np.argsort(row_meals, kind="stable")
+        for name in ("food", "amount_g", "calories", "protein_g", "carbs_g", "fat_g"):
+            columns[name] = np.concatenate(columns[name])[order]
+        row_owners = [owners[meal_idx] for meal_idx in row_meals[order].tolist()]
+        columns["client"] = [client for client, _ in row_owners]
+        columns["meal"] = [meal for _, meal in row_owners]
+    return columns, daily_targets, errors
+
+
+def to_record_batch(columns):
+    """Arrow record batch in PLAN_SCHEMA from plan_chunk columns"""
+    # The dictionary holds only the foods used in this batch, not the whole catalog
+    food_ids, food_codes = np.unique(np.asarray(columns["food"]), return_inverse=True)
+    food_names = pa.array([FOOD_CATALOG.name_of(int(food)) for food in food_ids], pa.string())
+    arrays = [
+        pa.array(columns["client"], pa.string()),
+        # Roster plans cover a single day
+        pa.array(np.ones(len(columns["meal"]), dtype=np.int16)),
+        pa.array(columns["meal"], pa.int16()),
+        pa.DictionaryArray.from_arrays(food_codes.astype(np.int32), food_names),
+    ] + [pa.array(np.asarray(columns[name], dtype=np.float64)) for name in PLAN_SCHEMA.names[4:]]
+    return pa.RecordBatch.from_arrays(arrays, schema=PLAN_SCHEMA)
+
+
+def read_roster(path, chunk_size):
+    """Stream roster rows from CSV or Parquet as lists of dicts of chunk_size rows"""
+    if path.endswith(".parquet"):
+        batches = pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=ROSTER_COLUMNS)
+    else:
+        batches = pa_csv.open_csv(
+            path,
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=ROSTER_COLUMNS,
+                # Numbers are read as text too, so a bad cell skips its row instead of failing the file
+                column_types={name: pa.string() for name in ROSTER_COLUMNS}
+            )
+        )
+
+    pending = []
+    for record_batch in batches:
+        pending += record_batch.to_pylist()
+        while len(pending) >= chunk_size:
+            yield pending[:chunk_size]
+            pending = pending[chunk_size:]
+    if pending:
+        yield pending
+
+
+def run_batch(roster_path, output_path, workers=None, chunk_size=5000):
+    """Plan meals for every roster row, streaming the results to output_path
+
+    Returns stats with the number of skipped rows and the first MAX_ERROR_SAMPLE reasons.
+    """
+    workers = workers or os.cpu_count() or 1
+    stats = {"clients": 0, "rows": 0, "skipped": 0, "errors": []}
+    bundle = output_path.endswith(".zip")
+    if bundle:
+        writer = BundleWriter(output_path, {"plan": PLAN_SCHEMA, "targets": TARGETS_SCHEMA},
+                              {"roster": os.path.basename(roster_path)})
+    else:
+        writer = TableWriter(output_path, PLAN_SCHEMA)
+
+    def collect(result):
+        columns, daily_targets, errors = result
+        stats["skipped"] += len(errors)
+        stats["errors"] += errors[:MAX_ERROR_SAMPLE - len(stats["errors"])]
+        if len(columns["client"]):
+            record_batch = to_record_batch(columns)
+            if bundle:
+                writer.write("plan", record_batch)
+            else:
+                writer.write(record_batch)
+            stats["rows"] += record_batch.num_rows
+        if bundle and daily_targets:
+            writer.write("targets", targets_batch(daily_targets))
+
+    try:
+        if workers == 1:
+            for chunk in read_roster(roster_path, chunk_size):
+                stats["clients"] += len(chunk)
+                collect(plan_chunk(chunk))
+        else:
+            # Keep a bounded number of chunks in flight so memory stays flat for any roster size
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                in_flight = deque()
+                for chunk in read_roster(roster_path, chunk_size):
+                    stats["clients"] += len(chunk)
+                    in_flight.append(pool.submit(plan_chunk, chunk))
+                    if len(in_flight) >= 2 * workers:
+                        collect(in_flight.popleft().result())
+                while in_flight:
+                    collect(in_flight.popleft().result())
+    finally:
+        writer.close()
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="planner batch", description="Plan meals for a client roster")
+    parser.add_argument("roster", help="roster file (.csv or .parquet)")
+    parser.add_argument("output", help="result file (.csv, .parquet or .arrow), or a .zip bundle with targets")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="roster rows per work chunk")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    stats = run_batch(args.roster, args.output, workers=args.workers, chunk_size=args.chunk_size)
+    elapsed = time.perf_counter() - start
+
+    for error in stats["errors"]:
+        print(f"skipped {error}", file=sys.stderr)
+    if stats["skipped"] > len(stats["errors"]):
+        print(f"... and {stats['skipped'] - len(stats['errors'])} more skipped rows", file=sys.stderr)
+    print(f"Planned {stats['clients'] - stats['skipped']} of {stats['clients']} clients "
+          f"({stats['rows']} food rows) in {elapsed:.1f}s -> {args.output}")
+    return 1 if stats["skipped"] else 0
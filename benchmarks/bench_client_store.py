@@ -0,0 +1,100 @@
+"""Benchmark the client store: bulk saves, returning-client loads and paged client lists
+
+Usage: python benchmarks/bench_client_store.py [--clients 10000] [--meals 3] [--lookups 1000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from client_store import ClientStore  # noqa: E402
+from macro_targets import ACTIVITY_LEVELS, GOALS, MACRO_CACHE, compute_macro_values, macro_dict  # noqa: E402
+from planner import CATEGORY_ORDER, FOOD_CATALOG, plan_day  # noqa: E402
+
+
+def percentiles(timings):
+    timings = np.array(timings) * 1000
+    return f"p50 {np.percentile(timings, 50):.3f} ms, p99 {np.percentile(timings, 99):.3f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=10000)
+    parser.add_argument("--meals", type=int, default=3)
+    parser.add_argument("--lookups", type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    clients = [{"name": f"client {index:06d}", "weight": rng.randint(100, 300), "goal": rng.choice(GOALS),
+                "activity_level": rng.choice(ACTIVITY_LEVELS)} for index in range(args.clients)]
+    for client in clients:
+        client["macro_data"] = macro_dict(MACRO_CACHE.get(client["weight"], client["goal"], client["activity_level"]))
+    selections = [{category: [rng.choice(FOOD_CATALOG.names_in(category))] for category in CATEGORY_ORDER}
+                  for _ in range(args.meals)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = ClientStore(os.path.join(directory, "clients.db"))
+        start = time.perf_counter()
+        store.save_clients(clients)
+        seconds = time.perf_counter() - start
+        print(f"save {args.clients} clients in one transaction: {seconds * 1000:.0f} ms "
+              f"({args.clients / seconds:.0f} clients/s)")
+
+        start = time.perf_counter()
+        for client in clients:
+            day_plan = plan_day(selections, client["macro_data"])
+            store.save_plan(client["name"], "Current plan", args.meals, "greedy", [
+                (1, meal + 1, foods, dict(result, depends_on=[f"meal_{meal}"]))
+                for meal, (foods, result) in enumerate(zip(selections, day_plan["meals"]))
+            ])
+        print(f"plan and save {args.clients} plans: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+        # A returning client: profile, targets and latest plan from the store, or recomputed from scratch
+        names = [rng.choice(clients)["name"] for _ in range(args.lookups)]
+        loads = []
+        for name in names:
+            start = time.perf_counter()
+            store.get_client(name)
+            store.load_plan(name)
+            loads.append(time.perf_counter() - start)
+        recomputes = []
+        for name in names[:args.lookups // 10]:
+            client = store.get_client(name)
+            start = time.perf_counter()
+            plan_day(selections, macro_dict(compute_macro_values(client["weight"], client["goal"],
+                                                                 client["activity_level"])))
+            recomputes.append(time.perf_counter() - start)
+        print(f"load returning client and plan: {percentiles(loads)}")
+        print(f"recompute targets and plan: {percentiles(recomputes)}")
+
+        pages = []
+        for goal in GOALS:
+            after = None
+            while True:
+                start = time.perf_counter()
+                page = store.list_clients(goal=goal, after=after, limit=50)
+                pages.append(time.perf_counter() - start)
+                if not page:
+                    break
+                after = page[-1]["name"]
+        print(f"page through {store.count_clients()} clients by goal, 50 per page: {len(pages)} pages, "
+              f"{percentiles(pages)}, total {sum(pages) * 1000:.0f} ms")
+
+        searches = []
+        for _ in range(args.lookups):
+            prefix = f"client {rng.randrange(1000):03d}"
+            start = time.perf_counter()
+            store.list_clients(prefix=prefix, limit=50)
+            searches.append(time.perf_counter() - start)
+        print(f"name prefix search: {percentiles(searches)}")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
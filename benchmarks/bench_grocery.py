@@ -0,0 +1,91 @@
+"""Benchmark grocery aggregation: streaming group-by throughput, peak memory and parallel merging
+
+Usage: python benchmarks/bench_grocery.py [--items 20000000] [--row-group 1000000] [--workers 2]
+
+Writes a synthetic plan file of --items meal items (food and amount_g columns), then
+aggregates it in one process and with --workers processes. Both must match the exact
+per-food sums computed while writing it, and peak memory must not grow with --items.
+"""
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from grocery import GroceryTotals, aggregate  # noqa: E402
+from planner import FOOD_DATA  # noqa: E402
+
+
+def write_plan(path, items, row_group, rng):
+    """Synthetic plan file; returns the exact grams per food"""
+    names = list(FOOD_DATA)
+    schema = pa.schema([("food", pa.dictionary(pa.int32(), pa.string())), ("amount_g", pa.float64())])
+    exact = np.zeros(len(names))
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for start in range(0, items, row_group):
+            size = min(row_group, items - start)
+            codes = rng.integers(0, len(names), size).astype(np.int32)
+            amounts = np.rint(rng.uniform(10, 300, size))
+            exact += np.bincount(codes, weights=amounts, minlength=len(names))
+            writer.write_batch(pa.RecordBatch.from_arrays(
+                [pa.DictionaryArray.from_arrays(codes, pa.array(names)), pa.array(amounts)], schema=schema))
+    return dict(zip(names, exact.tolist()))
+
+
+def check(totals, exact):
+    if set(totals.grams) != {name for name, grams in exact.items() if grams} or any(
+            abs(totals.grams[name] - exact[name]) > 1e-6 * exact[name] for name in totals.grams):
+        sys.exit("aggregated grams differ from the exact sums")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=20000000)
+    parser.add_argument("--row-group", type=int, default=1000000)
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "plan.parquet")
+        start = time.perf_counter()
+        exact = write_plan(path, args.items, args.row_group, rng)
+        print(f"wrote {args.items} meal items in {time.perf_counter() - start:.1f}s "
+              f"({os.path.getsize(path) / 1e6:.0f} MB)")
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        for workers in (1, args.workers):
+            start = time.perf_counter()
+            totals, _ = aggregate([path], workers=workers)
+            seconds = time.perf_counter() - start
+            check(totals, exact)
+            print(f"{workers} worker(s): {seconds:.2f}s, {args.items / seconds / 1e6:.1f}M items/s, "
+                  f"{len(totals)} foods")
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print(f"peak RSS {rss_after / 1024:.0f} MB, {(rss_after - rss_before) / 1024:.0f} MB above the peak "
+              f"while writing one {args.row_group}-item row group")
+
+    # Merging partial totals costs only the number of distinct foods
+    partials = [GroceryTotals().merge(totals) for _ in range(1000)]
+    start = time.perf_counter()
+    merged = GroceryTotals()
+    for partial in partials:
+        merged.merge(partial)
+    print(f"merge 1000 partial totals: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    # The shopping list itself, expanded and rolled up to packages
+    start = time.perf_counter()
+    rows = totals.shopping_list()
+    print(f"shopping list of {len(rows)} foods: {(time.perf_counter() - start) * 1000:.2f} ms, estimated cost "
+          f"{sum(row['cost'] for row in rows if row['cost'] is not None):.2f}")
+
+
+if __name__ == "__main__":
+    main()
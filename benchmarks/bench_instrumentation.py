@@ -0,0 +1,62 @@
+"""Benchmark the cost of timing spans and of the sampling profiler on the planning hot path
+
+Usage: python benchmarks/bench_instrumentation.py [--calls 20000] [--days 2000]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from instrumentation import METRICS, SamplingProfiler, span  # noqa: E402
+from planner import CATEGORY_ORDER, FOOD_CATALOG, calculate_macros, plan_day  # noqa: E402
+
+
+def per_call_us(function, calls, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(calls):
+            function()
+        timings.append((time.perf_counter() - start) / calls * 1e6)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--days", type=int, default=2000)
+    args = parser.parse_args()
+
+    def empty():
+        pass
+
+    def empty_span():
+        with span("bench", counts):
+            pass
+
+    counts = {}
+    bare = per_call_us(empty, args.calls)
+    spanned = per_call_us(empty_span, args.calls)
+    print(f"span overhead: {spanned - bare:.2f} us per call")
+
+    macro_data = calculate_macros(180, "maintenance", "moderate")
+    meals = [{category: [FOOD_CATALOG.names_in(category)[meal]] for category in CATEGORY_ORDER} for meal in range(3)]
+
+    def day():
+        plan_day(meals, macro_data)
+
+    baseline = per_call_us(day, args.days)
+    profiler = SamplingProfiler().start()
+    profiled = per_call_us(day, args.days)
+    profiler.stop()
+    print(f"plan_day: {baseline:.1f} us, with the profiler sampling {profiled:.1f} us "
+          f"({(profiled / baseline - 1) * 100:+.1f}%), {sum(profiler.samples.values())} samples")
+    print(f"plan_day p50 {METRICS.snapshot()['plan_day']['p50_ms'] * 1000:.1f} us over the last "
+          f"{len(METRICS.stages['plan_day'].durations)} calls")
+
+
+if __name__ == "__main__":
+    main()
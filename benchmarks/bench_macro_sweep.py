@@ -0,0 +1,79 @@
+"""Benchmark vectorized macro target sweeps against one MakeMeal object per input
+
+Usage: python benchmarks/bench_macro_sweep.py [--repeat 20]
+
+Sweeps every 5% split for one client and the whole weight/goal/activity table. Both
+must equal MakeMeal's values wherever MakeMeal accepts the split (it rejects splits
+whose float sum is not exactly 1).
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+from fitness_tools.meals.meal_maker import MakeMeal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from macro_targets import (ACTIVITY_LEVELS, DEFAULT_SPLIT, GOALS, MAX_WEIGHT, MIN_WEIGHT,  # noqa: E402
+                           compute_macro_values, split_grid, sweep_macro_values)
+
+
+def makemeal_values(weight, goal, activity_level, protein_percent, carbs_percent, fat_percent):
+    """Flat macro values from one MakeMeal object, or None when MakeMeal rejects the split"""
+    try:
+        meal_obj = MakeMeal(weight=weight, goal=goal, activity_level=activity_level, fat_percent=fat_percent,
+                            protein_percent=protein_percent, carb_percent=carbs_percent)
+    except ValueError:
+        return None
+    ranges = [(meal_obj.daily_min_calories(), meal_obj.daily_max_calories()),
+              (meal_obj.daily_min_protein(), meal_obj.daily_max_protein()),
+              (meal_obj.daily_min_carbs(), meal_obj.daily_max_carbs()),
+              (meal_obj.daily_min_fat(), meal_obj.daily_max_fat())]
+    return [value for low, high in ranges for value in (low, high, (low + high) / 2)]
+
+
+def best_of(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return result, statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    # Every split for one client
+    protein, carbs, fat = split_grid()
+    splits = [(float(p), float(c), float(f)) for p, c, f in zip(protein, carbs, fat)]
+    looped, loop_seconds = best_of(
+        lambda: [makemeal_values(180, "maintenance", "moderate", *split) for split in splits], args.repeat)
+    swept, sweep_seconds = best_of(
+        lambda: sweep_macro_values(180, "maintenance", "moderate", protein, carbs, fat), args.repeat)
+    checked = [index for index, values in enumerate(looped) if values is not None]
+    assert all(swept[index].tolist() == looped[index] for index in checked), "sweep differs from MakeMeal"
+    print(f"{len(splits)} splits ({len(checked)} accepted by MakeMeal): MakeMeal loop {loop_seconds * 1000:.2f} ms, "
+          f"sweep {sweep_seconds * 1000:.3f} ms ({loop_seconds / sweep_seconds:.0f}x)")
+
+    # The whole standard-split table
+    weights = np.arange(MIN_WEIGHT, MAX_WEIGHT + 1)
+    looped, loop_seconds = best_of(
+        lambda: [compute_macro_values(int(weight), goal, activity_level)
+                 for weight in weights for goal in GOALS for activity_level in ACTIVITY_LEVELS], 3)
+    swept, sweep_seconds = best_of(
+        lambda: sweep_macro_values(weights[:, None, None], np.array(GOALS, dtype=object)[None, :, None],
+                                   np.array(ACTIVITY_LEVELS, dtype=object)[None, None, :], *DEFAULT_SPLIT),
+        args.repeat)
+    assert swept.reshape(-1, 12).tolist() == [list(values) for values in looped], "table differs from MakeMeal"
+    print(f"{len(looped)} standard targets: MakeMeal loop {loop_seconds * 1000:.1f} ms, "
+          f"sweep {sweep_seconds * 1000:.2f} ms ({loop_seconds / sweep_seconds:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Benchmark sparse micronutrient storage and totals against a dense matrix, and check 4-macro planning cost
+
+Usage: python benchmarks/bench_micronutrients.py [--foods 100000] [--nutrients 34] [--known 0.1] [--meals 2000]
+
+A synthetic catalog tracks --nutrients micronutrients, each known (non-zero) for a
+--known share of foods. Meal and day totals are one sparse matrix-vector product; the
+greedy engine is timed with and without micronutrients in the catalog.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import planner  # noqa: E402
+from food_db import SparseNutrients  # noqa: E402
+from planner import CATEGORY_ORDER, FOOD_CATALOG, calculate_portions_many, micronutrient_totals  # noqa: E402
+
+
+def median_ms(function, repeat=7):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return np.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--foods", type=int, default=100000)
+    parser.add_argument("--nutrients", type=int, default=34)
+    parser.add_argument("--known", type=float, default=0.1)
+    parser.add_argument("--meals", type=int, default=2000)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    dense = rng.random((args.foods, args.nutrients)) * 100
+    dense[rng.random(dense.shape) >= args.known] = np.nan
+    start = time.perf_counter()
+    sparse = SparseNutrients.from_dense([f"n{index}" for index in range(args.nutrients)], dense)
+    build_ms = (time.perf_counter() - start) * 1000
+    sparse_bytes = sparse.indptr.nbytes + sparse.indices.nbytes + sparse.data.nbytes
+    print(f"{args.foods} foods x {args.nutrients} nutrients, {len(sparse.data)} known: sparse {sparse_bytes / 1e6:.1f} MB "
+          f"vs dense {dense.nbytes / 1e6:.1f} MB, built in {build_ms:.0f} ms")
+
+    dense = np.nan_to_num(dense)
+    for items in (6, 18, 1000):
+        ids = rng.integers(0, args.foods, items)
+        grams = rng.integers(10, 300, items).astype(np.float64)
+        if not np.allclose(sparse.totals(ids, grams), grams / 100 @ dense[ids]):
+            sys.exit("sparse totals differ from the dense product")
+        sparse_ms = median_ms(lambda: [sparse.totals(ids, grams) for _ in range(100)]) / 100
+        dense_ms = median_ms(lambda: [grams / 100 @ dense[ids] for _ in range(100)]) / 100
+        print(f"totals of {items} items: sparse {sparse_ms * 1000:.1f} us, dense {dense_ms * 1000:.1f} us")
+
+    # The planner's catalog: the greedy engine only reads the dense macro matrix
+    meals = [{category: [FOOD_CATALOG.names_in(category)[meal % len(FOOD_CATALOG.names_in(category))]]
+              for category in CATEGORY_ORDER} for meal in range(args.meals)]
+    with_micros = median_ms(lambda: calculate_portions_many(meals, 40.0, 50.0, 15.0))
+    micros, FOOD_CATALOG.micros = FOOD_CATALOG.micros, SparseNutrients.empty(len(FOOD_CATALOG))
+    without_micros = median_ms(lambda: calculate_portions_many(meals, 40.0, 50.0, 15.0))
+    FOOD_CATALOG.micros = micros
+    print(f"calculate_portions_many, {args.meals} meals: {with_micros:.1f} ms with {len(micros.names)} micronutrients "
+          f"tracked, {without_micros:.1f} ms without")
+
+    meal_items = planner.calculate_portions(meals[0], 40.0, 50.0, 15.0)
+    print(f"micronutrient_totals of one meal: {median_ms(lambda: micronutrient_totals(meal_items)) * 1000:.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Benchmark multi-day plan generation and single-meal swaps
+
+Usage: python benchmarks/bench_multi_day.py [--days 28] [--meals 6] [--repeat 5] [--swaps 200]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from planner import CATEGORY_ORDER, calculate_macros  # noqa: E402
+from multi_day import generate_plan  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=28)
+    parser.add_argument("--meals", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--swaps", type=int, default=200)
+    args = parser.parse_args()
+
+    macro_data = calculate_macros(180, "maintenance", "moderate")
+    for carry_over in (True, False):
+        timings = [generate_plan(macro_data, args.days, args.meals, carry_over=carry_over, seed=seed)[1]
+                   for seed in range(args.repeat)]
+        print(f"generate {args.days} days x {args.meals} meals (carry over {carry_over}): "
+              f"median {statistics.median(timings) * 1000:.1f} ms, max {max(timings) * 1000:.1f} ms")
+
+    # Swaps skip the variety check so every one re-plans its day
+    plan, _ = generate_plan(macro_data, args.days, args.meals)
+    rng = random.Random(0)
+    latencies = []
+    for _ in range(args.swaps):
+        foods = {category: [rng.choice(plan.pools[category])] for category in CATEGORY_ORDER}
+        start = time.perf_counter()
+        replanned = plan.swap_meal(rng.randrange(args.days), rng.randrange(args.meals), foods, enforce_rules=False)
+        latencies.append(time.perf_counter() - start)
+        assert len(replanned) == 1
+    latencies = np.array(latencies) * 1000
+    print(f"swap one meal: p50 {np.percentile(latencies, 50):.2f} ms, p99 {np.percentile(latencies, 99):.2f} ms "
+          f"(re-plans 1 of {args.days} days)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""Benchmark the vectorized portion engine against the original per-food loops
+
+Usage: python benchmarks/bench_portions.py [--sizes 1 100 100000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from planner import (FOOD_DATA, FOOD_CATALOG, CATEGORY_ORDER, calculate_portions,  # noqa: E402
+                     calculate_portions_many, compute_portion_arrays)
+
+CATEGORIES = {category: FOOD_CATALOG.names_in(category) for category in CATEGORY_ORDER}
+
+
+def legacy_calculate_portions(foods, protein_target, carbs_target, fat_target):
+    """Original loop implementation, kept as the baseline"""
+    meal_items = []
+
+    # Track remaining macros to allocate
+    remaining_protein = protein_target
+    remaining_carbs = carbs_target
+    remaining_fat = fat_target
+
+    # 1. First handle vegetables (usually fixed portions)
+    for veg in foods['vegetables']:
+        portion = 100  # Standard vegetable portion
+
+        protein = FOOD_DATA[veg]["protein"] * portion / 100
+        carbs = FOOD_DATA[veg]["carbs"] * portion / 100
+        fat = FOOD_DATA[veg]["fat"] * portion / 100
+        calories = FOOD_DATA[veg]["calories"] * portion / 100
+
+        remaining_protein -= protein
+        remaining_carbs -= carbs
+        remaining_fat -= fat
+
+        meal_items.append({
+            "Food": veg,
+            "Amount (g)": portion,
+            "Calories": calories,
+            "Protein (g)": protein,
+            "Carbs (g)": carbs,
+            "Fat (g)": fat
+        })
+
+    # 2. Allocate fats
+    for fat_food in foods['fats']:
+        fat_per_100g = FOOD_DATA[fat_food]["fat"]
+
+        if fat_per_100g > 0:
+            portion = min((remaining_fat * 100) / fat_per_100g, 30)  # Cap at 30g for fats
+        else:
+            portion = 15  # Default small portion
+
+        protein = FOOD_DATA[fat_food]["protein"] * portion / 100
+        carbs = FOOD_DATA[fat_food]["carbs"] * portion / 100
+        fat = FOOD_DATA[fat_food]["fat"] * portion / 100
+        calories = FOOD_DATA[fat_food]["calories"] * portion / 100
+
+        remaining_protein -= protein
+        remaining_carbs -= carbs
+        remaining_fat -= fat
+
+        meal_items.append({
+            "Food": fat_food,
+            "Amount (g)": round(portion),
+            "Calories": round(calories),
+            "Protein (g)": round(protein, 1),
+            "Carbs (g)": round(carbs, 1),
+            "Fat (g)": round(fat, 1)
+        })
+
+    # 3. Allocate carbs
+    for carb_food in foods['carbs']:
+        carbs_per_100g = FOOD_DATA[carb_food]["carbs"]
+
+        if carbs_per_100g > 0:
+            # Set reasonable portion range based on food type
+            max_portion = 150 if carb_food in ["White Rice (cooked)", "Brown Rice (cooked)", "Pasta (cooked)"] else 100
+            min_portion = 50
+
+            # Calculate portion based on carb target
+            raw_portion = (remaining_carbs * 100) / carbs_per_100g
+            portion = max(min(raw_portion, max_portion), min_portion)
+        else:
+            portion = 50  # Default portion
+
+        protein = FOOD_DATA[carb_food]["protein"] * portion / 100
+        carbs = FOOD_DATA[carb_food]["carbs"] * portion / 100
+        fat = FOOD_DATA[carb_food]["fat"] * portion / 100
+        calories = FOOD_DATA[carb_food]["calories"] * portion / 100
+
+        remaining_protein -= protein
+        remaining_carbs -= carbs
+        remaining_fat -= fat
+
+        meal_items.append({
+            "Food": carb_food,
+            "Amount (g)": round(portion),
+            "Calories": round(calories),
+            "Protein (g)": round(protein, 1),
+            "Carbs (g)": round(carbs, 1),
+            "Fat (g)": round(fat, 1)
+        })
+
+    # 4. Allocate proteins
+    if foods['proteins']:
+        protein_per_food = remaining_protein / len(foods['proteins'])
+
+        for protein_food in foods['proteins']:
+            protein_per_100g = FOOD_DATA[protein_food]["protein"]
+
+            if protein_per_100g > 0:
+                # Calculate portion but set reasonable limits
+                raw_portion = (protein_per_food * 100) / protein_per_100g
+
+                # Special handling for different protein types
+                max_portion = 200 if protein_food in ["Chicken Breast (skinless)", "Turkey Breast"] else 150
+                min_portion = 30
+
+                portion = max(min(raw_portion, max_portion), min_portion)
+            else:
+                portion = 100  # Default portion
+
+            protein = FOOD_DATA[protein_food]["protein"] * portion / 100
+            carbs = FOOD_DATA[protein_food]["carbs"] * portion / 100
+            fat = FOOD_DATA[protein_food]["fat"] * portion / 100
+            calories = FOOD_DATA[protein_food]["calories"] * portion / 100
+
+            meal_items.append({
+                "Food": protein_food,
+                "Amount (g)": round(portion),
+                "Calories": round(calories),
+                "Protein (g)": round(protein, 1),
+                "Carbs (g)": round(carbs, 1),
+                "Fat (g)": round(fat, 1)
+            })
+
+    return meal_items
+
+
+def random_meals(num_meals, seed=0):
+    """Random selections in the planner's suggested ranges plus per-meal targets"""
+    rng = random.Random(seed)
+    meals = []
+    targets = []
+    for _ in range(num_meals):
+        meals.append({
+            "proteins": rng.sample(CATEGORIES["proteins"], rng.randint(1, 2)),
+            "carbs": rng.sample(CATEGORIES["carbs"], 1),
+            "vegetables": rng.sample(CATEGORIES["vegetables"], rng.randint(1, 2)),
+            "fats": rng.sample(CATEGORIES["fats"], rng.randint(0, 1))
+        })
+        targets.append((rng.randint(20, 80), rng.randint(20, 120), rng.randint(5, 40)))
+    return meals, targets
+
+
+def best_of(func, repeat):
+    """Best wall-clock time of several runs, in seconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 100, 100_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # The public API against the loops: calculate_portions once per meal (as the app calls it),
+    # calculate_portions_many on random selections (mixed shapes) and on one shape (as plan_day and
+    # the service's batches mostly see). "engine" is compute_portion_arrays alone, without dicts.
+    print(f"{'meals':>8} {'loops (ms)':>11} {'single (ms)':>12} {'many (ms)':>10} {'vs loops':>9} "
+          f"{'1 shape loops':>14} {'1 shape many':>13} {'vs loops':>9} {'engine (ms)':>12}")
+    for size in args.sizes:
+        meals, targets = random_meals(size)
+        protein, carbs, fat = (list(column) for column in zip(*targets))
+
+        expected = [legacy_calculate_portions(meal, *target) for meal, target in zip(meals, targets)]
+        if calculate_portions_many(meals, protein, carbs, fat) != expected:
+            sys.exit(f"Engine output differs from the original implementation at {size} meals")
+        if size <= 1000 and [calculate_portions(meal, *target) for meal, target in zip(meals, targets)] != expected:
+            sys.exit(f"calculate_portions differs from the original implementation at {size} meals")
+
+        # One shape: 1 protein, 1 carb, 1 vegetable and 1 fat
+        uniform = [dict(meal, proteins=meal["proteins"][:1], vegetables=meal["vegetables"][:1],
+                        fats=CATEGORIES["fats"][:1]) for meal in meals]
+        if calculate_portions_many(uniform, protein, carbs, fat) != [
+                legacy_calculate_portions(meal, *target) for meal, target in zip(uniform, targets)]:
+            sys.exit(f"Engine output differs from the original implementation at {size} uniform meals")
+        rows = {category: np.array([[FOOD_CATALOG.id_of(food) for food in meal[category]] for meal in uniform],
+                                   dtype=np.intp) for category in CATEGORY_ORDER}
+        target_arrays = [np.asarray(column, dtype=np.float64) for column in (protein, carbs, fat)]
+
+        loops = best_of(lambda: [legacy_calculate_portions(meal, *target)
+                                 for meal, target in zip(meals, targets)], args.repeat)
+        single = best_of(lambda: [calculate_portions(meal, *target) for meal, target in zip(meals, targets)],
+                         args.repeat)
+        many = best_of(lambda: calculate_portions_many(meals, protein, carbs, fat), args.repeat)
+        loops_uniform = best_of(lambda: [legacy_calculate_portions(meal, *target)
+                                         for meal, target in zip(uniform, targets)], args.repeat)
+        many_uniform = best_of(lambda: calculate_portions_many(uniform, protein, carbs, fat), args.repeat)
+        engine = best_of(lambda: compute_portion_arrays(rows, *target_arrays), args.repeat)
+
+        print(f"{size:>8} {loops * 1e3:>11.3f} {single * 1e3:>12.3f} {many * 1e3:>10.3f} {loops / many:>8.1f}x "
+              f"{loops_uniform * 1e3:>14.3f} {many_uniform * 1e3:>13.3f} {loops_uniform / many_uniform:>8.1f}x "
+              f"{engine * 1e3:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
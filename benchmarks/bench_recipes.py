@@ -0,0 +1,113 @@
+"""Benchmark recipes: portioning recipes vs. base foods, resolving nested recipes and incremental updates
+
+Usage: python benchmarks/bench_recipes.py [--recipes 5000] [--meals 2000] [--search-foods 500000]
+
+Recipes are built in layers: the first uses base foods only, each later one also uses
+recipes of the layer before it. A base-food change then recomputes only the recipes
+that depend on it, compared with resolving the whole book again. Last, a recipe is added
+to a --search-foods catalog and the food search index is brought up to date.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_search import synthetic_names  # noqa: E402
+from food_db import CATEGORIES, FoodCatalog  # noqa: E402
+from food_search import FoodSearchIndex, search_index  # noqa: E402
+from planner import CATEGORY_ORDER, FOOD_CATALOG, FOOD_DATA, RECIPE_BOOK, calculate_portions_many  # noqa: E402
+from recipes import RecipeBook  # noqa: E402
+
+LAYERS = 4
+
+
+def layered_recipes(count, rng):
+    """count recipe definitions in LAYERS layers, each using 2-4 foods or recipes of the layer below"""
+    recipes, previous = {}, list(FOOD_DATA)
+    per_layer = count // LAYERS
+    for layer in range(LAYERS):
+        current = []
+        for index in range(per_layer):
+            name = f"Recipe {layer}.{index}"
+            ingredients = rng.sample(previous if layer else list(FOOD_DATA), rng.randint(2, 4))
+            recipes[name] = {"category": rng.choice(CATEGORIES),
+                             "ingredients": {food: rng.randint(10, 200) for food in ingredients}}
+            current.append(name)
+        previous = current + list(FOOD_DATA)
+    return recipes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--recipes", type=int, default=5000)
+    parser.add_argument("--meals", type=int, default=2000)
+    parser.add_argument("--search-foods", type=int, default=500_000)
+    args = parser.parse_args()
+    rng = random.Random(0)
+    recipes = layered_recipes(args.recipes, rng)
+
+    start = time.perf_counter()
+    book = RecipeBook(FoodCatalog.from_food_data(FOOD_DATA))
+    book.update(recipes)
+    resolve_seconds = time.perf_counter() - start
+    print(f"resolve {len(recipes)} recipes in {LAYERS} layers: {resolve_seconds * 1000:.1f} ms")
+
+    start = time.perf_counter()
+    recomputed = book.update_food("Oats", FOOD_CATALOG.nutrients[FOOD_CATALOG.id_of("Oats")] * 1.01)
+    update_seconds = time.perf_counter() - start
+    print(f"change one base food: {len(recomputed)} dependent recipes recomputed in {update_seconds * 1000:.1f} ms "
+          f"({resolve_seconds / update_seconds:.0f}x faster than resolving the book again)")
+
+    name = next(iter(recipes))
+    start = time.perf_counter()
+    recomputed = book.update({name: dict(recipes[name], yield_g=50)})
+    print(f"redefine one recipe: {len(recomputed)} recipes recomputed in {(time.perf_counter() - start) * 1000:.2f} ms")
+
+    # The planner's catalog, with recipes in every category, portioned like base foods
+    RECIPE_BOOK.update({f"Bench {category} {index}": {"category": category, "ingredients": {
+        food: rng.randint(10, 200) for food in rng.sample(list(FOOD_DATA), 3)}} for category in CATEGORIES
+        for index in range(3)})
+
+    def meals(pick):
+        return [{category: [pick(category)] for category in CATEGORY_ORDER} for _ in range(args.meals)]
+
+    base_meals = meals(lambda category: rng.choice([food for food in FOOD_CATALOG.names_in(category)
+                                                    if food not in RECIPE_BOOK]))
+    recipe_meals = meals(lambda category: rng.choice([food for food in FOOD_CATALOG.names_in(category)
+                                                      if food in RECIPE_BOOK]))
+    for label, selection in (("base foods", base_meals), ("recipes", recipe_meals)):
+        timings = []
+        for _ in range(5):
+            start = time.perf_counter()
+            calculate_portions_many(selection, 40.0, 50.0, 15.0)
+            timings.append(time.perf_counter() - start)
+        print(f"calculate_portions_many, {args.meals} meals of {label}: {np.median(timings) * 1000:.1f} ms")
+
+    # Adding a recipe to a large catalog indexes only the new name, not the whole catalog again
+    names = synthetic_names(args.search_foods)
+    catalog = FoodCatalog.from_records(names, [CATEGORIES[index % len(CATEGORIES)] for index in range(len(names))],
+                                       np.tile(FOOD_CATALOG.nutrients[:1], (len(names), 1)))
+    search_index(catalog)
+    book = RecipeBook(catalog)
+    timings = []
+    for index in range(5):
+        start = time.perf_counter()
+        book.update({f"Search Recipe {index}": {"category": "carbs", "ingredients": {names[0]: 100, names[1]: 50}}})
+        found = search_index(catalog).search(f"search recipe {index}")
+        timings.append(time.perf_counter() - start)
+        if found != [catalog.id_of(f"Search Recipe {index}")]:
+            sys.exit("the added recipe is not found by search")
+    start = time.perf_counter()
+    FoodSearchIndex.from_catalog(catalog)
+    rebuild_seconds = time.perf_counter() - start
+    print(f"add a recipe to {len(names)} foods and search it: {np.median(timings) * 1000:.1f} ms "
+          f"(rebuilding the search index: {rebuild_seconds:.2f} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Benchmark planner reruns: a full page rerun vs. the rerun of one meal's fragment
+
+Usage: python benchmarks/bench_reruns.py [--meals 6] [--changes 20]
+
+Drives the app headlessly with Streamlit's AppTest: calculates macros, picks foods for
+every meal, calculates the whole day, then keeps changing Meal 3's protein. The app
+records how long each page and meal fragment took to render (see record_rerun). A full
+page rerun is what every widget change cost before the meal tabs became fragments; in
+the browser a change inside Meal 3 now only reruns the Meal 3 fragment.
+"""
+import argparse
+import os
+import statistics
+import sys
+
+from streamlit.testing.v1 import AppTest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--meals", type=int, default=6)
+    parser.add_argument("--changes", type=int, default=20)
+    args = parser.parse_args()
+
+    app = AppTest.from_file(os.path.join(ROOT, "macrocounter.py"), default_timeout=60)
+    app.run()
+    app.sidebar.button[0].click().run()
+    app.sidebar.radio[0].set_value("Plan Meals").run()
+    app.radio[0].set_value(args.meals).run()
+    for index, multiselect in enumerate(app.multiselect):
+        if index % 4 != 3:
+            multiselect.set_value([multiselect.options[index % 3]])
+    app.run()
+    next(button for button in app.button if button.label == "Calculate All Meals").click().run()
+
+    # Meal 3's protein picker is the ninth multiselect (four per meal)
+    for change in range(args.changes):
+        multiselect = app.multiselect[8]
+        multiselect.set_value([multiselect.options[change % 5 + 1]])
+        app.run()
+
+    timings = app.session_state["rerun_timings"][-args.changes * (args.meals + 1):]
+    page = [elapsed for scope, elapsed in timings if scope == "Page"]
+    meal = [elapsed for scope, elapsed in timings if scope == "Meal 3"]
+    print(f"{'rerun':>22} {'p50 (ms)':>10} {'max (ms)':>10}")
+    print(f"{'full page':>22} {statistics.median(page):10.2f} {max(page):10.2f}")
+    print(f"{'Meal 3 fragment':>22} {statistics.median(meal):10.2f} {max(meal):10.2f}")
+    print(f"fragment vs page: {statistics.median(page) / statistics.median(meal):.1f}x less work per Meal 3 change")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Benchmark the food search index: build time, memory and per-keystroke latency
+
+Usage: python benchmarks/bench_search.py [--foods 500000] [--queries 2000] [--k 10]
+
+Names are synthetic three-word foods with a numeric suffix. Queries replay typing
+a real name one keystroke at a time, plus a share of transposition typos.
+"""
+import argparse
+import os
+import random
+import resource
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from food_search import FoodSearchIndex  # noqa: E402
+
+WORDS = ("chicken beef pork salmon tuna turkey rice pasta bread oat quinoa potato broccoli spinach kale "
+         "carrot pepper onion almond peanut walnut olive avocado butter cheese yogurt milk egg bean lentil "
+         "corn apple banana berry raw cooked grilled baked fried canned dried fresh frozen whole lean "
+         "low fat organic").split()
+
+
+def synthetic_names(count, seed=0):
+    rng = random.Random(seed)
+    return [" ".join(rng.sample(WORDS, 3)).title() + f" #{i}" for i in range(count)]
+
+
+def keystroke_queries(names, count, seed=1):
+    """Prefixes of random names as typed, with one in ten words misspelled"""
+    rng = random.Random(seed)
+    queries = []
+    while len(queries) < count:
+        words = rng.choice(names).lower().split()[:2]
+        if rng.random() < 0.1 and len(words[0]) > 4:
+            position = rng.randrange(1, len(words[0]) - 2)
+            word = words[0]
+            words[0] = word[:position] + word[position + 1] + word[position] + word[position + 2:]
+        text = " ".join(words)
+        queries += [text[:end] for end in range(1, len(text) + 1)]
+    return queries[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--foods", type=int, default=500_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    names = synthetic_names(args.foods)
+    queries = keystroke_queries(names, args.queries)
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    index = FoodSearchIndex(range(len(names)), names)
+    build = time.perf_counter() - start
+    peak = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) * 1024
+
+    index.search(queries[0], args.k)
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query, args.k)
+        latencies.append(time.perf_counter() - start)
+    latencies = np.array(latencies) * 1e6
+
+    print(f"foods: {len(index)}  vocabulary: {len(index.vocab)}")
+    print(f"build: {build:.2f} s  index memory: {index.nbytes / 1e6:.1f} MB  peak RSS growth while building: {peak / 1e6:.1f} MB")
+    print(f"queries: {len(queries)}  p50: {np.percentile(latencies, 50):.0f} us  "
+          f"p99: {np.percentile(latencies, 99):.0f} us  max: {latencies.max():.0f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Load-test the planning service in-process: latency percentiles, throughput and batching
+
+Usage: python benchmarks/bench_service.py [--requests 5000] [--concurrency 1000] [--batch-window-ms 2]
+                                          [--batch-sizes 1,8,45,100,150,1024]
+
+Starts the service on a free local port and keeps --concurrency requests in flight over
+separate connections, mixing /portions (random meals) and /macros calls 4:1. Client and
+server share one event loop here, so the numbers are a floor for a dedicated node.
+
+Then times one PortionBatcher flush of each --batch-sizes pending requests against
+planning the same meals one calculate_portions call at a time.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+import tornado.httpclient
+import tornado.httpserver
+import tornado.netutil
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from macro_targets import ACTIVITY_LEVELS, GOALS  # noqa: E402
+from planner import CATEGORY_ORDER, FOOD_CATALOG, calculate_portions  # noqa: E402
+from service import LISTEN_BACKLOG, PortionBatcher, make_app, raise_open_file_limit  # noqa: E402
+
+
+def request_bodies(count, seed=0):
+    rng = random.Random(seed)
+    bodies = []
+    for _ in range(count):
+        if rng.random() < 0.2:
+            bodies.append(("/macros", {"weight": rng.randint(100, 300), "goal": rng.choice(GOALS),
+                                       "activity_level": rng.choice(ACTIVITY_LEVELS)}))
+        else:
+            foods = {category: rng.sample(FOOD_CATALOG.names_in(category), 1) for category in CATEGORY_ORDER}
+            bodies.append(("/portions", {"foods": foods, "protein": rng.randint(20, 60),
+                                         "carbs": rng.randint(20, 80), "fat": rng.randint(5, 30)}))
+    return bodies
+
+
+async def load_test(args):
+    sockets = tornado.netutil.bind_sockets(0, "127.0.0.1", backlog=LISTEN_BACKLOG)
+    port = sockets[0].getsockname()[1]
+    server = tornado.httpserver.HTTPServer(make_app(args.batch_window_ms))
+    server.add_sockets(sockets)
+    client = tornado.httpclient.AsyncHTTPClient(max_clients=args.concurrency)
+
+    bodies = request_bodies(args.requests)
+    latencies = []
+    failures = 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def call(path, body):
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.fetch(f"http://127.0.0.1:{port}{path}", method="POST", body=json.dumps(body),
+                                          raise_error=False, request_timeout=120)
+            latencies.append(time.perf_counter() - start)
+            failures += response.code != 200
+
+    start = time.perf_counter()
+    await asyncio.gather(*(call(path, body) for path, body in bodies))
+    elapsed = time.perf_counter() - start
+
+    stats = json.loads((await client.fetch(f"http://127.0.0.1:{port}/stats")).body)
+    server.stop()
+    client.close()
+    return np.array(latencies) * 1000, failures, elapsed, stats
+
+
+async def batch_cost(size, repeat):
+    """Median ms of one batcher flush of size requests and of planning them one by one"""
+    requests = [(body["foods"], body["protein"], body["carbs"], body["fat"])
+                for path, body in request_bodies(size * 2 + 20, seed=size) if path == "/portions"][:size]
+    batcher = PortionBatcher(max_batch=size + 1)
+    batched, single = [], []
+    for _ in range(repeat):
+        futures = [batcher.submit(*request) for request in requests]
+        start = time.perf_counter()
+        batcher.flush()
+        batched.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        meals = [calculate_portions(*request) for request in requests]
+        single.append(time.perf_counter() - start)
+    if [future.result() for future in futures] != meals:
+        sys.exit("batched portions differ from single calls")
+    return np.median(batched) * 1000, np.median(single) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=1000)
+    parser.add_argument("--batch-window-ms", type=float, default=2.0)
+    parser.add_argument("--batch-sizes", default="1,8,45,100,150,1024")
+    args = parser.parse_args()
+
+    raise_open_file_limit()
+    latencies, failures, elapsed, stats = asyncio.run(load_test(args))
+    print(f"requests: {len(latencies)}  failed: {failures}  concurrency: {args.concurrency}")
+    print(f"client  p50: {np.percentile(latencies, 50):.1f} ms  p99: {np.percentile(latencies, 99):.1f} ms  "
+          f"throughput: {len(latencies) / elapsed:.0f} req/s")
+    for path, endpoint in stats["endpoints"].items():
+        print(f"server {path:>9}  p50: {endpoint['p50_ms']:.2f} ms  p99: {endpoint['p99_ms']:.2f} ms  "
+              f"requests: {endpoint['requests']}")
+    batches = stats["portion_batches"]
+    print(f"portion batches: {batches['batches']}  mean size: {batches['mean_size']:.1f}  largest: {batches['largest']}")
+
+    print(f"{'batch':>6} {'flush ms':>9} {'one by one ms':>14} {'speedup':>8}")
+    for size in map(int, args.batch_sizes.split(",")):
+        batched, single = asyncio.run(batch_cost(size, repeat=max(5, 2000 // size)))
+        print(f"{size:>6} {batched:>9.3f} {single:>14.3f} {single / batched:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Benchmark cold-start import time of each entry point and check which heavy packages it loads
+
+Usage: python benchmarks/bench_startup.py [--repeat 5]
+
+Each module is imported in a fresh interpreter with -X importtime. The planning core,
+batch runner, HTTP service and grocery lists must not load Streamlit, pandas or fitness_tools.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ("planner", "batch", "service", "grocery", "multi_day", "macrocounter")
+HEAVY_PACKAGES = ("streamlit", "pandas", "fitness_tools")
+LIGHT_MODULES = ("planner", "batch", "service", "grocery", "multi_day")
+
+
+def import_profile(module):
+    """Wall-clock seconds, cumulative import microseconds and top-level packages of one cold import"""
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=ROOT,
+                               capture_output=True, text=True, check=True)
+    seconds = time.perf_counter() - start
+    cumulative, packages = 0, set()
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        packages.add(name.strip().split(".")[0])
+        if name.strip() == module:
+            cumulative = int(cumulative_us)
+    return seconds, cumulative, packages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    failures = []
+    for module in MODULES:
+        profiles = [import_profile(module) for _ in range(args.repeat)]
+        wall = statistics.median(seconds for seconds, _, _ in profiles)
+        imports = statistics.median(cumulative for _, cumulative, _ in profiles)
+        heavy = [package for package in HEAVY_PACKAGES if package in profiles[0][2]]
+        print(f"{module:<13} import {imports / 1000:7.1f} ms, interpreter wall {wall * 1000:7.1f} ms, "
+              f"loads {', '.join(heavy) or 'none of ' + '/'.join(HEAVY_PACKAGES)}")
+        if module in LIGHT_MODULES and heavy:
+            failures.append(f"{module} loads {', '.join(heavy)}")
+
+    if failures:
+        sys.exit("; ".join(failures))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""Benchmark and regression suite for the planning hot paths
+
+Usage: python benchmarks/bench_suite.py [--save-baseline] [--threshold 0.25] [--write-oracle]
+
+1. Oracle: pinned outputs of calculate_macros over the whole weight/goal/activity grid and
+   of the original portion loops (legacy_calculate_portions) over seeded random meals.
+   calculate_portions, plan_day and the meal totals must reproduce them exactly; any
+   mismatch fails the run before anything is timed. --write-oracle re-pins them.
+2. Benchmarks: latency percentiles and throughput for calculate_macros (cold and cached),
+   calculate_portions, plan_day and the meal table assembly.
+3. Baseline: --save-baseline writes the results to benchmarks/baseline.json (per machine,
+   not committed). Later runs fail when a case's p50 latency or throughput is worse than
+   the baseline by more than --threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from bench_portions import legacy_calculate_portions  # noqa: E402
+from macro_targets import ACTIVITY_LEVELS, GOALS, MACRO_CACHE, MAX_WEIGHT, MIN_WEIGHT  # noqa: E402
+from macrocounter import build_meal_tables  # noqa: E402
+from planner import (CATEGORY_ORDER, FOOD_CATALOG, calculate_macros, calculate_portions, meal_targets,  # noqa: E402
+                     meal_totals, plan_day)
+
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+ORACLE_PATH = os.path.join(BENCH_DIR, "oracle.json")
+ORACLE_MEALS = 300
+
+# Foods per category in a random meal, as the planner's pickers allow
+PICK_RANGES = {"proteins": (1, 2), "carbs": (1, 1), "vegetables": (1, 2), "fats": (0, 1)}
+
+
+def macro_grid():
+    return [(weight, goal, activity_level) for weight in range(MIN_WEIGHT, MAX_WEIGHT + 1)
+            for goal in GOALS for activity_level in ACTIVITY_LEVELS]
+
+
+def random_meals(count, seed=0):
+    """Seeded (foods, num_meals, targets) triples with targets from a random client"""
+    rng = random.Random(seed)
+    grid = macro_grid()
+    meals = []
+    for _ in range(count):
+        foods = {category: rng.sample(FOOD_CATALOG.names_in(category), rng.randint(*PICK_RANGES[category]))
+                 for category in CATEGORY_ORDER}
+        num_meals = rng.randint(1, 6)
+        targets = meal_targets(calculate_macros(*rng.choice(grid)), num_meals)
+        meals.append((foods, num_meals, targets))
+    return meals
+
+
+def canonical(value):
+    """JSON text of a value; distinguishes 1 from 1.0 and keeps every float digit"""
+    return json.dumps(value, sort_keys=True)
+
+
+def flat_macros(macro_data):
+    """calculate_macros output as its 12 values, min/max/avg per nutrient"""
+    return [value for stats in macro_data.values() for value in stats.values()]
+
+
+def write_oracle(path):
+    oracle = {
+        "macros": [[weight, goal, activity_level, flat_macros(calculate_macros(weight, goal, activity_level))]
+                   for weight, goal, activity_level in macro_grid()],
+        "portions": [
+            {"foods": foods, "targets": targets,
+             "meal_items": legacy_calculate_portions(foods, targets["protein"], targets["carbs"], targets["fat"])}
+            for foods, _, targets in random_meals(ORACLE_MEALS)
+        ]
+    }
+    with open(path, "w") as f:
+        json.dump(oracle, f, separators=(",", ":"))
+    print(f"Pinned {len(oracle['macros'])} macro targets and {len(oracle['portions'])} meals in {path}")
+
+
+def check_oracle(path):
+    """List of mismatches between the current code and the pinned outputs"""
+    with open(path) as f:
+        oracle = json.load(f)
+    failures = []
+
+    MACRO_CACHE.clear()
+    for weight, goal, activity_level, expected in oracle["macros"]:
+        if canonical(flat_macros(calculate_macros(weight, goal, activity_level))) != canonical(expected):
+            failures.append(f"calculate_macros{(weight, goal, activity_level)}")
+
+    for index, case in enumerate(oracle["portions"]):
+        targets = case["targets"]
+        meal_items = calculate_portions(case["foods"], targets["protein"], targets["carbs"], targets["fat"])
+        if canonical(meal_items) != canonical(case["meal_items"]):
+            failures.append(f"calculate_portions meal {index}")
+        if canonical(meal_totals(meal_items)) != canonical(meal_totals(case["meal_items"])):
+            failures.append(f"meal_totals meal {index}")
+
+    # The vectorized day path must give the same meals as one call per meal
+    macro_data = {macro: {"avg": 0} for macro in ("calories", "protein", "carbs", "fat")}
+    for index, case in enumerate(oracle["portions"]):
+        for macro in macro_data:
+            macro_data[macro]["avg"] = case["targets"][macro]
+        day_plan = plan_day([case["foods"]], macro_data)
+        if canonical(day_plan["meals"][0]["meal_items"]) != canonical(case["meal_items"]):
+            failures.append(f"plan_day meal {index}")
+    return failures
+
+
+def measure(call, inputs, repeat=1):
+    """Per-call latency percentiles (us) and throughput (calls/s) of call over inputs"""
+    latencies = []
+    for _ in range(repeat):
+        for args in inputs:
+            start = time.perf_counter()
+            call(*args)
+            latencies.append(time.perf_counter() - start)
+    latencies = np.array(latencies) * 1e6
+    return {
+        "calls": len(latencies),
+        "p50_us": float(np.percentile(latencies, 50)),
+        "p90_us": float(np.percentile(latencies, 90)),
+        "p99_us": float(np.percentile(latencies, 99)),
+        "throughput": float(len(latencies) / (latencies.sum() / 1e6))
+    }
+
+
+def run_cases(repeat):
+    grid = macro_grid()
+    meals = random_meals(2000, seed=1)
+    day_inputs = []
+    for foods, num_meals, targets in meals[:500]:
+        macro_data = {macro: {"avg": targets[macro] * num_meals} for macro in targets}
+        day_inputs.append(([foods] * num_meals, macro_data))
+    table_inputs = [(calculate_portions(foods, targets["protein"], targets["carbs"], targets["fat"]), targets)
+                    for foods, _, targets in meals[:500]]
+
+    results = {}
+    MACRO_CACHE.clear()
+    results["calculate_macros (cold)"] = measure(calculate_macros, grid)
+    results["calculate_macros (cached)"] = measure(calculate_macros, grid, repeat)
+    results["calculate_portions"] = measure(
+        lambda foods, targets: calculate_portions(foods, targets["protein"], targets["carbs"], targets["fat"]),
+        [(foods, targets) for foods, _, targets in meals], repeat)
+    results["plan_day"] = measure(plan_day, day_inputs, repeat)
+    results["build_meal_tables"] = measure(build_meal_tables, table_inputs, repeat)
+    return results
+
+
+def regressions(results, baseline, threshold):
+    """Cases whose p50 latency or throughput is worse than the baseline by more than threshold"""
+    found = []
+    for name, result in results.items():
+        base = baseline["cases"].get(name)
+        if base is None:
+            continue
+        if result["p50_us"] > base["p50_us"] * (1 + threshold):
+            found.append(f"{name}: p50 {base['p50_us']:.1f} -> {result['p50_us']:.1f} us")
+        if result["throughput"] < base["throughput"] / (1 + threshold):
+            found.append(f"{name}: throughput {base['throughput']:.0f} -> {result['throughput']:.0f} calls/s")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="record this run as the baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown vs. the baseline")
+    parser.add_argument("--oracle", default=ORACLE_PATH)
+    parser.add_argument("--write-oracle", action="store_true", help="re-pin the oracle outputs and exit")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.write_oracle:
+        write_oracle(args.oracle)
+        return 0
+
+    failures = check_oracle(args.oracle)
+    if failures:
+        print(f"Oracle mismatch in {len(failures)} cases:", *failures[:20], sep="\n  ")
+        return 2
+    print("Oracle: outputs identical")
+
+    results = run_cases(args.repeat)
+    print(f"{'case':>28} {'calls':>7} {'p50 (us)':>10} {'p90 (us)':>10} {'p99 (us)':>10} {'calls/s':>10}")
+    for name, result in results.items():
+        print(f"{name:>28} {result['calls']:7d} {result['p50_us']:10.1f} {result['p90_us']:10.1f} "
+              f"{result['p99_us']:10.1f} {result['throughput']:10.0f}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(), "cases": results},
+                      f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one")
+        return 0
+    with open(args.baseline) as f:
+        found = regressions(results, json.load(f), args.threshold)
+    if found:
+        print(f"Regressions beyond {args.threshold:.0%}:", *found, sep="\n  ")
+        return 1
+    print(f"No regressions beyond {args.threshold:.0%} of the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
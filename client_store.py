@@ -0,0 +1,242 @@
+"""Client profiles, macro targets and saved meal plans in an embedded SQLite database
+
+The store is a single SQLite file in WAL mode, so readers are never blocked by a save.
+open_store() keeps one connection per file for the whole process, so Streamlit reruns
+and sessions reuse it instead of reconnecting. Clients are indexed by name and by
+(goal, name): looking up a returning client, and paging through thousands of them by
+name, are index range scans. A saved plan keeps one row per meal with its selections
+and computed portions, so loading it back is one indexed query and no planning.
+
+Set MACROCOUNTER_CLIENT_DB to choose the database file (default macrocounter.db).
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+from macro_targets import MACRO_KEYS, STAT_KEYS
+
+# Target values have no declared type, so whole calories come back as int like MakeMeal's
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS clients (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    weight INTEGER NOT NULL,
+    goal TEXT NOT NULL,
+    activity_level TEXT NOT NULL,
+    body_type TEXT,
+    split TEXT,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS clients_goal_name ON clients (goal, name);
+
+CREATE TABLE IF NOT EXISTS targets (
+    client_id INTEGER NOT NULL REFERENCES clients (id) ON DELETE CASCADE,
+    nutrient TEXT NOT NULL,
+    min, max, avg,
+    PRIMARY KEY (client_id, nutrient)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS plans (
+    id INTEGER PRIMARY KEY,
+    client_id INTEGER NOT NULL REFERENCES clients (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    num_meals INTEGER NOT NULL,
+    solver TEXT NOT NULL,
+    created REAL NOT NULL,
+    UNIQUE (client_id, name)
+);
+CREATE INDEX IF NOT EXISTS plans_client_created ON plans (client_id, created);
+
+CREATE TABLE IF NOT EXISTS plan_meals (
+    plan_id INTEGER NOT NULL REFERENCES plans (id) ON DELETE CASCADE,
+    day INTEGER NOT NULL,
+    meal INTEGER NOT NULL,
+    selections TEXT NOT NULL,
+    result TEXT,
+    PRIMARY KEY (plan_id, day, meal)
+) WITHOUT ROWID;
+"""
+
+CLIENT_COLUMNS = ("id", "name", "weight", "goal", "activity_level", "body_type", "split", "updated")
+PLAN_COLUMNS = ("id", "name", "num_meals", "solver", "created")
+
+
+class ClientStore:
+    """SQLite-backed client profiles, macro targets and saved plans, safe to share between threads"""
+
+    def __init__(self, path):
+        self.path = path
+        # Transactions are opened explicitly, so every batch of writes commits once
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute("PRAGMA foreign_keys=ON")
+            self._connection.executescript(SCHEMA)
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._connection
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._connection.execute(sql, params).fetchall()
+
+    def save_clients(self, clients):
+        """Insert or update many clients and their macro targets in one transaction; returns their ids
+
+        clients are dicts with name, weight, goal, activity_level and macro_data (as
+        calculate_macros returns it), and optionally body_type and split (a custom
+        (protein, carbs, fat) share of calories).
+        """
+        now = time.time()
+        ids, target_rows = [], []
+        with self._transaction() as connection:
+            for client in clients:
+                client_id = connection.execute(
+                    "INSERT INTO clients (name, weight, goal, activity_level, body_type, split, updated) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (name) DO UPDATE SET weight = excluded.weight, goal = excluded.goal, "
+                    "activity_level = excluded.activity_level, body_type = excluded.body_type, "
+                    "split = excluded.split, updated = excluded.updated RETURNING id",
+                    (client["name"], client["weight"], client["goal"], client["activity_level"],
+                     client.get("body_type"), _encode_split(client.get("split")), now)
+                ).fetchone()[0]
+                ids.append(client_id)
+                target_rows += [(client_id, macro) + tuple(client["macro_data"][macro][stat] for stat in STAT_KEYS)
+                                for macro in MACRO_KEYS]
+            connection.executemany("INSERT OR REPLACE INTO targets VALUES (?, ?, ?, ?, ?)", target_rows)
+        return ids
+
+    def save_client(self, name, weight, goal, activity_level, macro_data, body_type=None, split=None):
+        """Insert or update one client and their macro targets; returns the client id"""
+        return self.save_clients([{"name": name, "weight": weight, "goal": goal, "activity_level": activity_level,
+                                   "macro_data": macro_data, "body_type": body_type, "split": split}])[0]
+
+    def get_client(self, name):
+        """Profile and macro_data of a client, or None if the name is unknown"""
+        rows = self._query(
+            f"SELECT {', '.join('c.' + column for column in CLIENT_COLUMNS)}, t.nutrient, t.min, t.max, t.avg "
+            "FROM clients c LEFT JOIN targets t ON t.client_id = c.id WHERE c.name = ?", (name,))
+        if not rows:
+            return None
+        client = _client(rows[0])
+        nutrient = len(CLIENT_COLUMNS)
+        targets = {row[nutrient]: dict(zip(STAT_KEYS, row[nutrient + 1:])) for row in rows if row[nutrient] is not None}
+        client["macro_data"] = {macro: targets[macro] for macro in MACRO_KEYS} if targets else None
+        return client
+
+    def list_clients(self, goal=None, prefix="", after=None, limit=50):
+        """Up to limit client profiles ordered by name, optionally for one goal or name prefix
+
+        Pass the last name of a page as after to get the next one; each page is an index
+        range scan, however many clients there are.
+        """
+        conditions, params = [], []
+        if goal is not None:
+            conditions.append("goal = ?")
+            params.append(goal)
+        if prefix:
+            conditions.append("name >= ? AND name < ?")
+            params += [prefix, prefix + "\U0010ffff"]
+        if after is not None:
+            conditions.append("name > ?")
+            params.append(after)
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        rows = self._query(f"SELECT {', '.join(CLIENT_COLUMNS)} FROM clients {where}ORDER BY name LIMIT ?",
+                           params + [limit])
+        return [_client(row) for row in rows]
+
+    def count_clients(self, goal=None):
+        """Number of saved clients, optionally for one goal"""
+        if goal is None:
+            return self._query("SELECT count(*) FROM clients")[0][0]
+        return self._query("SELECT count(*) FROM clients WHERE goal = ?", (goal,))[0][0]
+
+    def save_plan(self, client_name, plan_name, num_meals, solver, meals):
+        """Save (or replace) a client's named plan in one transaction; returns the plan id
+
+        meals are (day, meal, selections, result) tuples, result being the meal's
+        targets, meal_items, totals and solver_info or None when it is not calculated.
+        """
+        meals = list(meals)
+        with self._transaction() as connection:
+            row = connection.execute("SELECT id FROM clients WHERE name = ?", (client_name,)).fetchone()
+            if row is None:
+                raise KeyError(client_name)
+            connection.execute("DELETE FROM plans WHERE client_id = ? AND name = ?", (row[0], plan_name))
+            plan_id = connection.execute(
+                "INSERT INTO plans (client_id, name, num_meals, solver, created) VALUES (?, ?, ?, ?, ?) RETURNING id",
+                (row[0], plan_name, num_meals, solver, time.time())
+            ).fetchone()[0]
+            connection.executemany(
+                "INSERT INTO plan_meals VALUES (?, ?, ?, ?, ?)",
+                [(plan_id, day, meal, json.dumps(selections), None if result is None else json.dumps(result))
+                 for day, meal, selections, result in meals]
+            )
+        return plan_id
+
+    def load_plan(self, client_name, plan_name=None):
+        """A client's named plan, or their latest one, with every meal; None if there is none"""
+        sql = (f"SELECT {', '.join('p.' + column for column in PLAN_COLUMNS)} "
+               "FROM plans p JOIN clients c ON c.id = p.client_id WHERE c.name = ?")
+        params = [client_name]
+        if plan_name is not None:
+            sql += " AND p.name = ?"
+            params.append(plan_name)
+        rows = self._query(sql + " ORDER BY p.created DESC LIMIT 1", params)
+        if not rows:
+            return None
+        plan = dict(zip(PLAN_COLUMNS, rows[0]))
+        plan["meals"] = [
+            {"day": day, "meal": meal, "selections": json.loads(selections),
+             "result": None if result is None else json.loads(result)}
+            for day, meal, selections, result in self._query(
+                "SELECT day, meal, selections, result FROM plan_meals WHERE plan_id = ? ORDER BY day, meal",
+                (plan["id"],))
+        ]
+        return plan
+
+    def list_plans(self, client_name):
+        """A client's saved plans, newest first, without their meals"""
+        rows = self._query(
+            f"SELECT {', '.join('p.' + column for column in PLAN_COLUMNS)} FROM plans p "
+            "JOIN clients c ON c.id = p.client_id WHERE c.name = ? ORDER BY p.created DESC", (client_name,))
+        return [dict(zip(PLAN_COLUMNS, row)) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+def _encode_split(split):
+    return None if split is None else json.dumps(list(split))
+
+
+def _client(row):
+    """Client profile dict from a row of CLIENT_COLUMNS, with the split as a tuple"""
+    client = dict(zip(CLIENT_COLUMNS, row))
+    client["split"] = None if client["split"] is None else tuple(json.loads(client["split"]))
+    return client
+
+
+@lru_cache(maxsize=None)
+def _open_store(path):
+    return ClientStore(path)
+
+
+def open_store(path=None):
+    """Client store shared by every session in this process"""
+    return _open_store(os.path.abspath(path or os.environ.get("MACROCOUNTER_CLIENT_DB", "macrocounter.db")))
@@ -0,0 +1,179 @@
+"""Typed columnar exports of meal plans and macro targets (Arrow/Parquet)
+
+Every export shares two schemas: PLAN_SCHEMA, one row per planned food, and
+TARGETS_SCHEMA, one row per client and nutrient. Numbers are float64 columns in
+grams or kcal, not formatted strings, and food and nutrient names are dictionary
+encoded in Parquet (plain strings in CSV and Arrow IPC files). Writers stream record
+batches, so each batch becomes a Parquet row group and nothing is collected into a
+DataFrame first. A bundle is a zip holding plan.parquet, targets.parquet and a
+manifest.json describing them.
+"""
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.ipc as pa_ipc
+import pyarrow.parquet as pq
+
+from instrumentation import timed
+from macro_targets import MACRO_KEYS, STAT_KEYS
+
+PLAN_SCHEMA = pa.schema([
+    ("client", pa.string()),
+    ("day", pa.int16()),
+    ("meal", pa.int16()),
+    ("food", pa.dictionary(pa.int32(), pa.string())),
+    ("amount_g", pa.float64()),
+    ("calories", pa.float64()),
+    ("protein_g", pa.float64()),
+    ("carbs_g", pa.float64()),
+    ("fat_g", pa.float64())
+])
+
+TARGETS_SCHEMA = pa.schema([
+    ("client", pa.string()),
+    ("nutrient", pa.dictionary(pa.int8(), pa.string())),
+    ("unit", pa.dictionary(pa.int8(), pa.string())),
+    ("min", pa.float64()),
+    ("max", pa.float64()),
+    ("avg", pa.float64())
+])
+
+# Meal item dict key behind each numeric PLAN_SCHEMA column
+ITEM_COLUMNS = {"amount_g": "Amount (g)", "calories": "Calories", "protein_g": "Protein (g)",
+                "carbs_g": "Carbs (g)", "fat_g": "Fat (g)"}
+NUTRIENT_UNITS = {"calories": "kcal", "protein": "g", "carbs": "g", "fat": "g"}
+
+
+def plan_batch(meals):
+    """PLAN_SCHEMA record batch from (client, day, meal, meal_items) tuples"""
+    clients, days, meal_numbers, foods = [], [], [], []
+    values = {column: [] for column in ITEM_COLUMNS}
+    for client, day, meal, meal_items in meals:
+        for item in meal_items:
+            clients.append(client)
+            days.append(day)
+            meal_numbers.append(meal)
+            foods.append(item["Food"])
+            for column, key in ITEM_COLUMNS.items():
+                values[column].append(item[key])
+
+    # The dictionary holds only the foods used in this batch
+    food_names, food_codes = np.unique(np.array(foods, dtype=object), return_inverse=True)
+    return pa.RecordBatch.from_arrays([
+        pa.array(clients, pa.string()),
+        pa.array(days, pa.int16()),
+        pa.array(meal_numbers, pa.int16()),
+        pa.DictionaryArray.from_arrays(pa.array(food_codes, pa.int32()), pa.array(food_names.tolist(), pa.string())),
+    ] + [pa.array(values[column], pa.float64()) for column in ITEM_COLUMNS], schema=PLAN_SCHEMA)
+
+
+def targets_batch(targets):
+    """TARGETS_SCHEMA record batch from (client, values) pairs, values as a calculate_macros dict
+    or a flat macro value tuple"""
+    clients, codes = [], []
+    stats = {stat: [] for stat in STAT_KEYS}
+    for client, values in targets:
+        if isinstance(values, dict):
+            values = [values[macro][stat] for macro in MACRO_KEYS for stat in STAT_KEYS]
+        values = iter(values)
+        for code, macro in enumerate(MACRO_KEYS):
+            clients.append(client)
+            codes.append(code)
+            for stat in STAT_KEYS:
+                stats[stat].append(next(values))
+
+    codes = pa.array(codes, pa.int8())
+    return pa.RecordBatch.from_arrays([
+        pa.array(clients, pa.string()),
+        pa.DictionaryArray.from_arrays(codes, pa.array(MACRO_KEYS, pa.string())),
+        pa.DictionaryArray.from_arrays(codes, pa.array([NUTRIENT_UNITS[macro] for macro in MACRO_KEYS], pa.string())),
+    ] + [pa.array(stats[stat], pa.float64()) for stat in STAT_KEYS], schema=TARGETS_SCHEMA)
+
+
+class TableWriter:
+    """Streams record batches to Parquet, Arrow IPC or CSV (by file extension unless format is given)"""
+
+    def __init__(self, sink, schema, format=None):
+        if format is None:
+            extension = os.path.splitext(sink)[1].lower()
+            format = {".parquet": "parquet", ".arrow": "arrow", ".feather": "arrow"}.get(extension, "csv")
+        self.format = format
+        self.rows = 0
+        if format == "parquet":
+            self.schema = schema
+            self._writer = pq.ParquetWriter(sink, schema, compression="zstd")
+            return
+        # CSV has no dictionary type, and an Arrow IPC file allows only one dictionary per column
+        # while every batch brings its own, so those columns are written as plain strings
+        self.schema = pa.schema([
+            field.with_type(field.type.value_type) if pa.types.is_dictionary(field.type) else field
+            for field in schema
+        ])
+        if format == "arrow":
+            self._writer = pa_ipc.new_file(sink, self.schema)
+        else:
+            self._writer = pa_csv.CSVWriter(sink, self.schema)
+
+    def write(self, record_batch):
+        if self.format != "parquet":
+            record_batch = record_batch.cast(self.schema)
+        self._writer.write_batch(record_batch)
+        self.rows += record_batch.num_rows
+
+    def close(self):
+        self._writer.close()
+
+
+class BundleWriter:
+    """Zip bundle of Parquet tables, each streamed to a temporary file until close()"""
+
+    def __init__(self, sink, schemas, metadata=None):
+        self.sink = sink
+        self.metadata = metadata or {}
+        self._directory = tempfile.mkdtemp(prefix="macrocounter-bundle-")
+        self.writers = {name: TableWriter(os.path.join(self._directory, f"{name}.parquet"), schema)
+                        for name, schema in schemas.items()}
+
+    def write(self, name, record_batch):
+        self.writers[name].write(record_batch)
+
+    def close(self):
+        try:
+            manifest = dict(self.metadata, created=time.strftime("%Y-%m-%dT%H:%M:%S%z"), tables={})
+            for name, writer in self.writers.items():
+                writer.close()
+                manifest["tables"][name] = {"file": f"{name}.parquet", "rows": writer.rows,
+                                            "columns": writer.schema.names}
+            # Parquet pages are already compressed, so the members are stored as is
+            with zipfile.ZipFile(self.sink, "w", compression=zipfile.ZIP_STORED) as bundle:
+                for name in self.writers:
+                    bundle.write(os.path.join(self._directory, f"{name}.parquet"), f"{name}.parquet")
+                bundle.writestr("manifest.json", json.dumps(manifest, indent=2))
+        finally:
+            shutil.rmtree(self._directory, ignore_errors=True)
+
+
+@timed("export")
+def export_bytes(meals, targets=(), format="parquet", metadata=None):
+    """One client's meals (and targets) as Parquet/Arrow bytes, or a zip bundle with format="zip"
+
+    meals are (client, day, meal, meal_items) tuples and targets (client, macro_data) pairs.
+    """
+    buffer = io.BytesIO()
+    if format == "zip":
+        writer = BundleWriter(buffer, {"plan": PLAN_SCHEMA, "targets": TARGETS_SCHEMA}, metadata)
+        writer.write("plan", plan_batch(meals))
+        writer.write("targets", targets_batch(targets))
+    else:
+        writer = TableWriter(buffer, PLAN_SCHEMA, format=format)
+        writer.write(plan_batch(meals))
+    writer.close()
+    return buffer.getvalue()
@@ -0,0 +1,396 @@
+"""Columnar food catalog with explicit categories, lookup by id and a memory-mapped store
+
+A catalog is compiled once from a CSV or Parquet nutrient table with
+'python planner.py build-food-db SOURCE TARGET_DIR'. The compiled directory holds
+plain .npy arrays that FoodCatalog.open memory-maps, so startup does not parse the
+source and every worker process shares the same pages of the OS file cache.
+
+The four macros are a dense matrix, which the portion engine reads. Any other numeric
+column of the table (fiber, sodium, sugar, vitamins, minerals...) is a micronutrient,
+kept in a sparse CSR matrix that stores only known, non-zero values: a food missing a
+value counts as zero, and memory grows with the values known rather than foods x nutrients.
+
+Threads that plan read a catalog inside `with catalog.lock:`; changes to its rows are made
+inside `with catalog.lock.writing():`, so no reader sees them half done.
+"""
+import json
+import os
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import lru_cache
+
+import numpy as np
+
+# Nutrient columns (per 100g) and food categories, in storage order
+NUTRIENTS = ("calories", "protein", "carbs", "fat")
+CATEGORIES = ("proteins", "carbs", "vegetables", "fats")
+
+_ARRAYS = ("nutrients", "category_codes", "name_blob", "name_offsets", "name_order",
+           "category_ids", "category_offsets")
+_MICRO_ARRAYS = ("indptr", "indices", "data")
+
+# Units of common micronutrients (per 100g of food); others are shown without a unit
+MICRONUTRIENT_UNITS = {
+    "fiber": "g", "sugar": "g", "saturated_fat": "g", "sodium": "mg", "cholesterol": "mg", "potassium": "mg",
+    "calcium": "mg", "iron": "mg", "magnesium": "mg", "phosphorus": "mg", "zinc": "mg", "vitamin_c": "mg",
+    "vitamin_e": "mg", "vitamin_b6": "mg", "niacin": "mg", "vitamin_a": "ug", "vitamin_d": "ug",
+    "vitamin_k": "ug", "vitamin_b12": "ug", "folate": "ug", "selenium": "ug"
+}
+
+
+def nutrient_label(name):
+    """Display name of a nutrient with its unit, e.g. 'Sodium (mg)'"""
+    unit = MICRONUTRIENT_UNITS.get(name)
+    label = name.replace("_", " ").capitalize()
+    return f"{label} ({unit})" if unit else label
+
+
+class SparseNutrients:
+    """Per-100g micronutrient values of every food as a CSR matrix of the known, non-zero values"""
+
+    def __init__(self, names, indptr, indices, data):
+        self.names = tuple(names)
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    @classmethod
+    def from_dense(cls, names, values):
+        """From a (foods, nutrients) array where NaN or zero means not known"""
+        values = np.nan_to_num(np.asarray(values, dtype=np.float64).reshape(-1, len(names)))
+        rows, columns = np.nonzero(values)
+        return cls(names, np.searchsorted(rows, np.arange(len(values) + 1)).astype(np.int64),
+                   columns.astype(np.int32), values[rows, columns])
+
+    @classmethod
+    def empty(cls, foods):
+        return cls((), np.zeros(foods + 1, dtype=np.int64), np.zeros(0, dtype=np.int32), np.zeros(0))
+
+    def _positions(self, ids):
+        """Indices into data/indices of every stored value of the given rows, and each row's count"""
+        starts = self.indptr[ids]
+        counts = self.indptr[np.asarray(ids) + 1] - starts
+        return np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum()), counts
+
+    def dense(self, ids):
+        """(len(ids), nutrients) array of the given rows"""
+        ids = np.asarray(ids, dtype=np.intp)
+        positions, counts = self._positions(ids)
+        values = np.zeros((len(ids), len(self.names)))
+        values[np.repeat(np.arange(len(ids)), counts), self.indices[positions]] = self.data[positions]
+        return values
+
+    def totals(self, ids, grams):
+        """Each nutrient summed over grams of the given foods: one sparse matrix-vector product"""
+        ids = np.asarray(ids, dtype=np.intp)
+        positions, counts = self._positions(ids)
+        weights = self.data[positions] * np.repeat(np.asarray(grams, dtype=np.float64) / 100, counts)
+        # bincount gives integers when no value is stored
+        return np.bincount(self.indices[positions], weights=weights, minlength=len(self.names)).astype(np.float64)
+
+    def with_rows(self, ids, values):
+        """Copy with the given rows replaced by dense values (ids past the end append rows)"""
+        ids = np.asarray(ids, dtype=np.int64)
+        values = np.nan_to_num(np.asarray(values, dtype=np.float64).reshape(len(ids), len(self.names)))
+        foods = max(len(self), int(ids.max()) + 1 if len(ids) else 0)
+        owners = np.repeat(np.arange(len(self)), np.diff(self.indptr))
+        keep = ~np.isin(owners, ids)
+        rows, new_columns = np.nonzero(values)
+        owners = np.concatenate([owners[keep], ids[rows]])
+        columns = np.concatenate([self.indices[keep], new_columns.astype(np.int32)])
+        data = np.concatenate([self.data[keep], values[rows, new_columns]])
+        order = np.lexsort((columns, owners))
+        return SparseNutrients(self.names, np.searchsorted(owners[order], np.arange(foods + 1)).astype(np.int64),
+                               columns[order], data[order])
+
+
+class SharedLock:
+    """Many readers or one writer: `with lock:` reads, `with lock.writing():` writes. Readers never
+    wait for each other, so a reader can take the lock again while holding it"""
+
+    def __init__(self):
+        self._mutex = threading.Lock()
+        self._no_readers = threading.Condition(self._mutex)
+        self._readers = 0
+        self._writers = 0  # Writers waiting for the readers to finish
+
+    def __enter__(self):
+        with self._mutex:
+            self._readers += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        with self._mutex:
+            self._readers -= 1
+            if self._writers and not self._readers:
+                self._no_readers.notify_all()
+
+    @contextmanager
+    def writing(self):
+        with self._no_readers:
+            self._writers += 1
+            try:
+                self._no_readers.wait_for(lambda: not self._readers)
+            finally:
+                self._writers -= 1
+            yield
+
+
+class FoodCatalog:
+    """Foods stored as columns: nutrient matrix, category codes and UTF-8 names, addressed by id"""
+
+    def __init__(self, nutrients, category_codes, name_blob, name_offsets, name_order=None,
+                 category_ids=None, category_offsets=None, micros=None):
+        self.nutrients = nutrients
+        self.micros = SparseNutrients.empty(len(category_codes)) if micros is None else micros
+        self.category_codes = category_codes
+        self.name_blob = name_blob
+        self.name_offsets = name_offsets
+
+        # Ids sorted by name for binary-search lookup
+        if name_order is None:
+            names = [self._name_bytes(food_id) for food_id in range(len(self))]
+            name_order = np.array(sorted(range(len(names)), key=names.__getitem__), dtype=np.int64)
+        self.name_order = name_order
+
+        # Ids grouped by category: category_ids[category_offsets[c]:category_offsets[c + 1]]
+        if category_ids is None:
+            category_ids = np.argsort(category_codes, kind="stable").astype(np.int64)
+            category_offsets = np.searchsorted(category_codes[category_ids], np.arange(len(CATEGORIES) + 1))
+        self.category_ids = category_ids
+        self.category_offsets = category_offsets
+
+        self._ids = {}
+        self._names = {}
+        self._category_names = {}
+        self._category_distinct = {}
+        # Bumped whenever foods are added or their nutrients change, so caches can tell
+        self.version = 0
+        self.lock = SharedLock()
+
+    def __len__(self):
+        return len(self.category_codes)
+
+    def __contains__(self, name):
+        try:
+            self.id_of(name)
+        except KeyError:
+            return False
+        return True
+
+    @classmethod
+    def from_records(cls, names, categories, nutrient_rows, micro_names=(), micro_rows=None):
+        """Build an in-memory catalog from parallel lists of names, categories and nutrient rows,
+        with optional micronutrient rows (NaN or zero where not known)"""
+        encoded = [name.encode("utf-8") for name in names]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(name) for name in encoded])
+        unknown = sorted(set(categories) - set(CATEGORIES))
+        if unknown:
+            raise ValueError(f"Unknown food categories: {', '.join(unknown)}")
+        return cls(
+            nutrients=np.ascontiguousarray(nutrient_rows, dtype=np.float64).reshape(len(names), len(NUTRIENTS)),
+            category_codes=np.array([CATEGORIES.index(category) for category in categories], dtype=np.uint8),
+            name_blob=np.frombuffer(b"".join(encoded), dtype=np.uint8),
+            name_offsets=offsets,
+            micros=SparseNutrients.from_dense(micro_names, micro_rows) if micro_names else None
+        )
+
+    @classmethod
+    def from_food_data(cls, food_data):
+        """Catalog from a FOOD_DATA-style dict of name -> {category, nutrients per 100g}; keys other
+        than the category and macros are micronutrients"""
+        micro_names = sorted({key for food in food_data.values() for key in food} - {"category"} - set(NUTRIENTS))
+        return cls.from_records(
+            list(food_data),
+            [food["category"] for food in food_data.values()],
+            [[food[nutrient] for nutrient in NUTRIENTS] for food in food_data.values()],
+            micro_names,
+            [[food.get(name, 0) for name in micro_names] for food in food_data.values()]
+        )
+
+    @classmethod
+    def from_table(cls, path):
+        """Parse a CSV or Parquet nutrient table with name, category and NUTRIENTS columns; every
+        other numeric column except id is a micronutrient"""
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(path) if path.endswith(".parquet") else pa_csv.read_csv(path)
+        micro_names = [field.name for field in table.schema
+                       if field.name not in ("id", "name", "category") + NUTRIENTS
+                       and (pa.types.is_integer(field.type) or pa.types.is_floating(field.type)
+                            or pa.types.is_null(field.type))]
+
+        def column(name):
+            return table[name].to_numpy(zero_copy_only=False).astype(np.float64)
+
+        return cls.from_records(
+            table["name"].to_pylist(),
+            table["category"].to_pylist(),
+            # Missing nutrient values count as zero
+            np.nan_to_num(np.column_stack([column(nutrient) for nutrient in NUTRIENTS])),
+            micro_names,
+            np.column_stack([column(name) for name in micro_names]) if micro_names else None
+        )
+
+    def save(self, directory):
+        """Write the catalog as .npy arrays that open() can memory-map"""
+        os.makedirs(directory, exist_ok=True)
+        for name in _ARRAYS:
+            np.save(os.path.join(directory, f"{name}.npy"), np.ascontiguousarray(getattr(self, name)))
+        for name in _MICRO_ARRAYS:
+            np.save(os.path.join(directory, f"micro_{name}.npy"), np.ascontiguousarray(getattr(self.micros, name)))
+        with open(os.path.join(directory, "catalog.json"), "w") as f:
+            json.dump({"foods": len(self), "nutrients": NUTRIENTS, "categories": CATEGORIES,
+                       "micronutrients": self.micros.names}, f)
+
+    @classmethod
+    def open(cls, directory):
+        """Memory-map a catalog written by save(); nothing is parsed up front"""
+        with open(os.path.join(directory, "catalog.json")) as f:
+            meta = json.load(f)
+        if tuple(meta["nutrients"]) != NUTRIENTS or tuple(meta["categories"]) != CATEGORIES:
+            raise ValueError(f"{directory} was compiled with a different nutrient or category layout")
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in _ARRAYS}
+        # Catalogs compiled before micronutrients were tracked have none
+        if "micronutrients" in meta:
+            arrays["micros"] = SparseNutrients(meta["micronutrients"], *(
+                np.load(os.path.join(directory, f"micro_{name}.npy"), mmap_mode="r") for name in _MICRO_ARRAYS))
+        return cls(**arrays)
+
+    def add_foods(self, names, categories, nutrient_rows, micro_rows=None):
+        """Append foods in place (ids of existing foods do not change); returns the new ids"""
+        encoded = [name.encode("utf-8") for name in names]
+        clashes = [name for name in names if name in self]
+        if clashes or len(set(encoded)) < len(encoded):
+            raise ValueError(f"Foods already in the catalog: {', '.join(clashes) or 'duplicate names'}")
+        unknown = sorted(set(categories) - set(CATEGORIES))
+        if unknown:
+            raise ValueError(f"Unknown food categories: {', '.join(unknown)}")
+        first = len(self)
+        new_ids = np.arange(first, first + len(names), dtype=np.int64)
+
+        # New names go into the sorted order at their binary-search positions
+        by_name = sorted(range(len(encoded)), key=encoded.__getitem__)
+        positions = [bisect_left(range(first), encoded[index], key=lambda position: self._name_bytes(
+            self.name_order[position])) for index in by_name]
+        offsets = self.name_offsets[-1] + np.cumsum([len(name) for name in encoded])
+
+        self.nutrients = np.concatenate([
+            self.nutrients, np.asarray(nutrient_rows, dtype=np.float64).reshape(len(names), len(NUTRIENTS))])
+        self.micros = self.micros.with_rows(
+            new_ids, np.zeros((len(names), len(self.micros.names))) if micro_rows is None else micro_rows)
+        self.name_blob = np.concatenate([self.name_blob, np.frombuffer(b"".join(encoded), dtype=np.uint8)])
+        self.name_offsets = np.concatenate([self.name_offsets, offsets])
+        self.category_codes = np.concatenate([
+            self.category_codes, np.array([CATEGORIES.index(category) for category in categories], dtype=np.uint8)])
+        self.name_order = np.insert(self.name_order, positions, new_ids[by_name])
+        self.category_ids = np.argsort(self.category_codes, kind="stable").astype(np.int64)
+        self.category_offsets = np.searchsorted(self.category_codes[self.category_ids], np.arange(len(CATEGORIES) + 1))
+
+        self._category_names.clear()
+        self._category_distinct.clear()
+        self.version += 1
+        return new_ids
+
+    def set_nutrients(self, ids, nutrient_rows, micro_rows=None):
+        """Replace the nutrient (and optionally micronutrient) rows of some foods in place"""
+        if not self.nutrients.flags.writeable:
+            # A memory-mapped catalog is read-only; changes live in this process's copy
+            self.nutrients = np.array(self.nutrients)
+        self.nutrients[ids] = nutrient_rows
+        if micro_rows is not None:
+            self.micros = self.micros.with_rows(ids, micro_rows)
+        self._category_distinct.clear()
+        self.version += 1
+
+    def _name_bytes(self, food_id):
+        return self.name_blob[self.name_offsets[food_id]:self.name_offsets[food_id + 1]].tobytes()
+
+    def name_of(self, food_id):
+        """Display name of a food id"""
+        name = self._names.get(food_id)
+        if name is None:
+            name = self._names[food_id] = self._name_bytes(food_id).decode("utf-8")
+        return name
+
+    def iter_names(self, ids):
+        """Decode the names of many ids without caching them (for building indexes)"""
+        blob = self.name_blob.tobytes()
+        offsets = self.name_offsets
+        for food_id in np.asarray(ids).tolist():
+            yield blob[offsets[food_id]:offsets[food_id + 1]].decode("utf-8")
+
+    def id_of(self, name):
+        """Food id for a display name (binary search over the sorted names), KeyError if unknown"""
+        food_id = self._ids.get(name)
+        if food_id is None:
+            encoded = name.encode("utf-8")
+            position = bisect_left(range(len(self)), encoded,
+                                   key=lambda index: self._name_bytes(self.name_order[index]))
+            if position == len(self) or self._name_bytes(self.name_order[position]) != encoded:
+                raise KeyError(name)
+            food_id = self._ids[name] = int(self.name_order[position])
+        return food_id
+
+    def category_of(self, food_id):
+        """Category name of a food id"""
+        return CATEGORIES[self.category_codes[food_id]]
+
+    def ids_in(self, category):
+        """Ids of every food in a category, from the precomputed index"""
+        code = CATEGORIES.index(category)
+        return self.category_ids[self.category_offsets[code]:self.category_offsets[code + 1]]
+
+    def names_in(self, category):
+        """Display names of every food in a category (cached per catalog)"""
+        names = self._category_names.get(category)
+        if names is None:
+            names = self._category_names[category] = [self.name_of(int(food_id)) for food_id in self.ids_in(category)]
+        return names
+
+    def distinct_in(self, category):
+        """Ids of a category's foods with distinct nutrient vectors, and those vectors (cached per catalog)"""
+        distinct = self._category_distinct.get(category)
+        if distinct is None:
+            category_ids = self.ids_in(category)
+            rows = np.ascontiguousarray(self.nutrients[category_ids])
+            # Compare whole rows as single byte strings, much faster than np.unique(axis=0)
+            keys = rows.view(np.dtype((np.void, rows.itemsize * rows.shape[1]))).ravel()
+            first = np.sort(np.unique(keys, return_index=True)[1])
+            distinct = self._category_distinct[category] = (category_ids[first], rows[first])
+        return distinct
+
+
+@lru_cache(maxsize=None)
+def open_catalog(directory):
+    """Memory-mapped catalog shared by every session in this process"""
+    return FoodCatalog.open(directory)
+
+
+def build_food_db(argv=None):
+    """Compile a CSV/Parquet nutrient table into a memory-mappable catalog directory"""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="planner build-food-db", description=build_food_db.__doc__)
+    parser.add_argument("source", help="nutrient table (.csv or .parquet) with name, category and "
+                                       + ", ".join(NUTRIENTS) + " columns")
+    parser.add_argument("target", help="output directory")
+    parser.add_argument("--recipes", help="recipe file (JSON) whose recipes are compiled in as foods")
+    args = parser.parse_args(argv)
+
+    catalog = FoodCatalog.from_table(args.source)
+    recipes = []
+    if args.recipes:
+        from recipes import RecipeBook
+
+        recipes = RecipeBook(catalog).load(args.recipes)
+    catalog.save(args.target)
+    print(f"Compiled {len(catalog)} foods ({len(recipes)} recipes) into {args.target}")
+    return 0
@@ -0,0 +1,281 @@
+"""Server-side prefix and typo-tolerant search over food names
+
+Every word of every name is a token. The index keeps the sorted token vocabulary and,
+for each token, the names containing it ordered shortest first, so a keystroke only
+needs a binary search and a few array slices. Words that match no token fall back to
+the closest vocabulary words by trigram similarity.
+"""
+import re
+import threading
+import weakref
+from bisect import bisect_left
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+CANDIDATE_LIMIT = 2000  # Names first taken from each token's posting list when other words filter them
+FULL_SCAN_POSTINGS = 65536  # Posting lists up to this size are filtered whole once the first window falls short
+RANK_LIMIT = 500  # Names taken from each token's posting list for a one-word query
+MAX_PREFIX_TOKENS = 64  # Vocabulary words expanded for one prefix before giving up on the rest
+SHORT_PREFIX_TOP = 256  # Names kept per 1-2 letter prefix, whose token ranges are huge
+FUZZY_TOKENS = 3  # Vocabulary words tried for a word with no prefix match
+FUZZY_MIN_SIMILARITY = 0.25
+ADDED_INDEX_LIMIT = 4096  # Names appended after an index was built that go into a second index, not a rebuild
+
+
+def tokenize(text):
+    """Lowercase words of a name or query"""
+    return TOKEN_RE.findall(text.lower())
+
+
+def _trigrams(token):
+    padded = f"${token}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class FoodSearchIndex:
+    """Ranked prefix search over food names, returning food ids"""
+
+    def __init__(self, ids, names):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        token_lists = [list(dict.fromkeys(tokenize(name))) for name in names]
+        self.name_lengths = np.array([sum(len(token) + 1 for token in tokens) for tokens in token_lists],
+                                     dtype=np.int32)
+
+        # Names -> tokens, as vocabulary indexes in CSR layout
+        self.vocab = sorted({token for tokens in token_lists for token in tokens})
+        vocab_index = {token: index for index, token in enumerate(self.vocab)}
+        counts = np.array([len(tokens) for tokens in token_lists], dtype=np.int64)
+        self.name_token_offsets = np.zeros(len(token_lists) + 1, dtype=np.int64)
+        self.name_token_offsets[1:] = np.cumsum(counts)
+        self.name_tokens = np.fromiter((vocab_index[token] for tokens in token_lists for token in tokens),
+                                       dtype=np.int32, count=int(counts.sum()))
+
+        # Tokens -> names, each posting list ordered by name length
+        owners = np.repeat(np.arange(len(token_lists), dtype=np.int32), counts)
+        order = np.lexsort((owners, self.name_lengths[owners], self.name_tokens))
+        self.postings = owners[order]
+        self.posting_offsets = np.searchsorted(self.name_tokens[order], np.arange(len(self.vocab) + 1))
+
+        # 1-2 letter prefixes cover too many tokens to merge per keystroke, so keep their top names
+        self.short_prefix_top = {}
+        for prefix in {token[:size] for token in self.vocab for size in (1, 2)}:
+            lo, hi = self._prefix_range(prefix)
+            positions = self.postings[self.posting_offsets[lo]:self.posting_offsets[hi]]
+            if len(positions) > 4 * SHORT_PREFIX_TOP:
+                # Extra room because a name can appear once per matching word
+                shortest = np.argpartition(self.name_lengths[positions], 4 * SHORT_PREFIX_TOP)
+                positions = positions[shortest[:4 * SHORT_PREFIX_TOP]]
+            self.short_prefix_top[prefix] = np.unique(positions)
+
+        # Vocabulary trigrams for typo fallback
+        trigram_postings = {}
+        for index, token in enumerate(self.vocab):
+            for trigram in _trigrams(token):
+                trigram_postings.setdefault(trigram, []).append(index)
+        self.trigrams = {trigram: np.array(indexes, dtype=np.int32) for trigram, indexes in trigram_postings.items()}
+        self.vocab_trigram_counts = np.array([len(_trigrams(token)) for token in self.vocab], dtype=np.int32)
+
+    @classmethod
+    def from_catalog(cls, catalog, category=None, start=0):
+        """Index every food of a catalog, or of one category, from id start on"""
+        if category is None:
+            ids = np.arange(start, len(catalog))
+        else:
+            ids = catalog.ids_in(category)
+            ids = ids[ids >= start] if start else ids
+        return cls(ids, catalog.iter_names(ids))
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by the index arrays"""
+        arrays = (self.ids, self.name_lengths, self.name_token_offsets, self.name_tokens, self.postings,
+                  self.posting_offsets, self.vocab_trigram_counts)
+        return (sum(array.nbytes for array in arrays)
+                + sum(array.nbytes for array in self.short_prefix_top.values())
+                + sum(array.nbytes for array in self.trigrams.values())
+                + sum(len(token) + 49 for token in self.vocab))
+
+    def _prefix_range(self, prefix):
+        """Vocabulary index range [lo, hi) of the tokens starting with prefix"""
+        return bisect_left(self.vocab, prefix), bisect_left(self.vocab, prefix + "\uffff")
+
+    def _fuzzy_tokens(self, term):
+        """Vocabulary indexes of the words closest to term by trigram Jaccard similarity"""
+        term_trigrams = _trigrams(term)
+        postings = [self.trigrams[trigram] for trigram in term_trigrams if trigram in self.trigrams]
+        if not postings:
+            return []
+        tokens, shared = np.unique(np.concatenate(postings), return_counts=True)
+        similarity = shared / (len(term_trigrams) + self.vocab_trigram_counts[tokens] - shared)
+        if len(tokens) > FUZZY_TOKENS:
+            best = np.argpartition(-similarity, FUZZY_TOKENS)[:FUZZY_TOKENS]
+            tokens, similarity = tokens[best], similarity[best]
+        return [int(token) for token, score in zip(tokens, similarity) if score >= FUZZY_MIN_SIMILARITY]
+
+    def has_prefix(self, term):
+        """Whether some indexed word starts with term"""
+        lo, hi = self._prefix_range(term)
+        return lo < hi
+
+    def _term_ranges(self, term, fuzzy=True):
+        """Vocabulary ranges a query word matches: its prefix range, or the closest words"""
+        lo, hi = self._prefix_range(term)
+        if lo < hi:
+            return [(lo, hi)]
+        return [(index, index + 1) for index in self._fuzzy_tokens(term)] if fuzzy else []
+
+    def _posting_count(self, ranges):
+        return sum(int(self.posting_offsets[hi] - self.posting_offsets[lo]) for lo, hi in ranges)
+
+    def _candidates(self, term, ranges, limit):
+        """Up to limit of the shortest names for each vocabulary word a query word matches"""
+        if term in self.short_prefix_top:
+            return self.short_prefix_top[term]
+        slices = []
+        for lo, hi in ranges:
+            for token in range(lo, min(hi, lo + MAX_PREFIX_TOKENS)):
+                start = self.posting_offsets[token]
+                slices.append(self.postings[start:min(start + limit, self.posting_offsets[token + 1])])
+        return slices[0] if len(slices) == 1 else np.unique(np.concatenate(slices))
+
+    def _window(self, ranges, limit):
+        """The first limit names (shortest first) of every vocabulary word in ranges, and whether
+        that is all of their names"""
+        starts = np.concatenate([self.posting_offsets[lo:hi] for lo, hi in ranges])
+        sizes = np.concatenate([self.posting_offsets[lo + 1:hi + 1] for lo, hi in ranges]) - starts
+        counts = np.minimum(sizes, limit)
+        positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        # One word's posting list holds each name once; several words' lists may share names
+        names = self.postings[positions] if len(starts) == 1 else np.unique(self.postings[positions])
+        return names, bool((counts == sizes).all())
+
+    def _filtered_candidates(self, term, ranges, other_ranges, k):
+        """Names matching term and every other query word: term's shortest names are filtered
+        first, and the window widens until k names match or term's posting lists run out"""
+        if term in self.short_prefix_top:
+            candidates = self.short_prefix_top[term]
+            candidates = candidates[self._matches_all(candidates, other_ranges)]
+            if len(candidates) >= k:
+                return candidates
+        limit = CANDIDATE_LIMIT
+        while True:
+            candidates, complete = self._window(ranges, limit)
+            candidates = candidates[self._matches_all(candidates, other_ranges)]
+            if len(candidates) >= k or complete:
+                return candidates
+            # Short enough lists are taken whole at once rather than in growing windows
+            limit = limit * 4 if self._posting_count(ranges) > FULL_SCAN_POSTINGS else FULL_SCAN_POSTINGS
+
+    def _in_ranges(self, tokens, ranges):
+        hit = np.zeros(len(tokens), dtype=bool)
+        for lo, hi in ranges:
+            hit |= (tokens >= lo) & (tokens < hi)
+        return hit
+
+    def _matches_all(self, candidates, other_ranges):
+        """Mask of the candidates whose names also match every other query word"""
+        matches = np.ones(len(candidates), dtype=bool)
+        owners = tokens = None
+        for ranges in other_ranges:
+            if self._posting_count(ranges) <= 4 * len(candidates):
+                # Marking a word's names costs less than scanning every candidate's few words
+                marked = np.zeros(len(self.name_lengths), dtype=bool)
+                for lo, hi in ranges:
+                    marked[self.postings[self.posting_offsets[lo]:self.posting_offsets[hi]]] = True
+                matches &= marked[candidates]
+                continue
+            if tokens is None:
+                starts = self.name_token_offsets[candidates]
+                counts = self.name_token_offsets[candidates + 1] - starts
+                owners = np.repeat(np.arange(len(candidates)), counts)
+                tokens = self.name_tokens[np.repeat(starts - np.cumsum(counts) + counts, counts)
+                                          + np.arange(counts.sum())]
+            matches &= np.bincount(owners[self._in_ranges(tokens, ranges)], minlength=len(candidates)) > 0
+        return matches
+
+    def search(self, query, k=10):
+        """Ids of the top-k foods whose words start with every query word (typos tolerated)"""
+        return self.ranked(query, k)[1].tolist()
+
+    def ranked(self, query, k=10, exact=()):
+        """Rank keys and ids of the top-k matches, best first; words in exact get no typo fallback"""
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+        terms = tokenize(query)
+        if not terms:
+            return empty
+        ranges = [self._term_ranges(term, fuzzy=term not in exact) for term in terms]
+        if not all(ranges):
+            return empty
+
+        # Start from the most selective word and filter by the others
+        base = min(range(len(terms)), key=lambda index: self._posting_count(ranges[index]))
+        others = [term_ranges for index, term_ranges in enumerate(ranges) if index != base]
+        if others:
+            candidates = self._filtered_candidates(terms[base], ranges[base], others, k)
+        else:
+            candidates = self._candidates(terms[base], ranges[base], RANK_LIMIT)
+        if not len(candidates):
+            return empty
+
+        # Names whose first word matches the first query word come first, then shorter names;
+        # both go into one int64 sort key alongside the candidate position
+        leading = self._in_ranges(self.name_tokens[self.name_token_offsets[candidates]], ranges[0])
+        keys = ((~leading).astype(np.int64) << 52) | (self.name_lengths[candidates].astype(np.int64) << 32) | candidates
+        if len(keys) > k:
+            keys = np.partition(keys, k)[:k]
+        keys.sort()
+        return keys >> 32, self.ids[keys & 0xFFFFFFFF]
+
+
+class ExtendedSearchIndex:
+    """A built index plus a small one over the names appended since, ranked together per query"""
+
+    def __init__(self, base, added):
+        self.base = base
+        self.added = added
+
+    def __len__(self):
+        return len(self.base) + len(self.added)
+
+    def search(self, query, k=10):
+        """Same results as one index over both parts, except that typo matches are picked per part"""
+        # A word that starts some name in either part must not fall back to typo matches in the other
+        exact = {term for term in tokenize(query) if self.base.has_prefix(term) or self.added.has_prefix(term)}
+        base_keys, base_ids = self.base.ranked(query, k, exact)
+        added_keys, added_ids = self.added.ranked(query, k, exact)
+        # Appended names come after the base ones on equal keys, as their positions would in one index
+        order = np.argsort(np.concatenate([base_keys, added_keys]), kind="stable")[:k]
+        return np.concatenate([base_ids, added_ids])[order].tolist()
+
+
+# Per catalog (held weakly, so a dropped catalog takes its indexes with it): category ->
+# (catalog length when built, index, catalog length of the base index, base index)
+_indexes = weakref.WeakKeyDictionary()
+_indexes_lock = threading.Lock()
+
+
+def search_index(catalog, category=None):
+    """Search index for a catalog (or one category), built on first use. Foods added later (recipes)
+    go into a small second index, rebuilt on each addition, until there are more than
+    ADDED_INDEX_LIMIT of them and everything is indexed again at once"""
+    with _indexes_lock, catalog.lock:
+        indexes = _indexes.setdefault(catalog, {})
+        entry = indexes.get(category)
+        # Foods are only ever appended, so the catalog's length tells whether names were added
+        if entry is not None and entry[0] == len(catalog):
+            return entry[1]
+        if entry is None or len(catalog) - entry[2] > ADDED_INDEX_LIMIT:
+            index = FoodSearchIndex.from_catalog(catalog, category)
+            indexes[category] = (len(catalog), index, len(catalog), index)
+            return index
+
+        base_count, base = entry[2], entry[3]
+        added = FoodSearchIndex.from_catalog(catalog, category, start=base_count)
+        index = ExtendedSearchIndex(base, added) if len(added) else base
+        indexes[category] = (len(catalog), index, base_count, base)
+        return index
@@ -0,0 +1,296 @@
+"""Grocery lists: total grams of every food across many meal plans, rolled up to packages
+
+Usage: python planner.py grocery PLAN [PLAN ...] [--roster] [--packages FILE] [--workers N] [--output FILE]
+
+PLAN files are plan exports in export.PLAN_SCHEMA (.csv, .parquet, .arrow or a .zip
+bundle), such as the output of 'python planner.py batch'; with --roster they are rosters
+that are planned on the fly instead, without writing the plan rows anywhere. Plans stream
+through a group-by on food one record batch at a time, so memory grows with the number
+of distinct foods rather than the number of meal items. Each worker process aggregates
+its own row groups or roster chunks and sends back only its GroceryTotals, which merge
+by adding.
+
+The shopping list expands recipes into their ingredients and rounds each food up to
+whole packages. PACKAGES gives package sizes and prices of the built-in foods; a JSON
+file of food -> {"package_g": ..., "price": ...} passed with --packages adds or overrides
+entries. Foods without a package are listed by weight only and left out of the cost.
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.ipc as pa_ipc
+import pyarrow.parquet as pq
+
+from batch import MAX_ERROR_SAMPLE, plan_chunk, read_roster
+from export import TableWriter
+from planner import FOOD_CATALOG, RECIPE_BOOK
+
+# Package size (g) and price of the built-in foods. Sizes are in the weight the planner
+# uses, so a cooked food's package is the cooked weight one bag of it makes.
+PACKAGES = {
+    "Chicken Breast (skinless)": {"package_g": 1000, "price": 11.0},
+    "Ground Beef (lean)": {"package_g": 500, "price": 6.5},
+    "Salmon": {"package_g": 500, "price": 12.0},
+    "Tuna (canned)": {"package_g": 142, "price": 1.5},
+    "Turkey Breast": {"package_g": 500, "price": 7.0},
+    "Egg (whole)": {"package_g": 600, "price": 4.0},
+    "Egg Whites": {"package_g": 454, "price": 3.5},
+    "Greek Yogurt": {"package_g": 907, "price": 6.0},
+    "Cottage Cheese": {"package_g": 454, "price": 3.5},
+    "White Rice (cooked)": {"package_g": 3000, "price": 3.0},
+    "Brown Rice (cooked)": {"package_g": 2500, "price": 3.5},
+    "Quinoa (cooked)": {"package_g": 2700, "price": 9.0},
+    "Oats": {"package_g": 1000, "price": 3.5},
+    "Pasta (cooked)": {"package_g": 1100, "price": 1.8},
+    "Sweet Potato (cooked)": {"package_g": 1000, "price": 2.5},
+    "Potato (cooked)": {"package_g": 2000, "price": 3.0},
+    "Bread (whole wheat)": {"package_g": 600, "price": 3.5},
+    "Broccoli": {"package_g": 500, "price": 2.5},
+    "Spinach": {"package_g": 300, "price": 3.0},
+    "Kale": {"package_g": 300, "price": 3.0},
+    "Mixed Vegetables": {"package_g": 1000, "price": 3.5},
+    "Avocado": {"package_g": 600, "price": 4.0},
+    "Olive Oil": {"package_g": 920, "price": 9.0},
+    "Almonds": {"package_g": 454, "price": 6.0},
+    "Peanut Butter": {"package_g": 454, "price": 3.5}
+}
+
+GROCERY_SCHEMA = pa.schema([
+    ("food", pa.string()),
+    ("category", pa.string()),
+    ("amount_g", pa.float64()),
+    ("items", pa.int64()),
+    ("package_g", pa.float64()),
+    ("packages", pa.int64()),
+    ("cost", pa.float64())
+])
+
+READ_BATCH_ROWS = 65536  # Rows per record batch read from CSV and Parquet plans
+
+
+class GroceryTotals:
+    """Grams and meal item count per food name; partial totals merge by adding"""
+
+    def __init__(self):
+        self.grams = {}
+        self.items = {}
+
+    def __len__(self):
+        return len(self.grams)
+
+    def _add(self, names, grams, items):
+        for name, amount, count in zip(names, grams.tolist(), items.tolist()):
+            if count:
+                self.grams[name] = self.grams.get(name, 0.0) + amount
+                self.items[name] = self.items.get(name, 0) + count
+
+    def add_batch(self, record_batch):
+        """Add a record batch with food and amount_g columns"""
+        food = record_batch.column("food")
+        amounts = record_batch.column("amount_g")
+        if food.null_count or amounts.null_count:
+            valid = pc.and_(pc.is_valid(food), pc.is_valid(amounts))
+            food, amounts = food.filter(valid), amounts.filter(valid)
+        # Hash the names once per batch; the sums are then a bincount over dictionary codes
+        if not pa.types.is_dictionary(food.type):
+            food = pc.dictionary_encode(food)
+        codes = food.indices.to_numpy(zero_copy_only=False)
+        size = len(food.dictionary)
+        self._add(food.dictionary.to_pylist(),
+                  np.bincount(codes, weights=amounts.to_numpy(zero_copy_only=False), minlength=size),
+                  np.bincount(codes, minlength=size))
+
+    def add_food_ids(self, food_ids, amounts):
+        """Add catalog food ids with their grams (the batch planner's columns)"""
+        food_ids, codes = np.unique(np.asarray(food_ids), return_inverse=True)
+        self._add([FOOD_CATALOG.name_of(int(food)) for food in food_ids],
+                  np.bincount(codes, weights=np.asarray(amounts, dtype=np.float64), minlength=len(food_ids)),
+                  np.bincount(codes, minlength=len(food_ids)))
+
+    def add_meal_items(self, meal_items):
+        """Add the meal items of calculate_portions"""
+        for item in meal_items:
+            self.grams[item["Food"]] = self.grams.get(item["Food"], 0.0) + item["Amount (g)"]
+            self.items[item["Food"]] = self.items.get(item["Food"], 0) + 1
+
+    def merge(self, other):
+        """Add another partial total into this one; returns self"""
+        for name, amount in other.grams.items():
+            self.grams[name] = self.grams.get(name, 0.0) + amount
+            self.items[name] = self.items.get(name, 0) + other.items[name]
+        return self
+
+    def ingredients(self):
+        """(grams, items) per food with recipes replaced by the ingredients they are made of"""
+        grams, items = {}, {}
+
+        def add(name, amount, count):
+            if name in RECIPE_BOOK:
+                for food, food_amount in RECIPE_BOOK.ingredients_of(name, amount).items():
+                    add(food, food_amount, count)
+                return
+            grams[name] = grams.get(name, 0.0) + amount
+            items[name] = items.get(name, 0) + count
+
+        for name, amount in self.grams.items():
+            add(name, amount, self.items[name])
+        return grams, items
+
+    def shopping_list(self, packages=None, expand_recipes=True):
+        """Rows of GROCERY_SCHEMA, by category and then most grams first"""
+        packages = PACKAGES if packages is None else packages
+        grams, items = self.ingredients() if expand_recipes else (self.grams, self.items)
+        rows = []
+        for name, amount in grams.items():
+            package = packages.get(name)
+            category = FOOD_CATALOG.category_of(FOOD_CATALOG.id_of(name)) if name in FOOD_CATALOG else None
+            row = {"food": name, "category": category, "amount_g": amount, "items": items[name],
+                   "package_g": None, "packages": None, "cost": None}
+            if package:
+                row["package_g"] = float(package["package_g"])
+                row["packages"] = math.ceil(round(amount / package["package_g"], 9))
+                if package.get("price") is not None:
+                    row["cost"] = round(row["packages"] * package["price"], 2)
+            rows.append(row)
+        return sorted(rows, key=lambda row: (row["category"] or "~", -row["amount_g"], row["food"]))
+
+
+def read_packages(path):
+    """PACKAGES with the entries of a JSON package file added or overridden"""
+    with open(path) as f:
+        entries = json.load(f)
+    for name, package in entries.items():
+        if not isinstance(package, dict) or not isinstance(package.get("package_g"), (int, float)) \
+                or not package["package_g"] > 0:
+            raise ValueError(f"Package of '{name}' needs a positive package_g")
+    return dict(PACKAGES, **entries)
+
+
+def plan_parts(path, workers):
+    """Work units of a plan file: (path, part indices) with about 4 units per worker, where parts are
+    Parquet row groups or Arrow record batches (a CSV or bundle is one unit)"""
+    if path.endswith(".parquet"):
+        parts = pq.ParquetFile(path).num_row_groups
+    elif path.endswith((".arrow", ".feather")):
+        with pa_ipc.open_file(path) as reader:
+            parts = reader.num_record_batches
+    else:
+        return [(path, None)]
+    per_unit = max(1, -(-parts // (4 * workers)))
+    return [(path, list(range(start, min(start + per_unit, parts)))) for start in range(0, parts, per_unit)]
+
+
+def read_plan(path, parts=None):
+    """Stream the food and amount_g columns of a plan file (or of some of its parts) as record batches"""
+    columns = ["food", "amount_g"]
+    if path.endswith(".parquet"):
+        yield from pq.ParquetFile(path).iter_batches(batch_size=READ_BATCH_ROWS, row_groups=parts, columns=columns)
+    elif path.endswith((".arrow", ".feather")):
+        with pa_ipc.open_file(path) as reader:
+            for index in range(reader.num_record_batches) if parts is None else parts:
+                yield reader.get_batch(index).select(columns)
+    elif path.endswith(".zip"):
+        with zipfile.ZipFile(path) as bundle, bundle.open("plan.parquet") as member:
+            yield from pq.ParquetFile(member).iter_batches(batch_size=READ_BATCH_ROWS, columns=columns)
+    else:
+        yield from pa_csv.open_csv(path, read_options=pa_csv.ReadOptions(block_size=1 << 22),
+                                   convert_options=pa_csv.ConvertOptions(include_columns=columns))
+
+
+def plan_part_totals(path, parts=None):
+    """GroceryTotals of a plan file, or of some of its parts"""
+    totals = GroceryTotals()
+    for record_batch in read_plan(path, parts):
+        totals.add_batch(record_batch)
+    return totals, []
+
+
+def roster_chunk_totals(clients):
+    """Plan a chunk of roster rows and keep only their GroceryTotals"""
+    columns, _, errors = plan_chunk(clients)
+    totals = GroceryTotals()
+    if len(columns["client"]):
+        totals.add_food_ids(columns["food"], columns["amount_g"])
+    return totals, errors
+
+
+def aggregate(paths, roster=False, workers=None, chunk_size=5000):
+    """GroceryTotals of plan files (or of rosters planned on the fly), with skipped-row stats: the
+    number of skipped roster rows and the first MAX_ERROR_SAMPLE reasons"""
+    workers = workers or os.cpu_count() or 1
+    if roster:
+        tasks = ((roster_chunk_totals, chunk) for path in paths for chunk in read_roster(path, chunk_size))
+    else:
+        tasks = ((plan_part_totals, *unit) for path in paths for unit in plan_parts(path, workers))
+    totals, stats = GroceryTotals(), {"skipped": 0, "errors": []}
+
+    def collect(result):
+        partial, errors = result
+        totals.merge(partial)
+        stats["skipped"] += len(errors)
+        stats["errors"] += errors[:MAX_ERROR_SAMPLE - len(stats["errors"])]
+
+    if workers == 1:
+        for function, *args in tasks:
+            collect(function(*args))
+    else:
+        # Bounded number of units in flight, as in the batch planner
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            in_flight = deque()
+            for function, *args in tasks:
+                in_flight.append(pool.submit(function, *args))
+                if len(in_flight) >= 2 * workers:
+                    collect(in_flight.popleft().result())
+            while in_flight:
+                collect(in_flight.popleft().result())
+    return totals, stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="planner grocery", description="Shopping list for many meal plans")
+    parser.add_argument("plans", nargs="+", help="plan files (.csv, .parquet, .arrow or .zip bundle)")
+    parser.add_argument("--roster", action="store_true", help="the files are rosters to plan, as for batch")
+    parser.add_argument("--packages", help="JSON file of food -> {package_g, price} adding to the built-in sizes")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="roster rows per work chunk")
+    parser.add_argument("--no-expand-recipes", action="store_true", help="list recipes instead of their ingredients")
+    parser.add_argument("--output", help="write the list to a .csv, .parquet or .arrow file")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    packages = read_packages(args.packages) if args.packages else PACKAGES
+    totals, stats = aggregate(args.plans, roster=args.roster, workers=args.workers, chunk_size=args.chunk_size)
+    rows = totals.shopping_list(packages, expand_recipes=not args.no_expand_recipes)
+    elapsed = time.perf_counter() - start
+
+    for error in stats["errors"]:
+        print(f"skipped {error}", file=sys.stderr)
+    if stats["skipped"] > len(stats["errors"]):
+        print(f"... and {stats['skipped'] - len(stats['errors'])} more skipped rows", file=sys.stderr)
+    if args.output:
+        writer = TableWriter(args.output, GROCERY_SCHEMA)
+        writer.write(pa.RecordBatch.from_pylist(rows, schema=GROCERY_SCHEMA))
+        writer.close()
+    else:
+        for row in rows:
+            packs = f"{row['packages']} x {row['package_g']:g}g" if row["packages"] is not None else ""
+            cost = f"{row['cost']:.2f}" if row["cost"] is not None else ""
+            print(f"{row['food']:<28} {row['amount_g'] / 1000:10.2f} kg  {packs:>16}  {cost:>10}")
+    items = sum(totals.items.values())
+    cost = sum(row["cost"] for row in rows if row["cost"] is not None)
+    unpriced = sum(row["cost"] is None for row in rows)
+    print(f"{len(rows)} foods from {items} meal items, estimated cost {cost:.2f}"
+          + (f" ({unpriced} foods without a price)" if unpriced else "")
+          + f" in {elapsed:.1f}s" + (f" -> {args.output}" if args.output else ""), file=sys.stderr)
+    return 1 if stats["skipped"] else 0
@@ -0,0 +1,183 @@
+"""Timing spans, rolling per-stage latency percentiles and an opt-in sampling profiler
+
+Wrap a hot-path stage in span("stage") (or decorate it with timed("stage")): its duration
+goes into METRICS, which keeps the last STAGE_WINDOW durations of every stage for rolling
+p50/p99, shared by every session and request in the process. A span given a counts dict
+(the app passes one per session) counts each stage it and its nested spans run.
+
+Set MACROCOUNTER_PROFILE to a file path to sample, every few milliseconds, the stacks of
+threads that are inside a span; the samples are written there as collapsed stacks (one
+"stage;file:function;... count" line per stack, as flamegraph.pl and speedscope read
+them) when the process exits.
+"""
+import atexit
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from functools import lru_cache, wraps
+
+import numpy as np
+
+STAGE_WINDOW = 2000  # Durations kept per stage for the rolling percentiles
+PROFILE_INTERVAL = 0.005  # Seconds between profiler samples
+PROFILE_MAX_DEPTH = 128  # Innermost frames kept per sampled stack
+
+# Stage stack and session counts of every thread currently inside a span
+_ACTIVE = {}
+
+
+class StageStats:
+    """Rolling duration percentiles and call counts for one stage"""
+
+    def __init__(self, window=STAGE_WINDOW):
+        self.durations = deque(maxlen=window)
+        self.calls = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+
+    def add(self, seconds, failed=False):
+        self.durations.append(seconds)
+        self.calls += 1
+        self.errors += failed
+        self.total_seconds += seconds
+
+    def snapshot(self):
+        durations = np.array(self.durations) * 1000
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "p50_ms": float(np.percentile(durations, 50)) if len(durations) else None,
+            "p99_ms": float(np.percentile(durations, 99)) if len(durations) else None,
+            "total_ms": self.total_seconds * 1000
+        }
+
+
+class Metrics:
+    """StageStats for every stage that has run in this process, safe to share between threads"""
+
+    def __init__(self, window=STAGE_WINDOW):
+        self.window = window
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds, failed=False):
+        with self._lock:
+            stats = self.stages.get(stage)
+            if stats is None:
+                stats = self.stages[stage] = StageStats(self.window)
+            stats.add(seconds, failed)
+
+    def snapshot(self):
+        """{stage: {calls, errors, p50_ms, p99_ms, total_ms}}, stages in name order"""
+        with self._lock:
+            return {stage: self.stages[stage].snapshot() for stage in sorted(self.stages)}
+
+    def clear(self):
+        with self._lock:
+            self.stages.clear()
+
+
+METRICS = Metrics()
+
+
+@contextmanager
+def span(stage, counts=None, metrics=METRICS):
+    """Time the enclosed block as one run of stage
+
+    counts, a dict of stage -> runs, is incremented for this stage; nested spans without
+    their own counts add to the enclosing span's.
+    """
+    thread = threading.get_ident()
+    stack = _ACTIVE.setdefault(thread, [])
+    if counts is None and stack:
+        counts = stack[-1][1]
+    stack.append((stage, counts))
+    failed = False
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        failed = True
+        raise
+    finally:
+        metrics.record(stage, time.perf_counter() - start, failed)
+        stack.pop()
+        if not stack:
+            _ACTIVE.pop(thread, None)
+        if counts is not None:
+            counts[stage] = counts.get(stage, 0) + 1
+
+
+def timed(stage):
+    """Decorator running every call of a function in span(stage)"""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _frame_name(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class SamplingProfiler:
+    """Background thread sampling the stacks of threads inside a span, counted as collapsed stacks"""
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="macrocounter-profiler", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread, stack in list(_ACTIVE.items()):
+                frame = frames.get(thread)
+                stages = [stage for stage, _ in list(stack)]
+                if frame is None or not stages:
+                    continue
+                names = []
+                while frame is not None and len(names) < PROFILE_MAX_DEPTH:
+                    names.append(_frame_name(frame.f_code))
+                    frame = frame.f_back
+                # The stages come first, so a flame graph groups each stage's time together
+                self.samples[";".join(stages + names[::-1])] += 1
+
+    def collapsed(self):
+        """Collapsed stack lines, most sampled first"""
+        return [f"{stack} {count}" for stack, count in self.samples.most_common()]
+
+    def write(self, path):
+        with open(path, "w") as f:
+            f.writelines(line + "\n" for line in self.collapsed())
+
+
+@lru_cache(maxsize=None)
+def profiler_from_env():
+    """The process's profiler when MACROCOUNTER_PROFILE is set (written there at exit), else None"""
+    path = os.environ.get("MACROCOUNTER_PROFILE")
+    if not path:
+        return None
+    profiler = SamplingProfiler().start()
+    atexit.register(profiler.write, path)
+    return profiler
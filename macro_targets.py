@@ -0,0 +1,294 @@
+"""Daily macro targets from MakeMeal, cached and shared by every Streamlit session
+
+Streamlit re-runs macrocounter.py on every interaction, but imported modules stay
+loaded, so the cache below lives as long as the server process.
+
+The whole input domain (weight x goal x activity_level at the standard splits) can be
+compiled ahead of time with 'python planner.py build-macro-table [TARGET]'. The
+table is a plain .npy file that every process memory-maps at startup, so on-table
+targets are one array lookup (or one gather for a whole batch) and fitness_tools is
+only imported for inputs outside the table.
+"""
+import os
+import threading
+from functools import lru_cache
+
+import cachetools
+import numpy as np
+
+# Input domain offered by the macro calculator
+MIN_WEIGHT = 50
+MAX_WEIGHT = 500
+GOALS = ("weight_loss", "weight_gain", "maintenance")
+ACTIVITY_LEVELS = ("sedentary", "moderate", "very")
+
+# Layout of the flat value tuples: min/max/avg for each nutrient
+MACRO_KEYS = ("calories", "protein", "carbs", "fat")
+STAT_KEYS = ("min", "max", "avg")
+
+
+# Standard macro split (share of calories from protein, carbs and fat) and MakeMeal's
+# body type presets, which replace the split when a body type is chosen
+SPLIT_KEYS = ("protein", "carbs", "fat")
+DEFAULT_SPLIT = (0.40, 0.30, 0.30)
+BODY_TYPE_SPLITS = {
+    "mesomorph": (0.30, 0.40, 0.30),
+    "ectomorph": (0.25, 0.55, 0.20),
+    "endomorph": (0.35, 0.25, 0.40)
+}
+CALORIES_PER_GRAM = (4, 4, 9)
+
+# Shape of the precomputed table: weight, goal, activity level, flat macro values
+MACRO_TABLE_SHAPE = (MAX_WEIGHT - MIN_WEIGHT + 1, len(GOALS), len(ACTIVITY_LEVELS), len(MACRO_KEYS) * len(STAT_KEYS))
+
+
+def compute_macro_values(weight, goal, activity_level):
+    """Min, max and avg calories, protein, carbs and fat from MakeMeal as a flat tuple"""
+    # Imported here so processes that only read the precomputed table never load it
+    from fitness_tools.meals.meal_maker import MakeMeal
+
+    meal_obj = MakeMeal(
+        weight=weight,
+        goal=goal,
+        activity_level=activity_level,
+        body_type=None,
+        fat_percent=0.30,
+        protein_percent=0.40,
+        carb_percent=0.30
+    )
+
+    min_cals = meal_obj.daily_min_calories()
+    max_cals = meal_obj.daily_max_calories()
+    min_protein = meal_obj.daily_min_protein()
+    max_protein = meal_obj.daily_max_protein()
+    min_carbs = meal_obj.daily_min_carbs()
+    max_carbs = meal_obj.daily_max_carbs()
+    min_fat = meal_obj.daily_min_fat()
+    max_fat = meal_obj.daily_max_fat()
+
+    return (
+        min_cals, max_cals, (min_cals + max_cals) / 2,
+        min_protein, max_protein, (min_protein + max_protein) / 2,
+        min_carbs, max_carbs, (min_carbs + max_carbs) / 2,
+        min_fat, max_fat, (min_fat + max_fat) / 2
+    )
+
+
+def macro_values(weight, goal, activity_level, split=None, body_type=None):
+    """Flat macro values for any split or body type; the standard split comes from MACRO_CACHE"""
+    if body_type is not None:
+        if body_type not in BODY_TYPE_SPLITS:
+            raise ValueError(f"Body type must be one of {', '.join(BODY_TYPE_SPLITS)}")
+        split = BODY_TYPE_SPLITS[body_type]
+    if split is None or tuple(split) == DEFAULT_SPLIT:
+        return MACRO_CACHE.get(weight, goal, activity_level)
+    if goal not in GOALS or activity_level not in ACTIVITY_LEVELS:
+        raise ValueError(f"Goal must be one of {', '.join(GOALS)} and activity level one of "
+                         f"{', '.join(ACTIVITY_LEVELS)}")
+    values = sweep_macro_values(weight, goal, activity_level, *split).tolist()
+    # Whole calories as int, like MakeMeal returns them for an int weight
+    values[0], values[1] = int(values[0]), int(values[1])
+    return tuple(values)
+
+
+def macro_dict(values):
+    """Nest a flat tuple of macro values the way calculate_macros returns them"""
+    values = iter(values)
+    return {macro: {stat: next(values) for stat in STAT_KEYS} for macro in MACRO_KEYS}
+
+
+@lru_cache(maxsize=None)
+def calories_per_pound(goal, activity_level):
+    """MakeMeal's daily (min, max) calories per pound of body weight for a goal and activity level"""
+    from fitness_tools.meals.meal_maker import MakeMeal
+
+    meal_obj = MakeMeal(weight=1, goal=goal, activity_level=activity_level, fat_percent=0.30,
+                        protein_percent=0.40, carb_percent=0.30)
+    return meal_obj.min_cal, meal_obj.max_cal
+
+
+def _codes(values, allowed, name):
+    """Index of each value in allowed, as an array shaped like values"""
+    values = np.asarray(values, dtype=object)
+    unknown = set(values.ravel().tolist()) - set(allowed)
+    if unknown:
+        raise ValueError(f"{name} must be one of {', '.join(allowed)}")
+    return np.array([allowed.index(value) for value in values.ravel().tolist()], dtype=np.intp).reshape(values.shape)
+
+
+def sweep_macro_values(weights, goals, activity_levels, protein_percent, carbs_percent, fat_percent):
+    """Flat macro values for whole grids of inputs in one vectorized call
+
+    Every argument may be a scalar or an array; they broadcast together and the result
+    has their broadcast shape plus a last axis of the 12 flat values. The arithmetic and
+    rounding are MakeMeal's, so standard-split values equal compute_macro_values().
+    """
+    weights = np.asarray(weights)
+    if not np.issubdtype(weights.dtype, np.integer) or (weights <= 0).any():
+        raise ValueError("Weights must be positive whole numbers")
+    splits = np.stack(np.broadcast_arrays(*(np.asarray(percent, dtype=np.float64) for percent in
+                                            (protein_percent, carbs_percent, fat_percent))), axis=-1)
+    if (splits < 0).any() or not np.allclose(splits.sum(axis=-1), 1):
+        raise ValueError("Protein, carb and fat percentages must be non-negative and add up to 100%")
+
+    # Calories per pound looked up by goal and activity code, before broadcasting
+    per_pound_table = np.array([[calories_per_pound(goal, activity_level) for activity_level in ACTIVITY_LEVELS]
+                                for goal in GOALS], dtype=np.float64)
+    per_pound = per_pound_table[_codes(goals, GOALS, "Goal"), _codes(activity_levels, ACTIVITY_LEVELS, "Activity level")]
+
+    calories = np.round(weights[..., None] * per_pound)
+    shape = np.broadcast_shapes(calories.shape[:-1], splits.shape[:-1])
+    calories = np.broadcast_to(calories, shape + (2,))
+    splits = np.broadcast_to(splits, shape + (3,))
+    grams = np.round(calories[..., None, :] * splits[..., :, None] / np.array(CALORIES_PER_GRAM)[:, None])
+    ranges = np.concatenate([calories[..., None, :], grams], axis=-2)
+    return np.concatenate([ranges, ranges.mean(axis=-1, keepdims=True)], axis=-1).reshape(shape + (12,))
+
+
+def split_grid(step=5, minimum=5):
+    """Every (protein, carbs, fat) split in step-percent increments with each share at least minimum percent"""
+    percents = np.arange(minimum, 101, step)
+    protein, carbs = np.meshgrid(percents, percents, indexing="ij")
+    fat = 100 - protein - carbs
+    keep = fat >= minimum
+    return protein[keep] / 100, carbs[keep] / 100, fat[keep] / 100
+
+
+def compute_macro_table():
+    """Every (weight, goal, activity_level) in the calculator's domain as one MACRO_TABLE_SHAPE array"""
+    table = sweep_macro_values(np.arange(MIN_WEIGHT, MAX_WEIGHT + 1)[:, None, None],
+                               np.array(GOALS, dtype=object)[None, :, None],
+                               np.array(ACTIVITY_LEVELS, dtype=object)[None, None, :], *DEFAULT_SPLIT)
+    # MakeMeal's values are whole or half numbers, which float32 holds exactly at half the size
+    compact = table.astype(np.float32)
+    return compact if np.array_equal(compact, table) else table
+
+
+def load_macro_table(path):
+    """Memory-map a table written by build-macro-table"""
+    table = np.load(path, mmap_mode="r")
+    if table.shape != MACRO_TABLE_SHAPE:
+        raise ValueError(f"{path} was built for a different weight/goal/activity domain")
+    return table
+
+
+class MacroTargetCache:
+    """Thread-safe LRU (or TTL) cache of macro targets with an optional precomputed table"""
+
+    def __init__(self, maxsize=4096, ttl=None, precompute=False, table_path=None):
+        if ttl:
+            self._cache = cachetools.TTLCache(maxsize=maxsize, ttl=ttl)
+        else:
+            self._cache = cachetools.LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._table = None
+        self.hits = 0
+        self.misses = 0
+        self.table_hits = 0
+        if table_path and os.path.exists(table_path):
+            self._table = load_macro_table(table_path)
+        elif precompute:
+            self.precompute()
+
+    def precompute(self):
+        """Compute every (weight, goal, activity_level) in the calculator's domain into one array"""
+        self._table = compute_macro_table()
+
+    def _table_values(self, weight, goal, activity_level):
+        """Values from the precomputed table, or None when the inputs are off-table"""
+        if (self._table is None or not isinstance(weight, int) or not MIN_WEIGHT <= weight <= MAX_WEIGHT
+                or goal not in GOALS or activity_level not in ACTIVITY_LEVELS):
+            return None
+        values = self._table[weight - MIN_WEIGHT, GOALS.index(goal), ACTIVITY_LEVELS.index(activity_level)].tolist()
+        # MakeMeal returns whole calories as int for an int weight
+        values[0], values[1] = int(values[0]), int(values[1])
+        return tuple(values)
+
+    def get(self, weight, goal, activity_level):
+        """Flat macro values for the inputs, computing and caching them on a miss"""
+        values = self._table_values(weight, goal, activity_level)
+        key = (weight, goal, activity_level)
+        with self._lock:
+            if values is not None:
+                self.hits += 1
+                self.table_hits += 1
+                return values
+            values = self._cache.get(key)
+            if values is not None:
+                self.hits += 1
+                return values
+            self.misses += 1
+
+        # Computed outside the lock so a slow miss does not block other sessions
+        values = compute_macro_values(weight, goal, activity_level)
+        with self._lock:
+            self._cache[key] = values
+        return values
+
+    def get_many(self, weights, goals, activity_levels):
+        """Flat macro values for many inputs as an (n, 12) float64 array; on-table rows come
+        from one gather, the rest from get()"""
+        weights = np.asarray(weights, dtype=np.int64)
+        goals, activity_levels = list(goals), list(activity_levels)
+        values = np.empty((len(weights), MACRO_TABLE_SHAPE[-1]), dtype=np.float64)
+        on_table = np.zeros(len(weights), dtype=bool)
+        if self._table is not None:
+            goal_codes = np.array([GOALS.index(goal) if goal in GOALS else -1 for goal in goals], dtype=np.intp)
+            activity_codes = np.array([ACTIVITY_LEVELS.index(level) if level in ACTIVITY_LEVELS else -1
+                                       for level in activity_levels], dtype=np.intp)
+            on_table = (weights >= MIN_WEIGHT) & (weights <= MAX_WEIGHT) & (goal_codes >= 0) & (activity_codes >= 0)
+            values[on_table] = self._table[weights[on_table] - MIN_WEIGHT, goal_codes[on_table],
+                                           activity_codes[on_table]]
+            with self._lock:
+                self.hits += int(on_table.sum())
+                self.table_hits += int(on_table.sum())
+        for index in np.flatnonzero(~on_table).tolist():
+            values[index] = self.get(int(weights[index]), goals[index], activity_levels[index])
+        return values
+
+    def stats(self):
+        """Hit/miss counters and sizes, for checking the cache under real traffic"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "table_hits": self.table_hits,
+                "size": len(self._cache),
+                "maxsize": self._cache.maxsize,
+                "precomputed": self._table is not None
+            }
+
+    def clear(self):
+        """Drop cached entries and reset the counters (the precomputed table is kept)"""
+        with self._lock:
+            self._cache.clear()
+            self.hits = self.misses = self.table_hits = 0
+
+
+def build_macro_table(argv=None):
+    """Compile every macro target in the calculator's domain into a memory-mappable .npy table"""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="planner build-macro-table", description=build_macro_table.__doc__)
+    parser.add_argument("target", nargs="?", default=MACRO_TABLE_PATH, help=f"output file (default {MACRO_TABLE_PATH})")
+    args = parser.parse_args(argv)
+
+    table = compute_macro_table()
+    np.save(args.target, table)
+    print(f"Compiled {np.prod(table.shape[:3])} macro targets ({table.dtype}, {table.nbytes // 1024} KiB) "
+          f"into {args.target}")
+    return 0
+
+
+# Table memory-mapped at startup when it exists; MACROCOUNTER_MACRO_TABLE points elsewhere
+MACRO_TABLE_PATH = os.environ.get("MACROCOUNTER_MACRO_TABLE") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "macro_table.npy")
+
+# Shared by every session in this process; without a compiled table set
+# MACROCOUNTER_PRECOMPUTE_MACROS=1 to build it in memory at startup, and
+# MACROCOUNTER_MACRO_CACHE_TTL (seconds) to expire entries
+MACRO_CACHE = MacroTargetCache(
+    ttl=float(os.environ.get("MACROCOUNTER_MACRO_CACHE_TTL", 0)) or None,
+    precompute=os.environ.get("MACROCOUNTER_PRECOMPUTE_MACROS", "") not in ("", "0"),
+    table_path=MACRO_TABLE_PATH
+)
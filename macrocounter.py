@@ -1,246 +1,123 @@
-import streamlit as st
-import fitness_tools
-from fitness_tools.meals.meal_maker import MakeMeal
-import pandas as pd
-import numpy as np
-
-# Food nutrition data per 100g
-FOOD_DATA = {
-    "Chicken Breast (skinless)": {"calories": 165, "protein": 31, "carbs": 0, "fat": 3.6},
-    "Ground Beef (lean)": {"calories": 250, "protein": 26, "carbs": 0, "fat": 15},
-    "Salmon": {"calories": 206, "protein": 22, "carbs": 0, "fat": 13},
-    "Tuna (canned)": {"calories": 116, "protein": 25, "carbs": 0, "fat": 1},
-    "Turkey Breast": {"calories": 157, "protein": 29, "carbs": 0, "fat": 4},
-    "Egg (whole)": {"calories": 143, "protein": 13, "carbs": 1, "fat": 10},
-    "Egg Whites": {"calories": 52, "protein": 11, "carbs": 1, "fat": 0},
-    "Greek Yogurt": {"calories": 59, "protein": 10, "carbs": 3.6, "fat": 0.4},
-    "Cottage Cheese": {"calories": 98, "protein": 11, "carbs": 3.4, "fat": 4.3},
-    "White Rice (cooked)": {"calories": 130, "protein": 2.7, "carbs": 28, "fat": 0.3},
-    "Brown Rice (cooked)": {"calories": 112, "protein": 2.6, "carbs": 23, "fat": 0.9},
-    "Quinoa (cooked)": {"calories": 120, "protein": 4.4, "carbs": 21, "fat": 1.9},
-    "Oats": {"calories": 389, "protein": 16.9, "carbs": 66, "fat": 6.9},
-    "Pasta (cooked)": {"calories": 158, "protein": 5.8, "carbs": 31, "fat": 0.9},
-    "Sweet Potato (cooked)": {"calories": 86, "protein": 1.6, "carbs": 20, "fat": 0.1},
-    "Potato (cooked)": {"calories": 86, "protein": 1.8, "carbs": 20, "fat": 0.1},
-    "Bread (whole wheat)": {"calories": 247, "protein": 13, "carbs": 41, "fat": 3.4},
-    "Broccoli": {"calories": 34, "protein": 2.8, "carbs": 7, "fat": 0.4},
-    "Spinach": {"calories": 23, "protein": 2.9, "carbs": 3.6, "fat": 0.4},
-    "Kale": {"calories": 49, "protein": 4.3, "carbs": 8.8, "fat": 0.9},
-    "Mixed Vegetables": {"calories": 65, "protein": 2.6, "carbs": 13, "fat": 0.6},
-    "Avocado": {"calories": 160, "protein": 2, "carbs": 8.5, "fat": 14.7},
-    "Olive Oil": {"calories": 884, "protein": 0, "carbs": 0, "fat": 100},
-    "Almonds": {"calories": 579, "protein": 21, "carbs": 22, "fat": 49},
-    "Peanut Butter": {"calories": 588, "protein": 25, "carbs": 20, "fat": 50}
-}
-
-# Initialize session state to store user selections
-if 'meal_data' not in st.session_state:
-    st.session_state.meal_data = {}
-
-if 'active_meal' not in st.session_state:
-    st.session_state.active_meal = 0
-
-if 'macro_data' not in st.session_state:
-    st.session_state.macro_data = None
+import copy
+import os
+import sys
+import time
 
+import pandas as pd
+import streamlit as st
 
-def calculate_portions(foods, protein_target, carbs_target, fat_target):
-    """Calculate food portions to meet macro targets"""
-    meal_items = []
-
-    # Track remaining macros to allocate
-    remaining_protein = protein_target
-    remaining_carbs = carbs_target
-    remaining_fat = fat_target
+import planner
+from client_store import open_store
+from food_db import MICRONUTRIENT_UNITS, nutrient_label
+from food_search import search_index
+from instrumentation import METRICS, profiler_from_env, span, timed
+from macro_targets import BODY_TYPE_SPLITS, split_grid, sweep_macro_values
+from planner import (CATEGORY_ORDER, FOOD_CATALOG, MACRO_COLUMNS, MEAL_COUNTS, RECIPE_BOOK, meal_targets,
+                     meal_totals, micronutrient_targets, micronutrient_totals, missing_categories, plan_day,
+                     solve_portions, suggest_meals)
 
-    # 1. First handle vegetables (usually fixed portions)
-    for veg in foods['vegetables']:
-        portion = 100  # Standard vegetable portion
+# Categories with more foods than this are picked through search (top SEARCH_RESULTS matches)
+SEARCH_THRESHOLD = 200
+SEARCH_RESULTS = 20
 
-        protein = FOOD_DATA[veg]["protein"] * portion / 100
-        carbs = FOOD_DATA[veg]["carbs"] * portion / 100
-        fat = FOOD_DATA[veg]["fat"] * portion / 100
-        calories = FOOD_DATA[veg]["calories"] * portion / 100
+# Food picker widget key prefix for each category
+SELECT_KEYS = {"proteins": "protein_select", "carbs": "carb_select", "vegetables": "veg_select", "fats": "fat_select"}
 
-        remaining_protein -= protein
-        remaining_carbs -= carbs
-        remaining_fat -= fat
+# Saved clients listed in the sidebar per name prefix
+CLIENT_LIST_LIMIT = 50
 
-        meal_items.append({
-            "Food": veg,
-            "Amount (g)": portion,
-            "Calories": calories,
-            "Protein (g)": protein,
-            "Carbs (g)": carbs,
-            "Fat (g)": fat
-        })
+# Rerun timings kept per session; set MACROCOUNTER_SHOW_TIMINGS=1 to show them, with the
+# per-stage percentiles of every session, in the app
+RERUN_TIMINGS = 50
+SHOW_RERUN_TIMINGS = os.environ.get("MACROCOUNTER_SHOW_TIMINGS", "") not in ("", "0")
 
-    # 2. Allocate fats
-    for fat_food in foods['fats']:
-        fat_per_100g = FOOD_DATA[fat_food]["fat"]
 
-        if fat_per_100g > 0:
-            portion = min((remaining_fat * 100) / fat_per_100g, 30)  # Cap at 30g for fats
-        else:
-            portion = 15  # Default small portion
-
-        protein = FOOD_DATA[fat_food]["protein"] * portion / 100
-        carbs = FOOD_DATA[fat_food]["carbs"] * portion / 100
-        fat = FOOD_DATA[fat_food]["fat"] * portion / 100
-        calories = FOOD_DATA[fat_food]["calories"] * portion / 100
-
-        remaining_protein -= protein
-        remaining_carbs -= carbs
-        remaining_fat -= fat
-
-        meal_items.append({
-            "Food": fat_food,
-            "Amount (g)": round(portion),
-            "Calories": round(calories),
-            "Protein (g)": round(protein, 1),
-            "Carbs (g)": round(carbs, 1),
-            "Fat (g)": round(fat, 1)
-        })
-
-    # 3. Allocate carbs
-    for carb_food in foods['carbs']:
-        carbs_per_100g = FOOD_DATA[carb_food]["carbs"]
-
-        if carbs_per_100g > 0:
-            # Set reasonable portion range based on food type
-            max_portion = 150 if carb_food in ["White Rice (cooked)", "Brown Rice (cooked)", "Pasta (cooked)"] else 100
-            min_portion = 50
-
-            # Calculate portion based on carb target
-            raw_portion = (remaining_carbs * 100) / carbs_per_100g
-            portion = max(min(raw_portion, max_portion), min_portion)
-        else:
-            portion = 50  # Default portion
-
-        protein = FOOD_DATA[carb_food]["protein"] * portion / 100
-        carbs = FOOD_DATA[carb_food]["carbs"] * portion / 100
-        fat = FOOD_DATA[carb_food]["fat"] * portion / 100
-        calories = FOOD_DATA[carb_food]["calories"] * portion / 100
-
-        remaining_protein -= protein
-        remaining_carbs -= carbs
-        remaining_fat -= fat
-
-        meal_items.append({
-            "Food": carb_food,
-            "Amount (g)": round(portion),
-            "Calories": round(calories),
-            "Protein (g)": round(protein, 1),
-            "Carbs (g)": round(carbs, 1),
-            "Fat (g)": round(fat, 1)
-        })
-
-    # 4. Allocate proteins
-    if foods['proteins']:
-        protein_per_food = remaining_protein / len(foods['proteins'])
-
-        for protein_food in foods['proteins']:
-            protein_per_100g = FOOD_DATA[protein_food]["protein"]
-
-            if protein_per_100g > 0:
-                # Calculate portion but set reasonable limits
-                raw_portion = (protein_per_food * 100) / protein_per_100g
-
-                # Special handling for different protein types
-                max_portion = 200 if protein_food in ["Chicken Breast (skinless)", "Turkey Breast"] else 150
-                min_portion = 30
-
-                portion = max(min(raw_portion, max_portion), min_portion)
-            else:
-                portion = 100  # Default portion
-
-            protein = FOOD_DATA[protein_food]["protein"] * portion / 100
-            carbs = FOOD_DATA[protein_food]["carbs"] * portion / 100
-            fat = FOOD_DATA[protein_food]["fat"] * portion / 100
-            calories = FOOD_DATA[protein_food]["calories"] * portion / 100
-
-            meal_items.append({
-                "Food": protein_food,
-                "Amount (g)": round(portion),
-                "Calories": round(calories),
-                "Protein (g)": round(protein, 1),
-                "Carbs (g)": round(carbs, 1),
-                "Fat (g)": round(fat, 1)
-            })
-
-    return meal_items
-
-
-def calculate_macros(weight, goal, activity_level):
-    """Calculate macros using MakeMeal with standard macro splits"""
+def calculate_macros(weight, goal, activity_level, split=None, body_type=None):
+    """planner.calculate_macros, showing errors in the app instead of raising them"""
     try:
-        # Create MakeMeal object with required parameters
-        meal_obj = MakeMeal(
-            weight=weight,
-            goal=goal,
-            activity_level=activity_level,
-            body_type=None,
-            fat_percent=0.30,
-            protein_percent=0.40,
-            carb_percent=0.30
-        )
-
-        # Calculate all values
-        min_cals = meal_obj.daily_min_calories()
-        max_cals = meal_obj.daily_max_calories()
-        avg_cals = (min_cals + max_cals) / 2
-
-        min_protein = meal_obj.daily_min_protein()
-        max_protein = meal_obj.daily_max_protein()
-        avg_protein = (min_protein + max_protein) / 2
-
-        min_carbs = meal_obj.daily_min_carbs()
-        max_carbs = meal_obj.daily_max_carbs()
-        avg_carbs = (min_carbs + max_carbs) / 2
-
-        min_fat = meal_obj.daily_min_fat()
-        max_fat = meal_obj.daily_max_fat()
-        avg_fat = (min_fat + max_fat) / 2
-
-        # Return the calculated data
-        return {
-            "calories": {
-                "min": min_cals,
-                "max": max_cals,
-                "avg": avg_cals
-            },
-            "protein": {
-                "min": min_protein,
-                "max": max_protein,
-                "avg": avg_protein
-            },
-            "carbs": {
-                "min": min_carbs,
-                "max": max_carbs,
-                "avg": avg_carbs
-            },
-            "fat": {
-                "min": min_fat,
-                "max": max_fat,
-                "avg": avg_fat
-            }
-        }
+        with span("calculate_macros"):
+            return planner.calculate_macros(weight, goal, activity_level, split=split, body_type=body_type)
     except Exception as e:
         st.error(f"An error occurred: {e}")
         return None
 
 
+def record_rerun(scope, started):
+    """Keep how long a page or fragment rerun took, in ms"""
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    timings = st.session_state.rerun_timings
+    timings.append((scope, elapsed_ms))
+    del timings[:-RERUN_TIMINGS]
+    return elapsed_ms
+
+
+def init_session_state():
+    """Per-session state, set up on the first run of each session"""
+    if 'meal_data' not in st.session_state:
+        st.session_state.meal_data = {}
+    if 'active_meal' not in st.session_state:
+        st.session_state.active_meal = 0
+    if 'macro_data' not in st.session_state:
+        st.session_state.macro_data = None
+    if 'meal_results' not in st.session_state:
+        st.session_state.meal_results = {}
+    if 'meal_suggestions' not in st.session_state:
+        st.session_state.meal_suggestions = {}
+    if 'rerun_timings' not in st.session_state:
+        st.session_state.rerun_timings = []
+    if 'stage_counts' not in st.session_state:
+        st.session_state.stage_counts = {}
+    if 'prepared_exports' not in st.session_state:
+        st.session_state.prepared_exports = {}
+
+
 def main():
+    started = time.perf_counter()
     st.set_page_config(page_title="Complete Fitness Meal Planner", layout="wide")
+    init_session_state()
+    profiler_from_env()
+    try:
+        planner.reload_recipes()
+    except (OSError, ValueError) as e:
+        st.sidebar.error(f"Recipe file not reloaded: {e}")
+
+    with span("page_rerun", st.session_state.stage_counts):
+        # App navigation
+        st.sidebar.title("Fitness Meal Planner")
+        app_mode = st.sidebar.radio("Select Mode", ["Calculate Macros", "Plan Meals", "Multi-Day Plan"])
+
+        if app_mode == "Calculate Macros":
+            macro_calculator()
+        elif app_mode == "Plan Meals":
+            meal_planner()
+        else:
+            multi_day_planner()
 
-    # App navigation
-    st.sidebar.title("Fitness Meal Planner")
-    app_mode = st.sidebar.radio("Select Mode", ["Calculate Macros", "Plan Meals"])
+    elapsed_ms = record_rerun("Page", started)
+    if SHOW_RERUN_TIMINGS:
+        render_performance_panel(elapsed_ms)
 
-    if app_mode == "Calculate Macros":
-        macro_calculator()
-    else:
-        meal_planner()
+
+def render_performance_panel(elapsed_ms):
+    """Sidebar panel: this session's reruns and stage counts, and rolling p50/p99 of every stage"""
+    with st.sidebar.expander("Performance"):
+        st.caption(f"This page rerun: {elapsed_ms:.1f} ms")
+        st.dataframe(pd.DataFrame(st.session_state.rerun_timings[::-1], columns=["Scope", "ms"]),
+                     use_container_width=True)
+
+        st.write("**Stages** (p50/p99 across all sessions)")
+        counts = st.session_state.stage_counts
+        st.dataframe(pd.DataFrame([
+            {"Stage": stage, "Runs (session)": counts.get(stage, 0), "Runs": stats["calls"],
+             "p50 (ms)": stats["p50_ms"], "p99 (ms)": stats["p99_ms"]}
+            for stage, stats in METRICS.snapshot().items()
+        ]), use_container_width=True, hide_index=True)
+
+        profiler = profiler_from_env()
+        if profiler is not None:
+            st.caption(f"Sampling profiler: {sum(profiler.samples.values())} samples")
+            st.download_button("Download profile (collapsed stacks)", "\n".join(profiler.collapsed()),
+                               file_name="macrocounter.collapsed", mime="text/plain")
 
 
 def macro_calculator():
@@ -288,11 +165,25 @@ def macro_calculator():
     )
     activity_level = activity_options[activity_index]
 
+    # Body type presets replace the macro split; without one the split can be customized
+    body_type = st.sidebar.selectbox(
+        "Body Type",
+        options=[None, *BODY_TYPE_SPLITS],
+        format_func=lambda option: option.title() if option else "Not specified",
+        help="Uses MakeMeal's macro split for the body type instead of 40% protein, 30% carbs and 30% fat"
+    )
+    split = None
+    if body_type is None and st.sidebar.checkbox("Custom macro split"):
+        protein_percent = st.sidebar.slider("Protein (% of calories)", 0, 100, 40, step=5)
+        carbs_percent = st.sidebar.slider("Carbs (% of calories)", 0, 100, 30, step=5)
+        st.sidebar.caption(f"Fat: {100 - protein_percent - carbs_percent}% of calories")
+        split = (protein_percent / 100, carbs_percent / 100, (100 - protein_percent - carbs_percent) / 100)
+
     # Calculate macros on button click
     if st.sidebar.button("Calculate Macros"):
         with st.spinner("Calculating macros..."):
             # Calculate macros
-            macro_data = calculate_macros(weight, goal, activity_level)
+            macro_data = calculate_macros(weight, goal, activity_level, split=split, body_type=body_type)
 
             if macro_data:
                 # Store in session state for meal planning
@@ -301,8 +192,13 @@ def macro_calculator():
                     "name": client_name,
                     "weight": weight,
                     "goal": goal,
-                    "activity_level": activity_level
+                    "activity_level": activity_level,
+                    "body_type": body_type,
+                    "split": split
                 }
+                if client_name:
+                    open_store().save_client(client_name, weight, goal, activity_level, macro_data,
+                                             body_type=body_type, split=split)
 
                 # Display user details
                 st.header("Client Macro Calculation Results")
@@ -316,6 +212,10 @@ def macro_calculator():
                     st.write(f"**Weight:** {weight} lbs")
                     st.write(f"**Goal:** {goal.replace('_', ' ').title()}")
                     st.write(f"**Activity Level:** {activity_level.title()}")
+                    if body_type:
+                        st.write(f"**Body Type:** {body_type.title()}")
+                    elif split:
+                        st.write(f"**Macro Split:** {split[0]:.0%} protein, {split[1]:.0%} carbs, {split[2]:.0%} fat")
 
                 # Create a dataframe for displaying the macros
                 macro_df = pd.DataFrame({
@@ -354,6 +254,278 @@ def macro_calculator():
                 st.success(
                     "Macros calculated successfully! You can now go to the 'Plan Meals' tab to create a meal plan.")
 
+    if st.checkbox("Compare macro splits", help="Daily targets for every split in 5% steps"):
+        render_split_sweep(weight, goal, activity_level)
+
+    # Returning clients are found by name prefix, one page of the store at a time
+    st.sidebar.header("Returning Client")
+    name_prefix = st.sidebar.text_input("Find client by name", "")
+    matches = open_store().list_clients(prefix=name_prefix, limit=CLIENT_LIST_LIMIT)
+    if matches:
+        saved_name = st.sidebar.selectbox("Saved clients", [client["name"] for client in matches])
+        st.sidebar.button("Load Client", on_click=load_client, args=(saved_name,))
+    else:
+        st.sidebar.caption("No saved clients match")
+    if "client_message" in st.session_state:
+        st.success(st.session_state.pop("client_message"))
+
+
+def render_split_sweep(weight, goal, activity_level):
+    """Heat map of the daily targets of every macro split, from one vectorized sweep"""
+    import altair as alt
+
+    protein, carbs, fat = split_grid()
+    values = sweep_macro_values(weight, goal, activity_level, protein, carbs, fat)
+    sweep = pd.DataFrame({
+        "Protein %": (protein * 100).round().astype(int),
+        "Carbs %": (carbs * 100).round().astype(int),
+        "Fat %": (fat * 100).round().astype(int),
+        "Protein (g)": values[:, 5],
+        "Carbs (g)": values[:, 8],
+        "Fat (g)": values[:, 11]
+    })
+    metric = st.radio("Color by", ["Protein (g)", "Carbs (g)", "Fat (g)"], horizontal=True)
+    st.altair_chart(
+        alt.Chart(sweep).mark_rect().encode(
+            x="Protein %:O",
+            y=alt.Y("Carbs %:O", sort="descending"),
+            color=alt.Color(f"{metric}:Q", scale=alt.Scale(scheme="viridis")),
+            tooltip=list(sweep.columns)
+        ),
+        use_container_width=True
+    )
+    st.caption(f"{len(sweep)} splits at {int(values[0, 2])} kcal a day; fat takes the remaining calories. "
+               "Targets are daily averages.")
+
+
+def saved_meal_result(result):
+    """The parts of a stored meal result worth saving, with the meals it depends on"""
+    saved = {key: result[key] for key in ("targets", "meal_items", "totals", "solver_info")}
+    saved["depends_on"] = list(result["selections"])
+    return saved
+
+
+def load_client(name):
+    """Button callback: restore a saved client's targets and latest plan, without recomputing"""
+    started = time.perf_counter()
+    store = open_store()
+    client = store.get_client(name)
+    plan = store.load_plan(name)
+    st.session_state.macro_data = client["macro_data"]
+    st.session_state.client_info = {key: client[key] for key in ("name", "weight", "goal", "activity_level",
+                                                                  "body_type", "split")}
+    st.session_state.meal_data = {}
+    st.session_state.meal_results = {}
+    st.session_state.meal_suggestions = {}
+    message = f"Loaded {name}'s macro targets"
+
+    if plan is not None:
+        settings = (plan["num_meals"], plan["solver"])
+        for saved in plan["meals"]:
+            st.session_state.meal_data[f"meal_{saved['meal'] - 1}"] = saved["selections"]
+        for saved in plan["meals"]:
+            if saved["result"] is not None:
+                result = dict(saved["result"])
+                depends_on = result.pop("depends_on")
+                st.session_state.meal_results[f"meal_{saved['meal'] - 1}"] = dict(
+                    result,
+                    settings=settings,
+                    selections={key: copy.deepcopy(st.session_state.meal_data.get(key)) for key in depends_on}
+                )
+        st.session_state.plan_settings = settings
+        message += f" and plan '{plan['name']}' ({plan['num_meals']} meals)"
+
+    # Dropping the picker widget state makes them start over from meal_data
+    for meal_idx in range(max(MEAL_COUNTS)):
+        for prefix in SELECT_KEYS.values():
+            st.session_state.pop(f"{prefix}_{meal_idx}", None)
+    st.session_state.client_message = f"{message} in {(time.perf_counter() - started) * 1000:.1f} ms"
+
+
+def food_multiselect(label, category, meal_key, widget_key):
+    """Food picker for one category; large catalogs are searched server-side instead of
+    sending every option to the browser"""
+    selected = st.session_state.meal_data[meal_key][category]
+    if len(FOOD_CATALOG.ids_in(category)) <= SEARCH_THRESHOLD:
+        options = FOOD_CATALOG.names_in(category)
+    else:
+        query = st.text_input(f"Search {category}", key=f"{widget_key}_search", placeholder="Type to search...")
+        matches = search_index(FOOD_CATALOG, category).search(query, k=SEARCH_RESULTS) if query else []
+        options = list(dict.fromkeys(selected + [FOOD_CATALOG.name_of(food) for food in matches]))
+
+    selected = st.multiselect(label, options=options, default=selected, key=widget_key)
+    st.session_state.meal_data[meal_key][category] = selected
+    return selected
+
+
+def selection_key(foods):
+    """Hashable form of a meal_data selection, in CATEGORY_ORDER"""
+    return tuple(tuple(foods[category]) for category in CATEGORY_ORDER)
+
+
+@st.cache_data(max_entries=4096, show_spinner=False)
+def cached_solve_portions(selection, protein_target, carbs_target, fat_target, solver, catalog_version):
+    """solve_portions memoized on (selection, targets, solver) across reruns and sessions, until a
+    recipe change bumps the catalog version"""
+    foods = {category: list(category_foods) for category, category_foods in zip(CATEGORY_ORDER, selection)}
+    return solve_portions(foods, protein_target, carbs_target, fat_target, solver=solver)
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def cached_suggest_meals(protein_target, carbs_target, fat_target, catalog_version):
+    """suggest_meals memoized on the targets, which every meal of an even split shares, and the
+    catalog version"""
+    return suggest_meals(protein_target, carbs_target, fat_target)
+
+
+def use_suggestion(meal_idx, foods):
+    """Button callback: load a suggested selection into a meal's food pickers"""
+    st.session_state.meal_data[f"meal_{meal_idx}"] = copy.deepcopy(foods)
+    # Dropping the widget state makes the pickers start over from meal_data
+    for prefix in SELECT_KEYS.values():
+        st.session_state.pop(f"{prefix}_{meal_idx}", None)
+
+
+def render_suggestions(meal_idx, suggestion_result):
+    """Ranked suggested selections for a meal, each with a button to use it"""
+    st.write("### Suggested Meals")
+    for rank, suggestion in enumerate(suggestion_result["suggestions"]):
+        foods = suggestion["foods"]
+        col1, col2 = st.columns([4, 1])
+        col1.write(
+            f"{rank + 1}. {', '.join(food for category in CATEGORY_ORDER for food in foods[category])} "
+            f"(off by {suggestion['residual']:.1f} kcal)")
+        col2.button("Use", key=f"use_suggestion_{meal_idx}_{rank}", on_click=use_suggestion, args=(meal_idx, foods))
+    search_info = suggestion_result["info"]
+    st.caption(f"Searched {search_info['searched']} vegetable/fat combinations in {search_info['time_ms']:.1f} ms"
+               + ("" if search_info["exhaustive"] else " (stopped at the time budget)"))
+
+
+def result_portions(result):
+    """Unrounded portions of a meal result; results saved without them fall back to the rounded amounts"""
+    return result["solver_info"].get("portions") or [item["Amount (g)"] for item in result["meal_items"]]
+
+
+@timed("build_meal_tables")
+def build_meal_tables(meal_items, targets, portions=None):
+    """Meal table with its TOTAL row, and the Targets vs. Actual comparison of the macros and every
+    tracked micronutrient (at the solver's unrounded portions when given)"""
+    totals = meal_totals(meal_items)
+    meal_df = pd.concat([pd.DataFrame(meal_items), pd.DataFrame([totals])], ignore_index=True)
+    rows = [
+        {"Nutrient": nutrient, "Target": targets[macro], "Actual": totals[column],
+         "Difference": totals[column] - targets[macro]}
+        for nutrient, (macro, column) in zip(["Calories", "Protein", "Carbs", "Fat"], MACRO_COLUMNS.items())
+    ]
+    # Micronutrients without a limit are listed with their amount only
+    limits = micronutrient_targets(totals["Calories"])
+    for name, actual in micronutrient_totals(meal_items, portions).items():
+        bound, target = limits.get(name, (None, None))
+        rows.append({"Nutrient": nutrient_label(name) + (f", {bound}" if bound else ""), "Target": target,
+                     "Actual": actual, "Difference": None if target is None else round(actual - target, 1)})
+    return meal_df, pd.DataFrame(rows)
+
+
+def render_meal_result(meal_idx, result):
+    """Show a calculated meal: its table, the comparison to targets and the export button"""
+    # Built once per result and kept with it, so later reruns only redraw the tables
+    if "tables" not in result:
+        result["tables"] = build_meal_tables(result["meal_items"], result["targets"], result_portions(result))
+    meal_df, comparison = result["tables"]
+    with span("render_tables"):
+        st.write("### Your Meal Plan")
+        st.dataframe(meal_df, use_container_width=True)
+
+        # Show comparison to targets
+        st.write("### Targets vs. Actual")
+        st.dataframe(comparison, use_container_width=True)
+    for item in result["meal_items"]:
+        if item["Food"] in RECIPE_BOOK:
+            ingredients = RECIPE_BOOK.ingredients_of(item["Food"], item["Amount (g)"])
+            st.caption(f"{item['Food']} ({item['Amount (g)']}g): "
+                       + ", ".join(f"{amount:.0f}g {food}" for food, amount in ingredients.items()))
+    solver_info = result["solver_info"]
+    st.caption(
+        f"{solver_info['solver'].title()} solver: {solver_info['time_ms']:.2f} ms, "
+        f"residual {solver_info['residual']:.1f} kcal")
+
+    # Add usage notes
+    st.info("Remember to measure your portions accurately using a food scale for best results!")
+
+    # Add export option
+    with span("export"):
+        csv_data = meal_df.to_csv(index=False)
+    st.download_button(
+        label=f"Export Meal {meal_idx + 1} as CSV",
+        data=csv_data,
+        file_name=f"meal_{meal_idx + 1}_plan.csv",
+        mime="text/csv",
+        key=f"export_btn_{meal_idx}"
+    )
+
+
+def store_meal_result(meal_key, result, depends_on, settings):
+    """Keep a calculated meal with the selections and settings it was computed from"""
+    st.session_state.meal_results[meal_key] = dict(
+        result,
+        settings=settings,
+        selections={key: copy.deepcopy(st.session_state.meal_data.get(key)) for key in depends_on}
+    )
+
+
+def current_meal_result(meal_key, settings):
+    """Stored result for a meal, unless its selections or settings have changed since"""
+    result = st.session_state.meal_results.get(meal_key)
+    if result is None or result["settings"] != settings:
+        return None
+    if any(st.session_state.meal_data.get(key) != selection for key, selection in result["selections"].items()):
+        return None
+    return result
+
+
+def render_plan_exports(meals, file_stem, key):
+    """Parquet and zip bundle downloads for (client, day, meal, meal_items) tuples
+
+    The files are built when "Prepare export" is clicked and kept until the plan changes, so
+    reruns that don't download anything skip the Parquet and zip encoding.
+    """
+    client = meals[0][0]
+    macro_targets = [(client, st.session_state.macro_data)]
+    signature = repr((meals, macro_targets))
+    prepared = st.session_state.prepared_exports.get(key)
+    if prepared is None or prepared["signature"] != signature:
+        if not st.button("Prepare export", key=f"{key}_prepare"):
+            return
+        from export import export_bytes
+        prepared = {
+            "signature": signature,
+            "parquet": export_bytes(meals),
+            "zip": export_bytes(meals, macro_targets, format="zip", metadata={"client": client}),
+        }
+        st.session_state.prepared_exports[key] = prepared
+
+    col1, col2 = st.columns(2)
+    col1.download_button(
+        label="Export as Parquet",
+        data=prepared["parquet"],
+        file_name=f"{file_stem}.parquet",
+        mime="application/vnd.apache.parquet",
+        key=f"{key}_parquet"
+    )
+    col2.download_button(
+        label="Export Bundle (plan + targets)",
+        data=prepared["zip"],
+        file_name=f"{file_stem}.zip",
+        mime="application/zip",
+        key=f"{key}_zip"
+    )
+
+
+def client_label():
+    """Client name for exports"""
+    client_info = st.session_state.get("client_info") or {}
+    return client_info.get("name") or "client"
+
 
 def meal_planner():
     st.title("Meal Planner")
@@ -381,147 +553,257 @@ def meal_planner():
     col3.metric("Carbs", f"{int(macro_data['carbs']['avg'])}g")
     col4.metric("Fat", f"{int(macro_data['fat']['avg'])}g")
 
-    # Number of meals
-    num_meals = st.radio("Number of meals per day", [1, 2, 3, 4, 5, 6], horizontal=True, index=2)
+    # Number of meals and solver, defaulting to those of a loaded plan
+    saved_meals, saved_solver = st.session_state.get("plan_settings") or (3, "greedy")
+    num_meals = st.radio("Number of meals per day", MEAL_COUNTS, horizontal=True,
+                         index=MEAL_COUNTS.index(saved_meals))
+
+    # Portion solver
+    solver = st.radio(
+        "Portion solver",
+        options=["greedy", "optimize"],
+        index=["greedy", "optimize"].index(saved_solver),
+        format_func=lambda option: {"greedy": "Greedy (category order)", "optimize": "Optimize (all at once)"}[option],
+        horizontal=True,
+        help="Greedy fills vegetables, fats, carbs and proteins in order. "
+             "Optimize sizes all foods together to minimize the calorie-weighted macro error."
+    )
+
+    # Carry-over between meals
+    carry_over = st.checkbox(
+        "Carry leftover macros into later meals",
+        help="When calculating all meals, anything a meal misses or overshoots is spread over the meals after it."
+    )
 
     # Per-meal targets
     st.write("---")
-    protein_per_meal = round(macro_data['protein']['avg'] / num_meals)
-    carbs_per_meal = round(macro_data['carbs']['avg'] / num_meals)
-    fat_per_meal = round(macro_data['fat']['avg'] / num_meals)
-    calories_per_meal = round(macro_data['calories']['avg'] / num_meals)
-
-    # Meal selector
+    even_targets = meal_targets(macro_data, num_meals)
+    settings = (num_meals, solver)
+    meal_keys = [f"meal_{meal_idx}" for meal_idx in range(num_meals)]
+
+    # Calculate the whole day in one pass
+    if st.button("Calculate All Meals"):
+        selections = [st.session_state.meal_data.get(meal_key) for meal_key in meal_keys]
+        incomplete = [meal_idx + 1 for meal_idx, foods in enumerate(selections)
+                      if foods is None or missing_categories(foods)]
+        if incomplete:
+            st.warning(f"Skipping meals without a protein, carb and vegetable: "
+                       f"{', '.join(str(meal) for meal in incomplete)}")
+        day_plan = plan_day(
+            [None if meal_idx + 1 in incomplete else foods for meal_idx, foods in enumerate(selections)],
+            macro_data,
+            solver=solver,
+            carry_over=carry_over
+        )
+        for meal_key, result in zip(meal_keys, day_plan["meals"]):
+            if result is not None:
+                # With carry-over every meal depends on the selections of the meals before it
+                store_meal_result(meal_key, result, meal_keys if carry_over else [meal_key], settings)
+        day_totals = day_plan["totals"]
+        day_results = [result for result in day_plan["meals"] if result is not None]
+        day_micros = micronutrient_totals([item for result in day_results for item in result["meal_items"]],
+                                          [portion for result in day_results for portion in result_portions(result)])
+        st.write(
+            f"**Day total**: {day_totals['calories']} kcal, {day_totals['protein']:.1f}g protein, "
+            f"{day_totals['carbs']:.1f}g carbs, {day_totals['fat']:.1f}g fat"
+            + "".join(f", {amount:g}{MICRONUTRIENT_UNITS.get(name, '')} {name.replace('_', ' ')}"
+                      for name, amount in day_micros.items()))
+
+    # Meal selector; each tab is a fragment, so its widgets only rerun that meal
     meal_tabs = st.tabs([f"Meal {i + 1}" for i in range(num_meals)])
-
-    # Process each meal
     for meal_idx, meal_tab in enumerate(meal_tabs):
         with meal_tab:
-            # Create key for this meal in session state if it doesn't exist
-            meal_key = f"meal_{meal_idx}"
-            if meal_key not in st.session_state.meal_data:
-                st.session_state.meal_data[meal_key] = {
-                    'proteins': [],
-                    'carbs': [],
-                    'vegetables': [],
-                    'fats': []
-                }
+            meal_editor(meal_idx, even_targets, settings)
 
-            # Display meal targets
-            st.write(
-                f"**Target**: {calories_per_meal} kcal, {protein_per_meal}g protein, {carbs_per_meal}g carbs, {fat_per_meal}g fat")
-
-            # Food selection interface
-            col1, col2 = st.columns(2)
-
-            with col1:
-                # Proteins
-                st.subheader("Proteins")
-                proteins = st.multiselect(
-                    "Select proteins (1-2 items):",
-                    options=list(FOOD_DATA.keys())[:9],  # First 9 items are proteins
-                    default=st.session_state.meal_data[meal_key]['proteins'],
-                    key=f"protein_select_{meal_idx}"
-                )
-                st.session_state.meal_data[meal_key]['proteins'] = proteins
-
-                # Carbs
-                st.subheader("Carbs")
-                carbs = st.multiselect(
-                    "Select carbs (1 item):",
-                    options=list(FOOD_DATA.keys())[9:17],  # Items 9-16 are carbs
-                    default=st.session_state.meal_data[meal_key]['carbs'],
-                    key=f"carb_select_{meal_idx}"
-                )
-                st.session_state.meal_data[meal_key]['carbs'] = carbs
-
-            with col2:
-                # Vegetables
-                st.subheader("Vegetables")
-                vegetables = st.multiselect(
-                    "Select vegetables (1-2 items):",
-                    options=list(FOOD_DATA.keys())[17:21],  # Items 17-20 are vegetables
-                    default=st.session_state.meal_data[meal_key]['vegetables'],
-                    key=f"veg_select_{meal_idx}"
-                )
-                st.session_state.meal_data[meal_key]['vegetables'] = vegetables
-
-                # Fats
-                st.subheader("Fats")
-                fats = st.multiselect(
-                    "Select fats (0-1 item):",
-                    options=list(FOOD_DATA.keys())[21:],  # Items 21+ are fats
-                    default=st.session_state.meal_data[meal_key]['fats'],
-                    key=f"fat_select_{meal_idx}"
+    # Selections and calculated meals go to the client store under a plan name
+    st.write("---")
+    st.subheader("Save Plan")
+    col1, col2 = st.columns([3, 1])
+    plan_name = col1.text_input("Plan name", "Current plan")
+    if col2.button("Save Plan", disabled=not client_info["name"],
+                   help="Plans are saved for the client named on the macro calculator"):
+        results = [current_meal_result(meal_key, settings) for meal_key in meal_keys]
+        try:
+            open_store().save_plan(client_info["name"], plan_name, num_meals, solver, [
+                (1, meal_idx + 1, st.session_state.meal_data[meal_key],
+                 None if result is None else saved_meal_result(result))
+                for meal_idx, (meal_key, result) in enumerate(zip(meal_keys, results))
+            ])
+        except KeyError:
+            st.error(f"{client_info['name']} is not saved yet; calculate their macros first.")
+        else:
+            st.success(f"Saved '{plan_name}' for {client_info['name']}")
+
+    # Every calculated meal in one typed file
+    results = [current_meal_result(meal_key, settings) for meal_key in meal_keys]
+    meals = [(client_label(), 1, meal_idx + 1, result["meal_items"])
+             for meal_idx, result in enumerate(results) if result is not None]
+    if meals:
+        st.write("---")
+        st.subheader("Export All Meals")
+        render_plan_exports(meals, f"{client_label()}_meal_plan", "export_all")
+
+
+@st.fragment
+def meal_editor(meal_idx, even_targets, settings):
+    """Food pickers, suggestions and results for one meal"""
+    started = time.perf_counter()
+    # A fragment rerun has no page span around it, so it counts towards the session itself
+    with span("meal_rerun", st.session_state.stage_counts):
+        render_meal_editor(meal_idx, even_targets, settings)
+
+    elapsed_ms = record_rerun(f"Meal {meal_idx + 1}", started)
+    if SHOW_RERUN_TIMINGS:
+        st.caption(f"Meal {meal_idx + 1} rendered in {elapsed_ms:.1f} ms")
+
+
+def render_meal_editor(meal_idx, even_targets, settings):
+    """Body of meal_editor"""
+    solver = settings[1]
+
+    # Create key for this meal in session state if it doesn't exist
+    meal_key = f"meal_{meal_idx}"
+    if meal_key not in st.session_state.meal_data:
+        st.session_state.meal_data[meal_key] = {
+            'proteins': [],
+            'carbs': [],
+            'vegetables': [],
+            'fats': []
+        }
+
+    # Food selection interface
+    with span("meal_widgets"):
+        col1, col2 = st.columns(2)
+
+        with col1:
+            # Proteins
+            st.subheader("Proteins")
+            food_multiselect("Select proteins (1-2 items):", "proteins", meal_key, f"protein_select_{meal_idx}")
+
+            # Carbs
+            st.subheader("Carbs")
+            food_multiselect("Select carbs (1 item):", "carbs", meal_key, f"carb_select_{meal_idx}")
+
+        with col2:
+            # Vegetables
+            st.subheader("Vegetables")
+            food_multiselect("Select vegetables (1-2 items):", "vegetables", meal_key, f"veg_select_{meal_idx}")
+
+            # Fats
+            st.subheader("Fats")
+            food_multiselect("Select fats (0-1 item):", "fats", meal_key, f"fat_select_{meal_idx}")
+
+    # Suggested selections
+    if st.button("Suggest Foods", key=f"suggest_btn_{meal_idx}",
+                 help="Search food combinations whose portions come closest to this meal's targets"):
+        suggestions, search_info = cached_suggest_meals(even_targets["protein"], even_targets["carbs"],
+                                                        even_targets["fat"], FOOD_CATALOG.version)
+        st.session_state.meal_suggestions[meal_key] = {"targets": dict(even_targets),
+                                                       "suggestions": suggestions, "info": search_info}
+    suggestion_result = st.session_state.meal_suggestions.get(meal_key)
+    if suggestion_result and suggestion_result["targets"] == even_targets:
+        render_suggestions(meal_idx, suggestion_result)
+
+    # Calculate button
+    if st.button("Calculate Portions", key=f"calc_btn_{meal_idx}"):
+        # Validate selections
+        missing = missing_categories(st.session_state.meal_data[meal_key])
+        if missing:
+            st.warning(f"Please select at least one food for each of these categories: {', '.join(missing)}")
+        else:
+            # Calculate portions (solve_portions only runs on a cache miss)
+            with span("calculate_portions"):
+                meal_items, solver_info = cached_solve_portions(
+                    selection_key(st.session_state.meal_data[meal_key]),
+                    even_targets["protein"],
+                    even_targets["carbs"],
+                    even_targets["fat"],
+                    solver,
+                    FOOD_CATALOG.version
                 )
-                st.session_state.meal_data[meal_key]['fats'] = fats
-
-            # Calculate button
-            if st.button("Calculate Portions", key=f"calc_btn_{meal_idx}"):
-                # Validate selections
-                missing_categories = []
-                if not proteins:
-                    missing_categories.append("protein")
-                if not carbs:
-                    missing_categories.append("carbs")
-                if not vegetables:
-                    missing_categories.append("vegetables")
-
-                if missing_categories:
-                    st.warning(
-                        f"Please select at least one food for each of these categories: {', '.join(missing_categories)}")
-                else:
-                    # Calculate portions
-                    meal_items = calculate_portions(
-                        st.session_state.meal_data[meal_key],
-                        protein_per_meal,
-                        carbs_per_meal,
-                        fat_per_meal
-                    )
-
-                    # Create DataFrame for display
-                    meal_df = pd.DataFrame(meal_items)
-
-                    # Calculate totals
-                    totals = {
-                        "Food": "TOTAL",
-                        "Amount (g)": meal_df["Amount (g)"].sum(),
-                        "Calories": round(meal_df["Calories"].sum()),
-                        "Protein (g)": round(meal_df["Protein (g)"].sum(), 1),
-                        "Carbs (g)": round(meal_df["Carbs (g)"].sum(), 1),
-                        "Fat (g)": round(meal_df["Fat (g)"].sum(), 1)
-                    }
-
-                    # Add totals row to DataFrame
-                    meal_df = pd.concat([meal_df, pd.DataFrame([totals])], ignore_index=True)
-                    st.write("### Your Meal Plan")
-                    st.dataframe(meal_df, use_container_width=True)
-
-                    # Show comparison to targets
-                    st.write("### Targets vs. Actual")
-                    comparison = pd.DataFrame([
-                        {"Nutrient": "Calories", "Target": calories_per_meal, "Actual": totals["Calories"],
-                         "Difference": totals["Calories"] - calories_per_meal},
-                        {"Nutrient": "Protein", "Target": protein_per_meal, "Actual": totals["Protein (g)"],
-                         "Difference": totals["Protein (g)"] - protein_per_meal},
-                        {"Nutrient": "Carbs", "Target": carbs_per_meal, "Actual": totals["Carbs (g)"],
-                         "Difference": totals["Carbs (g)"] - carbs_per_meal},
-                        {"Nutrient": "Fat", "Target": fat_per_meal, "Actual": totals["Fat (g)"],
-                         "Difference": totals["Fat (g)"] - fat_per_meal}
-                    ])
-                    st.dataframe(comparison, use_container_width=True)
-
-                    # Add usage notes
-                    st.info("Remember to measure your portions accurately using a food scale for best results!")
-
-                    # Add export option
-                    st.download_button(
-                        label=f"Export Meal {meal_idx + 1} as CSV",
-                        data=meal_df.to_csv(index=False),
-                        file_name=f"meal_{meal_idx + 1}_plan.csv",
-                        mime="text/csv"
-                    )
+            result = {"targets": dict(even_targets), "meal_items": meal_items,
+                      "totals": meal_totals(meal_items), "solver_info": solver_info}
+            store_meal_result(meal_key, result, [meal_key], settings)
+
+    # Display meal targets (adjusted when leftovers were carried over) and the result
+    result = current_meal_result(meal_key, settings)
+    targets = result["targets"] if result else even_targets
+    st.write(
+        f"**Target**: {targets['calories']} kcal, {targets['protein']}g protein, {targets['carbs']}g carbs, {targets['fat']}g fat")
+    if result:
+        render_meal_result(meal_idx, result)
+
+
+def multi_day_planner():
+    from multi_day import generate_plan
+
+    st.title("Multi-Day Plan")
+    if st.session_state.macro_data is None:
+        st.warning("Please calculate your macros first using the 'Calculate Macros' tab.")
+        return
+
+    # Plan length and variety rules
+    col1, col2, col3 = st.columns(3)
+    days = col1.radio("Days", [7, 28], horizontal=True)
+    num_meals = col2.radio("Meals per day", MEAL_COUNTS, horizontal=True, index=2)
+    carb_cap = col3.number_input("Max uses of each carb per week", min_value=1, max_value=42, value=7)
+    st.caption("Proteins never repeat within a day; leftovers carry into later meals so each day tracks "
+               "the daily targets.")
+
+    if st.button("Generate Plan"):
+        try:
+            plan, seconds = generate_plan(st.session_state.macro_data, days, num_meals,
+                                          max_per_week={"carbs": int(carb_cap)})
+        except ValueError as e:
+            st.error(str(e))
+        else:
+            st.session_state.multi_day_plan = plan
+            st.success(f"Planned {days} days x {num_meals} meals in {seconds * 1000:.0f} ms")
+
+    plan = st.session_state.get("multi_day_plan")
+    if plan is None:
+        return
+    # Filled in after a swap below, so the table always shows the current plan
+    overview = st.empty()
+
+    # Swap one meal; only its day is re-planned
+    st.subheader("Swap a Meal")
+    col1, col2 = st.columns(2)
+    day = col1.selectbox("Day", range(plan.days), format_func=lambda day: f"Day {day + 1}")
+    meal = col2.selectbox("Meal", range(plan.num_meals), format_func=lambda meal: f"Meal {meal + 1}")
+    current = plan.selections[day][meal]
+    foods = {
+        category: st.multiselect(category.title(), options=list(dict.fromkeys(current[category] + plan.pools[category])),
+                                 default=current[category], key=f"swap_{category}_{day}_{meal}")
+        for category in CATEGORY_ORDER
+    }
+    if st.button("Swap Meal"):
+        started = time.perf_counter()
+        try:
+            replanned = plan.swap_meal(day, meal, foods)
+        except ValueError as e:
+            st.error(str(e))
+        else:
+            st.success(f"Re-planned day {', '.join(str(day + 1) for day in replanned)} "
+                       f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+    overview.dataframe(pd.DataFrame(plan.overview_rows()), use_container_width=True, hide_index=True)
+
+    with span("export"):
+        csv_data = pd.DataFrame(plan.item_rows()).to_csv(index=False)
+    st.download_button(
+        label="Export Plan as CSV",
+        data=csv_data,
+        file_name=f"{plan.days}_day_plan.csv",
+        mime="text/csv"
+    )
+    render_plan_exports(
+        [(client_label(), day + 1, meal + 1, result["meal_items"])
+         for day, day_plan in enumerate(plan.day_plans) for meal, result in enumerate(day_plan["meals"])],
+        f"{plan.days}_day_plan", "export_multi_day")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # The command line tools also run from planner.py, which starts without Streamlit
+    if len(sys.argv) > 1 and sys.argv[1] in planner.COMMANDS:
+        sys.exit(planner.main(sys.argv[1:]))
+    main()
@@ -0,0 +1,170 @@
+"""Multi-day meal plans: food selections rotated under variety rules, planned a day at a time
+
+A plan covers days x meals per day, one food per category in every meal. generate()
+rotates through each category's foods, least used this week first, so that by default
+no protein repeats within a day and no carb is used more than 7 times in any week
+(weeks count from the plan's first day). Each day's portions come from plan_day against
+the client's daily targets, carrying leftovers into later meals so the day totals track
+them. Swapping a meal re-plans only the day it belongs to.
+"""
+import random
+import time
+from collections import Counter
+
+from planner import CATEGORY_ORDER, FOOD_CATALOG, MACRO_COLUMNS, missing_categories, plan_day
+
+DAYS_PER_WEEK = 7
+ROTATION_POOL = 200  # Foods per category rotated when no pool is given (the planner's picker limit)
+
+# Variety rules: most uses of one food in a day and in a week, per category
+DEFAULT_MAX_PER_DAY = {"proteins": 1}
+DEFAULT_MAX_PER_WEEK = {"carbs": 7}
+
+
+class MultiDayPlan:
+    """Selections and portions for a multi-day plan, re-planned only where they change"""
+
+    def __init__(self, macro_data, days=7, num_meals=3, max_per_day=None, max_per_week=None, pools=None,
+                 solver="greedy", carry_over=True, seed=0):
+        self.macro_data = macro_data
+        self.days = days
+        self.num_meals = num_meals
+        self.max_per_day = dict(DEFAULT_MAX_PER_DAY if max_per_day is None else max_per_day)
+        self.max_per_week = dict(DEFAULT_MAX_PER_WEEK if max_per_week is None else max_per_week)
+        self.pools = {category: list((pools or {}).get(category) or FOOD_CATALOG.names_in(category)[:ROTATION_POOL])
+                      for category in CATEGORY_ORDER}
+        self.solver = solver
+        self.carry_over = carry_over
+        self.seed = seed
+
+        self.selections = [[None] * num_meals for _ in range(days)]
+        self.day_plans = [None] * days
+        self.stale = set()
+
+    def _check_rules(self):
+        """ValueError when the pools are too small for the variety rules"""
+        meals_per_week = min(self.days, DAYS_PER_WEEK) * self.num_meals
+        for category, foods in self.pools.items():
+            if not foods:
+                raise ValueError(f"No {category} to choose from")
+            if len(foods) * self.max_per_day.get(category, self.num_meals) < self.num_meals:
+                raise ValueError(f"{len(foods)} {category} cannot fill {self.num_meals} meals a day "
+                                 f"at most {self.max_per_day[category]} times each")
+            if len(foods) * self.max_per_week.get(category, meals_per_week) < meals_per_week:
+                raise ValueError(f"{len(foods)} {category} cannot fill {meals_per_week} meals a week "
+                                 f"at most {self.max_per_week[category]} times each")
+
+    def generate(self):
+        """Fill every meal by rotating each category's foods under the variety rules, then plan every day"""
+        self._check_rules()
+        rng = random.Random(self.seed)
+        for category in CATEGORY_ORDER:
+            foods = self.pools[category][:]
+            rng.shuffle(foods)
+            rank = {food: position for position, food in enumerate(foods)}
+            max_day = self.max_per_day.get(category, self.num_meals)
+            max_week = self.max_per_week.get(category, DAYS_PER_WEEK * self.num_meals)
+            cursor = 0
+
+            for day in range(self.days):
+                if day % DAYS_PER_WEEK == 0:
+                    week_counts = Counter()
+                day_counts = Counter()
+                for meal in range(self.num_meals):
+                    allowed = [food for food in foods if day_counts[food] < max_day and week_counts[food] < max_week]
+                    if not allowed:
+                        raise ValueError(f"The variety rules leave no {category} for day {day + 1}, meal {meal + 1} "
+                                         f"(each at most {max_day} per day and {max_week} per week)")
+                    # Least used this week first, then the next food in rotation order
+                    food = min(allowed, key=lambda food: (week_counts[food], (rank[food] - cursor) % len(foods)))
+                    cursor = rank[food] + 1
+                    day_counts[food] += 1
+                    week_counts[food] += 1
+                    if self.selections[day][meal] is None:
+                        self.selections[day][meal] = {}
+                    self.selections[day][meal][category] = [food]
+
+        self.stale = set(range(self.days))
+        return self.recompute()
+
+    def violations(self, day, meal, foods):
+        """Variety rules a selection would break if it replaced one meal"""
+        week_start = day - day % DAYS_PER_WEEK
+        day_counts = Counter()
+        week_counts = Counter()
+        for other_day in range(week_start, min(week_start + DAYS_PER_WEEK, self.days)):
+            for other_meal, selection in enumerate(self.selections[other_day]):
+                if (other_day, other_meal) == (day, meal):
+                    selection = foods
+                for category in CATEGORY_ORDER:
+                    for food in selection[category]:
+                        week_counts[category, food] += 1
+                        if other_day == day:
+                            day_counts[category, food] += 1
+
+        broken = []
+        for category in CATEGORY_ORDER:
+            for food in dict.fromkeys(foods[category]):
+                if day_counts[category, food] > self.max_per_day.get(category, self.num_meals):
+                    broken.append(f"{food} over {self.max_per_day[category]} per day on day {day + 1}")
+                if week_counts[category, food] > self.max_per_week.get(category, DAYS_PER_WEEK * self.num_meals):
+                    broken.append(f"{food} over {self.max_per_week[category]} per week in week "
+                                  f"{day // DAYS_PER_WEEK + 1}")
+        return broken
+
+    def swap_meal(self, day, meal, foods, enforce_rules=True):
+        """Replace one meal's selection and re-plan only its day; returns the re-planned days"""
+        foods = {category: list(foods.get(category, [])) for category in CATEGORY_ORDER}
+        missing = missing_categories(foods)
+        if missing:
+            raise ValueError(f"Select at least one food for: {', '.join(missing)}")
+        unknown = [food for category in CATEGORY_ORDER for food in foods[category] if food not in FOOD_CATALOG]
+        if unknown:
+            raise ValueError(f"Unknown foods: {', '.join(unknown)}")
+        if enforce_rules:
+            broken = self.violations(day, meal, foods)
+            if broken:
+                raise ValueError("Breaks the variety rules: " + "; ".join(broken))
+
+        self.selections[day][meal] = foods
+        self.stale.add(day)
+        return self.recompute()
+
+    def recompute(self):
+        """Plan the days whose selections changed since they were last planned; returns those days"""
+        days = sorted(self.stale)
+        for day in days:
+            self.day_plans[day] = plan_day(self.selections[day], self.macro_data, solver=self.solver,
+                                           carry_over=self.carry_over)
+        self.stale.clear()
+        return days
+
+    def overview_rows(self):
+        """One row per day: each meal's foods and the day totals against the daily targets"""
+        rows = []
+        for day, (selections, day_plan) in enumerate(zip(self.selections, self.day_plans)):
+            row = {"Day": day + 1}
+            for meal, foods in enumerate(selections):
+                row[f"Meal {meal + 1}"] = ", ".join(food for category in CATEGORY_ORDER for food in foods[category])
+            for macro, column in MACRO_COLUMNS.items():
+                row[column] = day_plan["totals"][macro]
+                row[f"{column} target"] = round(self.macro_data[macro]["avg"])
+            rows.append(row)
+        return rows
+
+    def item_rows(self):
+        """One row per planned food, for export"""
+        return [
+            dict(item, Day=day + 1, Meal=meal + 1)
+            for day, day_plan in enumerate(self.day_plans)
+            for meal, result in enumerate(day_plan["meals"])
+            for item in result["meal_items"]
+        ]
+
+
+def generate_plan(macro_data, days=7, num_meals=3, **options):
+    """Build and plan a multi-day plan; returns (plan, seconds taken)"""
+    start = time.perf_counter()
+    plan = MultiDayPlan(macro_data, days, num_meals, **options)
+    plan.generate()
+    return plan, time.perf_counter() - start
@@ -0,0 +1,921 @@
+"""Planning core: food catalog, portion solvers, meal suggestions and day plans
+
+Everything here is importable without Streamlit or pandas, so batch workers, the
+HTTP service and scripts only load numpy and the catalog. macrocounter.py is the
+Streamlit app on top of it; fitness_tools is only imported for macro targets that
+are not in the precomputed table.
+
+Usage: python planner.py batch|serve|grocery|build-food-db|build-macro-table ...
+"""
+import functools
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from itertools import chain
+from operator import itemgetter
+
+import numpy as np
+
+from food_db import NUTRIENTS, FoodCatalog, build_food_db, open_catalog
+from instrumentation import timed
+from macro_targets import build_macro_table, macro_dict, macro_values
+from recipes import RecipeBook, watch_recipe_file
+
+# Food nutrition data per 100g
+FOOD_DATA = {
+    "Chicken Breast (skinless)": {"category": "proteins", "calories": 165, "protein": 31, "carbs": 0, "fat": 3.6},
+    "Ground Beef (lean)": {"category": "proteins", "calories": 250, "protein": 26, "carbs": 0, "fat": 15},
+    "Salmon": {"category": "proteins", "calories": 206, "protein": 22, "carbs": 0, "fat": 13},
+    "Tuna (canned)": {"category": "proteins", "calories": 116, "protein": 25, "carbs": 0, "fat": 1},
+    "Turkey Breast": {"category": "proteins", "calories": 157, "protein": 29, "carbs": 0, "fat": 4},
+    "Egg (whole)": {"category": "proteins", "calories": 143, "protein": 13, "carbs": 1, "fat": 10},
+    "Egg Whites": {"category": "proteins", "calories": 52, "protein": 11, "carbs": 1, "fat": 0},
+    "Greek Yogurt": {"category": "proteins", "calories": 59, "protein": 10, "carbs": 3.6, "fat": 0.4},
+    "Cottage Cheese": {"category": "proteins", "calories": 98, "protein": 11, "carbs": 3.4, "fat": 4.3},
+    "White Rice (cooked)": {"category": "carbs", "calories": 130, "protein": 2.7, "carbs": 28, "fat": 0.3},
+    "Brown Rice (cooked)": {"category": "carbs", "calories": 112, "protein": 2.6, "carbs": 23, "fat": 0.9},
+    "Quinoa (cooked)": {"category": "carbs", "calories": 120, "protein": 4.4, "carbs": 21, "fat": 1.9},
+    "Oats": {"category": "carbs", "calories": 389, "protein": 16.9, "carbs": 66, "fat": 6.9},
+    "Pasta (cooked)": {"category": "carbs", "calories": 158, "protein": 5.8, "carbs": 31, "fat": 0.9},
+    "Sweet Potato (cooked)": {"category": "carbs", "calories": 86, "protein": 1.6, "carbs": 20, "fat": 0.1},
+    "Potato (cooked)": {"category": "carbs", "calories": 86, "protein": 1.8, "carbs": 20, "fat": 0.1},
+    "Bread (whole wheat)": {"category": "carbs", "calories": 247, "protein": 13, "carbs": 41, "fat": 3.4},
+    "Broccoli": {"category": "vegetables", "calories": 34, "protein": 2.8, "carbs": 7, "fat": 0.4},
+    "Spinach": {"category": "vegetables", "calories": 23, "protein": 2.9, "carbs": 3.6, "fat": 0.4},
+    "Kale": {"category": "vegetables", "calories": 49, "protein": 4.3, "carbs": 8.8, "fat": 0.9},
+    "Mixed Vegetables": {"category": "vegetables", "calories": 65, "protein": 2.6, "carbs": 13, "fat": 0.6},
+    "Avocado": {"category": "fats", "calories": 160, "protein": 2, "carbs": 8.5, "fat": 14.7},
+    "Olive Oil": {"category": "fats", "calories": 884, "protein": 0, "carbs": 0, "fat": 100},
+    "Almonds": {"category": "fats", "calories": 579, "protein": 21, "carbs": 22, "fat": 49},
+    "Peanut Butter": {"category": "fats", "calories": 588, "protein": 25, "carbs": 20, "fat": 50}
+}
+
+# Known non-zero fiber (g), sugar (g) and sodium (mg) per 100g of FOOD_DATA foods
+FOOD_MICRONUTRIENTS = {
+    "Chicken Breast (skinless)": {"sodium": 74},
+    "Ground Beef (lean)": {"sodium": 66},
+    "Salmon": {"sodium": 59},
+    "Tuna (canned)": {"sodium": 247},
+    "Turkey Breast": {"sodium": 99},
+    "Egg (whole)": {"sugar": 0.4, "sodium": 142},
+    "Egg Whites": {"sugar": 0.7, "sodium": 166},
+    "Greek Yogurt": {"sugar": 3.2, "sodium": 36},
+    "Cottage Cheese": {"sugar": 2.7, "sodium": 364},
+    "White Rice (cooked)": {"fiber": 0.4, "sugar": 0.1, "sodium": 1},
+    "Brown Rice (cooked)": {"fiber": 1.6, "sugar": 0.4, "sodium": 5},
+    "Quinoa (cooked)": {"fiber": 2.8, "sugar": 0.9, "sodium": 7},
+    "Oats": {"fiber": 10.6, "sugar": 1, "sodium": 2},
+    "Pasta (cooked)": {"fiber": 1.8, "sugar": 0.6, "sodium": 1},
+    "Sweet Potato (cooked)": {"fiber": 3.3, "sugar": 6.5, "sodium": 36},
+    "Potato (cooked)": {"fiber": 1.8, "sugar": 0.9, "sodium": 5},
+    "Bread (whole wheat)": {"fiber": 6.8, "sugar": 5.6, "sodium": 450},
+    "Broccoli": {"fiber": 2.6, "sugar": 1.7, "sodium": 33},
+    "Spinach": {"fiber": 2.2, "sugar": 0.4, "sodium": 79},
+    "Kale": {"fiber": 3.6, "sugar": 2.3, "sodium": 38},
+    "Mixed Vegetables": {"fiber": 4.4, "sugar": 3.1, "sodium": 35},
+    "Avocado": {"fiber": 6.7, "sugar": 0.7, "sodium": 7},
+    "Olive Oil": {"sodium": 2},
+    "Almonds": {"fiber": 12.5, "sugar": 4.4, "sodium": 1},
+    "Peanut Butter": {"fiber": 6, "sugar": 9.2, "sodium": 459}
+}
+
+# Food catalog: the built-in FOOD_DATA, or a database compiled with build-food-db when
+# MACROCOUNTER_FOOD_DB points at it. Foods are addressed by catalog id (FOOD_MATRIX row).
+if os.environ.get("MACROCOUNTER_FOOD_DB"):
+    FOOD_CATALOG = open_catalog(os.environ["MACROCOUNTER_FOOD_DB"])
+else:
+    FOOD_CATALOG = FoodCatalog.from_food_data(
+        {name: dict(food, **FOOD_MICRONUTRIENTS.get(name, {})) for name, food in FOOD_DATA.items()})
+CALORIES, PROTEIN, CARBS, FAT = range(len(NUTRIENTS))
+FOOD_MATRIX = FOOD_CATALOG.nutrients
+
+
+def reads_catalog(function):
+    """Run function holding the catalog's read lock, so a recipe change (which rewrites catalog
+    rows and rebinds FOOD_MATRIX under the write lock) waits until it is done"""
+    @functools.wraps(function)
+    def locked(*args, **kwargs):
+        with FOOD_CATALOG.lock:
+            return function(*args, **kwargs)
+    return locked
+
+# Portion limits (g) used when allocating each category
+FAT_MAX_PORTION = 30
+CARB_MIN_PORTION = 50
+PROTEIN_MIN_PORTION = 30
+LARGE_CARB_PORTION_FOODS = ["White Rice (cooked)", "Brown Rice (cooked)", "Pasta (cooked)"]
+LARGE_PROTEIN_PORTION_FOODS = ["Chicken Breast (skinless)", "Turkey Breast"]
+LARGE_CARB_PORTION_IDS = np.array(
+    [FOOD_CATALOG.id_of(name) for name in LARGE_CARB_PORTION_FOODS if name in FOOD_CATALOG], dtype=np.intp)
+LARGE_PROTEIN_PORTION_IDS = np.array(
+    [FOOD_CATALOG.id_of(name) for name in LARGE_PROTEIN_PORTION_FOODS if name in FOOD_CATALOG], dtype=np.intp)
+
+
+LARGE_CARB_PORTION_ID_SET = frozenset(LARGE_CARB_PORTION_IDS.tolist())
+LARGE_PROTEIN_PORTION_ID_SET = frozenset(LARGE_PROTEIN_PORTION_IDS.tolist())
+
+
+def carb_max_portion(rows):
+    """Largest carb portion (g) for each food row"""
+    return np.where(np.isin(rows, LARGE_CARB_PORTION_IDS), 150.0, 100.0)
+
+
+def protein_max_portion(rows):
+    """Largest protein portion (g) for each food row"""
+    return np.where(np.isin(rows, LARGE_PROTEIN_PORTION_IDS), 200.0, 150.0)
+
+
+def _fat_portion(row, fat_remaining):
+    """Greedy fat portion: fill the remaining fat, capped at FAT_MAX_PORTION"""
+    fat_per_100g = FOOD_MATRIX[row, FAT]
+    return np.where(fat_per_100g > 0,
+                    np.minimum((fat_remaining * 100) / fat_per_100g, FAT_MAX_PORTION),
+                    15.0)
+
+
+def _carb_portion(row, carbs_remaining):
+    """Greedy carb portion: fill the remaining carbs within the per-food range"""
+    carbs_per_100g = FOOD_MATRIX[row, CARBS]
+    raw_portion = (carbs_remaining * 100) / carbs_per_100g
+    return np.where(carbs_per_100g > 0,
+                    np.maximum(np.minimum(raw_portion, carb_max_portion(row)), CARB_MIN_PORTION),
+                    50.0)
+
+
+def _protein_portion(row, protein_remaining):
+    """Greedy protein portion: supply protein_remaining within the per-food range"""
+    protein_per_100g = FOOD_MATRIX[row, PROTEIN]
+    raw_portion = (protein_remaining * 100) / protein_per_100g
+    return np.where(protein_per_100g > 0,
+                    np.maximum(np.minimum(raw_portion, protein_max_portion(row)), PROTEIN_MIN_PORTION),
+                    100.0)
+
+
+def food_id(food):
+    """Catalog id of a food given by id or by display name"""
+    return food if isinstance(food, (int, np.integer)) else FOOD_CATALOG.id_of(food)
+
+
+# Meals per day offered by the planners
+MEAL_COUNTS = [1, 2, 3, 4, 5, 6]
+
+# Order in which categories are allocated (and listed in the meal)
+CATEGORY_ORDER = ("vegetables", "fats", "carbs", "proteins")
+
+
+def compute_portion_arrays(rows, protein_target, carbs_target, fat_target):
+    """Allocate portions for a stack of meals that share the same selection shape
+
+    rows maps each category to an (n_meals, k) array of FOOD_MATRIX rows and the
+    targets are (n_meals,) arrays. Returns (food_rows, portions, nutrients) with the
+    items of every meal in calculate_portions order.
+    """
+    n_meals = len(protein_target)
+
+    # Track remaining macros to allocate (the calories column is unused)
+    remaining = np.zeros((n_meals, len(NUTRIENTS)))
+    remaining[:, PROTEIN] = protein_target
+    remaining[:, CARBS] = carbs_target
+    remaining[:, FAT] = fat_target
+
+    food_rows = []
+    portions = []
+    nutrients = []
+
+    def add_item(row, portion, subtract=True):
+        item = FOOD_MATRIX[row] * portion[:, None] / 100
+        if subtract:
+            remaining[:] -= item
+        food_rows.append(row)
+        portions.append(portion)
+        nutrients.append(item)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # 1. Vegetables get a standard portion
+        for row in rows["vegetables"].T:
+            add_item(row, np.full(n_meals, 100.0))
+
+        # 2. Fats fill the remaining fat, capped at 30g
+        for row in rows["fats"].T:
+            add_item(row, _fat_portion(row, remaining[:, FAT]))
+
+        # 3. Carbs fill the remaining carbs within the per-food range
+        for row in rows["carbs"].T:
+            add_item(row, _carb_portion(row, remaining[:, CARBS]))
+
+        # 4. Proteins split the remaining protein evenly
+        protein_rows = rows["proteins"]
+        if protein_rows.shape[1]:
+            protein_per_food = remaining[:, PROTEIN] / protein_rows.shape[1]
+            for row in protein_rows.T:
+                add_item(row, _protein_portion(row, protein_per_food), subtract=False)
+
+    if not food_rows:
+        return (np.empty((n_meals, 0), dtype=np.intp), np.empty((n_meals, 0)),
+                np.empty((n_meals, 0, len(NUTRIENTS))))
+    return np.stack(food_rows, axis=1), np.stack(portions, axis=1), np.stack(nutrients, axis=1)
+
+
+# Up to this many meals, plain Python is faster than setting up the arrays
+SCALAR_MEALS = 48
+FOOD_CACHE_SIZE = 65536
+_food_cache = {}
+
+
+def _food_values(food):
+    """(name, FOOD_MATRIX row, row values as Python floats) of a food given by id or name (cached;
+    cleared when catalog rows change)"""
+    entry = _food_cache.get(food)
+    if entry is None:
+        if len(_food_cache) >= FOOD_CACHE_SIZE:
+            _food_cache.clear()
+        row = food_id(food)
+        name = food if isinstance(food, str) else FOOD_CATALOG.name_of(row)
+        entry = _food_cache[food] = (name, row, tuple(FOOD_MATRIX[row].tolist()))
+    return entry
+
+
+def _scalar_meal_items(foods, protein_target, carbs_target, fat_target):
+    """One meal through the greedy engine in plain Python, with the same arithmetic and output as
+    compute_portion_arrays and _meal_items; returns (meal_items, unrounded portions)"""
+    protein_left, carbs_left, fat_left = float(protein_target), float(carbs_target), float(fat_target)
+    meal_items, portions, added = [], [], []
+
+    for food in foods["vegetables"]:
+        name, _, (calories, protein, carbs, fat) = _food_values(food)
+        calories, protein, carbs, fat = calories * 100.0 / 100, protein * 100.0 / 100, carbs * 100.0 / 100, \
+            fat * 100.0 / 100
+        protein_left, carbs_left, fat_left = protein_left - protein, carbs_left - carbs, fat_left - fat
+        meal_items.append({"Food": name, "Amount (g)": 100, "Calories": calories,
+                           "Protein (g)": protein, "Carbs (g)": carbs, "Fat (g)": fat})
+        portions.append(100.0)
+
+    for food in foods["fats"]:
+        name, _, (calories, protein, carbs, fat) = _food_values(food)
+        portion = min((fat_left * 100) / fat, float(FAT_MAX_PORTION)) if fat > 0 else 15.0
+        calories, protein, carbs, fat = calories * portion / 100, protein * portion / 100, carbs * portion / 100, \
+            fat * portion / 100
+        protein_left, carbs_left, fat_left = protein_left - protein, carbs_left - carbs, fat_left - fat
+        added.append((name, portion, calories, protein, carbs, fat))
+
+    for food in foods["carbs"]:
+        name, row, (calories, protein, carbs, fat) = _food_values(food)
+        if carbs > 0:
+            largest = 150.0 if row in LARGE_CARB_PORTION_ID_SET else 100.0
+            portion = max(min((carbs_left * 100) / carbs, largest), float(CARB_MIN_PORTION))
+        else:
+            portion = 50.0
+        calories, protein, carbs, fat = calories * portion / 100, protein * portion / 100, carbs * portion / 100, \
+            fat * portion / 100
+        protein_left, carbs_left, fat_left = protein_left - protein, carbs_left - carbs, fat_left - fat
+        added.append((name, portion, calories, protein, carbs, fat))
+
+    if foods["proteins"]:
+        protein_per_food = protein_left / len(foods["proteins"])
+        for food in foods["proteins"]:
+            name, row, (calories, protein, carbs, fat) = _food_values(food)
+            if protein > 0:
+                largest = 200.0 if row in LARGE_PROTEIN_PORTION_ID_SET else 150.0
+                portion = max(min((protein_per_food * 100) / protein, largest), float(PROTEIN_MIN_PORTION))
+            else:
+                portion = 100.0
+            added.append((name, portion, calories * portion / 100, protein * portion / 100, carbs * portion / 100,
+                          fat * portion / 100))
+
+    for name, portion, calories, protein, carbs, fat in added:
+        meal_items.append({"Food": name, "Amount (g)": round(portion), "Calories": round(calories),
+                           "Protein (g)": round(protein, 1), "Carbs (g)": round(carbs, 1), "Fat (g)": round(fat, 1)})
+        portions.append(portion)
+    return meal_items, portions
+
+
+def _round_like_python(values, ndigits):
+    """np.round that matches Python's round() exactly, deferring to it near ties"""
+    rounded = np.round(values, ndigits)
+    scaled = values * 10 ** ndigits
+    near_tie = np.abs(np.abs(scaled - np.floor(scaled)) - 0.5) < 1e-6
+    if near_tie.any():
+        rounded[near_tie] = [round(value, ndigits) for value in values[near_tie].tolist()]
+    return rounded
+
+
+def _item_dicts(food_rows, portions, calories, protein, carbs, fat):
+    """Meal item dicts for flattened item columns"""
+    # Names are looked up once per distinct food
+    rows, codes = np.unique(food_rows.ravel(), return_inverse=True)
+    names = [FOOD_CATALOG.name_of(row) for row in rows.tolist()]
+    return [
+        {"Food": name, "Amount (g)": amount, "Calories": cals,
+         "Protein (g)": prot, "Carbs (g)": carb, "Fat (g)": fats}
+        for name, amount, cals, prot, carb, fats in zip(
+            map(names.__getitem__, codes.tolist()), portions.ravel().tolist(), calories.ravel().tolist(),
+            protein.ravel().tolist(), carbs.ravel().tolist(), fat.ravel().tolist())
+    ]
+
+
+def _meal_items(food_rows, portions, nutrients, num_vegetables):
+    """Build the meal item dicts for a stack of meals from their portion arrays"""
+    amounts = np.rint(portions).astype(np.int64)
+
+    # Vegetable values are shown unrounded, everything else is rounded for display
+    veg = slice(None, num_vegetables)
+    vegetables = _item_dicts(food_rows[:, veg], amounts[:, veg], *nutrients[:, veg].transpose(2, 0, 1))
+
+    rest = slice(num_vegetables, None)
+    others = _item_dicts(
+        food_rows[:, rest],
+        amounts[:, rest],
+        np.rint(nutrients[:, rest, CALORIES]).astype(np.int64),
+        *_round_like_python(nutrients[:, rest, PROTEIN:], 1).transpose(2, 0, 1)
+    )
+
+    num_others = food_rows.shape[1] - num_vegetables
+    return [vegetables[meal * num_vegetables:(meal + 1) * num_vegetables]
+            + others[meal * num_others:(meal + 1) * num_others]
+            for meal in range(len(food_rows))]
+
+
+def group_by_shape(meals):
+    """Indices of meals with the same number of foods per category, keyed by that shape"""
+    groups = {}
+    selections = itemgetter(*CATEGORY_ORDER)
+    for meal_idx, foods in enumerate(meals):
+        groups.setdefault(tuple(map(len, selections(foods))), []).append(meal_idx)
+    return groups
+
+
+def iter_portion_stacks(meals, protein_targets, carbs_targets, fat_targets, groups=None):
+    """Run the portion engine over meals grouped by selection shape
+
+    Yields (meal_indices, num_vegetables, food_rows, portions, nutrients) per group of
+    groups (default: group_by_shape(meals)), where the arrays are stacked in meal_indices order.
+    """
+    num_meals = len(meals)
+    protein_targets = np.broadcast_to(np.asarray(protein_targets, dtype=np.float64), (num_meals,))
+    carbs_targets = np.broadcast_to(np.asarray(carbs_targets, dtype=np.float64), (num_meals,))
+    fat_targets = np.broadcast_to(np.asarray(fat_targets, dtype=np.float64), (num_meals,))
+
+    # Meals with the same number of foods per category are computed as one stack
+    groups = group_by_shape(meals) if groups is None else groups
+    for shape, meal_indices in groups.items():
+        group_meals = [meals[meal_idx] for meal_idx in meal_indices]
+        rows = {}
+        for category, size in zip(CATEGORY_ORDER, shape):
+            foods = list(chain.from_iterable(map(itemgetter(category), group_meals)))
+            # Each distinct food is resolved once
+            ids = {food: food_id(food) for food in set(foods)}
+            rows[category] = np.array(list(map(ids.__getitem__, foods)), dtype=np.intp).reshape(
+                len(meal_indices), size)
+        food_rows, portions, nutrients = compute_portion_arrays(
+            rows,
+            protein_targets[meal_indices],
+            carbs_targets[meal_indices],
+            fat_targets[meal_indices]
+        )
+        yield meal_indices, shape[0], food_rows, portions, nutrients
+
+
+@reads_catalog
+def calculate_portions_many(meals, protein_targets, carbs_targets, fat_targets, with_portions=False):
+    """Calculate food portions for many meals at once, one meal_items list per meal (or, with
+    with_portions, a (meal_items, unrounded portions) pair per meal)
+
+    Selection shapes with at most SCALAR_MEALS meals run through plain Python, larger
+    ones through the array engine; both give the same results.
+    """
+    targets = [[target] * len(meals) if isinstance(target, (int, float)) else
+               target if isinstance(target, list) and len(target) == len(meals) else
+               np.broadcast_to(np.asarray(target, dtype=np.float64), (len(meals),)).tolist()
+               for target in (protein_targets, carbs_targets, fat_targets)]
+    if len(meals) <= SCALAR_MEALS:
+        results = [_scalar_meal_items(foods, *meal_targets) for foods, meal_targets in zip(meals, zip(*targets))]
+        return results if with_portions else [meal_items for meal_items, _ in results]
+
+    results = [None] * len(meals)
+    stacked = {}
+    for shape, meal_indices in group_by_shape(meals).items():
+        if len(meal_indices) > SCALAR_MEALS:
+            stacked[shape] = meal_indices
+            continue
+        for meal_idx in meal_indices:
+            result = _scalar_meal_items(meals[meal_idx], targets[0][meal_idx], targets[1][meal_idx],
+                                        targets[2][meal_idx])
+            results[meal_idx] = result if with_portions else result[0]
+    for meal_indices, num_vegetables, food_rows, portions, nutrients in iter_portion_stacks(
+            meals, *targets, groups=stacked):
+        stack = _meal_items(food_rows, portions, nutrients, num_vegetables)
+        if with_portions:
+            stack = list(zip(stack, portions.tolist()))
+        for meal_idx, result in zip(meal_indices, stack):
+            results[meal_idx] = result
+    return results
+
+
+# Optimize solver: macro errors are weighted by calories per gram of protein, carbs and fat
+MACRO_WEIGHTS = (4, 4, 9)
+RIDGE = 1e-6  # Tiny pull toward the middle of each portion range so ties have one answer
+MAX_SOLVER_ITERATIONS = 50
+SOLVER_CACHE_SIZE = 1024
+_solver_cache = OrderedDict()
+_solver_lock = threading.Lock()  # Guards _solver_cache; the service and batch threads share it
+
+
+def _portion_bounds(foods):
+    """Rows and (min, max) portion bounds of the non-vegetable foods, in meal order"""
+    rows, lower, upper = [], [], []
+    for fat_food in foods['fats']:
+        rows.append(food_id(fat_food))
+        lower.append(0)
+        upper.append(FAT_MAX_PORTION)
+    for carb_food in foods['carbs']:
+        rows.append(food_id(carb_food))
+        lower.append(CARB_MIN_PORTION)
+        upper.append(carb_max_portion(rows[-1]))
+    for protein_food in foods['proteins']:
+        rows.append(food_id(protein_food))
+        lower.append(PROTEIN_MIN_PORTION)
+        upper.append(protein_max_portion(rows[-1]))
+    return rows, np.array(lower, dtype=np.float64), np.array(upper, dtype=np.float64)
+
+
+def _solver_entry(rows, lower, upper):
+    """Cached problem matrices, factorizations and last solution for a food combination"""
+    key = tuple(rows)
+    with _solver_lock:
+        entry = _solver_cache.get(key)
+        if entry is not None:
+            _solver_cache.move_to_end(key)
+            return entry, True
+
+        weighted = FOOD_MATRIX[rows, PROTEIN:].T / 100 * np.asarray(MACRO_WEIGHTS, dtype=np.float64)[:, None]
+        midpoint = (lower + upper) / 2
+        entry = {
+            "weighted": weighted,
+            "hessian": weighted.T @ weighted + RIDGE * np.eye(len(rows)),
+            "pull": RIDGE * midpoint,
+            "lower": lower,
+            "upper": upper,
+            "inverses": {},  # Inverse of the free block of the hessian, keyed by free-variable mask
+            "solution": midpoint
+        }
+        _solver_cache[key] = entry
+        if len(_solver_cache) > SOLVER_CACHE_SIZE:
+            _solver_cache.popitem(last=False)
+    return entry, False
+
+
+def _solve_bounded(entry, targets):
+    """Active-set solve of the bounded weighted least-squares problem, warm started"""
+    hessian, lower, upper = entry["hessian"], entry["lower"], entry["upper"]
+    gradient_offset = entry["weighted"].T @ (targets * np.asarray(MACRO_WEIGHTS, dtype=np.float64)) + entry["pull"]
+
+    # Start from the previous solution for this combination, with its bounds as the working set
+    x = np.clip(entry["solution"], lower, upper)
+    fixed = (x <= lower) | (x >= upper)
+
+    for iteration in range(1, MAX_SOLVER_ITERATIONS + 1):
+        free = ~fixed
+        mask = free.tobytes()
+        inverse = entry["inverses"].get(mask)
+        if inverse is None:
+            inverse = np.linalg.inv(hessian[np.ix_(free, free)]) if free.any() else np.empty((0, 0))
+            entry["inverses"][mask] = inverse
+
+        # Unconstrained optimum over the free portions with the fixed ones held at their bounds
+        step = np.zeros_like(x)
+        step[free] = inverse @ (gradient_offset[free] - hessian[np.ix_(free, fixed)] @ x[fixed]) - x[free]
+
+        # Move as far as the bounds allow; a bound that blocks the step joins the working set
+        with np.errstate(divide="ignore", invalid="ignore"):
+            limits = np.where(step < 0, (lower - x) / step, np.where(step > 0, (upper - x) / step, np.inf))
+        limits[fixed] = np.inf
+        blocking = int(np.argmin(limits))
+        if limits[blocking] < 1:
+            x += limits[blocking] * step
+            x[blocking] = lower[blocking] if step[blocking] < 0 else upper[blocking]
+            fixed[blocking] = True
+            continue
+        x += step
+
+        # Release the fixed portion whose bound is pulling hardest in the wrong direction
+        gradient = hessian @ x - gradient_offset
+        wrong_way = np.where(fixed & (x <= lower), -gradient, 0) + np.where(fixed & (x >= upper), gradient, 0)
+        release = int(np.argmax(wrong_way)) if len(x) else 0
+        if not len(x) or wrong_way[release] <= 1e-9:
+            break
+        fixed[release] = False
+
+    entry["solution"] = x.copy()
+    return x, iteration
+
+
+def _optimize_portions(foods, protein_target, carbs_target, fat_target):
+    """Size every selected food at once by bounded least squares, never ending further from the
+    targets than greedy after rounding; returns (meal_items, info) with the unrounded portions in info"""
+    vegetable_rows = [food_id(veg) for veg in foods['vegetables']]
+    rows, lower, upper = _portion_bounds(foods)
+
+    # Vegetables keep their standard portion and count against the targets
+    targets = np.array([protein_target, carbs_target, fat_target], dtype=np.float64)
+    targets -= FOOD_MATRIX[vegetable_rows, PROTEIN:].sum(axis=0)
+
+    portions = np.empty(0)
+    iterations, cached = 0, False
+    if rows:
+        entry, cached = _solver_entry(rows, lower, upper)
+        portions, iterations = _solve_bounded(entry, targets)
+
+    food_rows = np.array(vegetable_rows + rows, dtype=np.intp)
+    portions = np.concatenate([np.full(len(vegetable_rows), 100.0), portions])
+    nutrients = FOOD_MATRIX[food_rows] * portions[:, None] / 100
+    meal_items = _meal_items(food_rows[None], portions[None], nutrients[None], len(vegetable_rows))[0]
+
+    # Rounding the portions can leave the least-squares answer behind greedy's; keep the closer one
+    (greedy_items, greedy_portions), = calculate_portions_many([foods], protein_target, carbs_target, fat_target,
+                                                               with_portions=True)
+    if (portion_residual(greedy_items, protein_target, carbs_target, fat_target)
+            < portion_residual(meal_items, protein_target, carbs_target, fat_target)):
+        return greedy_items, {"iterations": iterations, "cached": cached, "greedy": True, "portions": greedy_portions}
+    return meal_items, {"iterations": iterations, "cached": cached, "greedy": False, "portions": portions.tolist()}
+
+
+@timed("solve_portions")
+@reads_catalog
+def solve_portions(foods, protein_target, carbs_target, fat_target, solver="greedy"):
+    """Calculate food portions with the chosen solver and report its time, residual and the unrounded
+    portions behind the meal items"""
+    start = time.perf_counter()
+    if solver == "greedy":
+        (meal_items, portions), = calculate_portions_many([foods], protein_target, carbs_target, fat_target,
+                                                          with_portions=True)
+        info = {"portions": portions}
+    elif solver == "optimize":
+        meal_items, info = _optimize_portions(foods, protein_target, carbs_target, fat_target)
+    else:
+        raise ValueError(f"Unknown solver '{solver}', expected 'greedy' or 'optimize'")
+    elapsed = time.perf_counter() - start
+
+    residual = portion_residual(meal_items, protein_target, carbs_target, fat_target)
+    return meal_items, dict(info, solver=solver, time_ms=elapsed * 1000, residual=residual)
+
+
+def portion_residual(meal_items, protein_target, carbs_target, fat_target):
+    """Calorie-weighted distance between a meal's macro totals and its targets"""
+    errors = [
+        sum(item[column] for item in meal_items) - target
+        for column, target in (("Protein (g)", protein_target), ("Carbs (g)", carbs_target),
+                               ("Fat (g)", fat_target))
+    ]
+    return sum((weight * error) ** 2 for weight, error in zip(MACRO_WEIGHTS, errors)) ** 0.5
+
+
+def calculate_portions(foods, protein_target, carbs_target, fat_target, solver="greedy"):
+    """Calculate food portions to meet macro targets"""
+    if solver == "greedy":
+        return calculate_portions_many([foods], protein_target, carbs_target, fat_target)[0]
+    return solve_portions(foods, protein_target, carbs_target, fat_target, solver)[0]
+
+
+# Meal suggestions: one protein, carb and vegetable plus an optional fat, ranked by how
+# closely their greedy portions meet the targets
+SUGGESTION_SHORTLIST = 48  # Foods per category kept for the combination search
+SUGGESTION_PREFIX_CHUNK = 64  # Vegetable/fat prefixes completed per branch-and-bound step
+SUGGESTION_TIME_BUDGET_MS = 50
+# Most that rounding the fat, carb and protein macros to 0.1 g can move a residual
+SUGGESTION_ROUNDING_SLACK = 3 * 0.05 * float(np.linalg.norm(MACRO_WEIGHTS)) + 1e-9
+
+
+def _suggestion_shortlist(category, target, weights):
+    """Foods of a category that fill their own role best, judged from their nutrient vectors alone"""
+    ids, nutrients = FOOD_CATALOG.distinct_in(category)
+    if len(ids) <= SUGGESTION_SHORTLIST:
+        return ids
+
+    # Portion each food as if it were the only one in its category; the macro it is portioned
+    # for should land on target and the others should not overshoot
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if category == "fats":
+            portion = _fat_portion(ids, target[FAT])
+        elif category == "carbs":
+            portion = _carb_portion(ids, target[CARBS])
+        elif category == "proteins":
+            portion = _protein_portion(ids, target[PROTEIN])
+        else:
+            portion = np.full(len(ids), 100.0)
+    macros = slice(PROTEIN, None)
+    miss = nutrients[:, macros] * (portion / 100)[:, None]
+    miss -= target[macros]
+    role = {"fats": FAT, "carbs": CARBS, "proteins": PROTEIN}.get(category)
+    role_miss = miss[:, role - PROTEIN].copy() if role is not None else None
+    np.maximum(miss, 0, out=miss)
+    if role is not None:
+        miss[:, role - PROTEIN] = role_miss
+    miss *= weights[macros]
+    score = np.einsum("ij,ij->i", miss, miss)
+    return ids[np.argpartition(score, SUGGESTION_SHORTLIST)[:SUGGESTION_SHORTLIST]]
+
+
+@timed("suggest_meals")
+@reads_catalog
+def suggest_meals(protein_target, carbs_target, fat_target, k=5, time_budget_ms=SUGGESTION_TIME_BUDGET_MS,
+                  workers=None):
+    """Search food combinations for the k whose greedy portions best meet the targets
+
+    Every vegetable/fat prefix of the per-category shortlists is scored at once, then prefixes
+    are completed with every carb and protein, best lower bound first, in waves of one chunk
+    per worker thread (the work is large numpy operations, which release the GIL). Meals are
+    ranked on their rounded macros, as portion_residual sees them. The search stops when no
+    remaining prefix can beat the k-th best meal (the result is then exact for the shortlists)
+    or before a wave would overrun time_budget_ms. Returns (suggestions, info),
+    best first, where each suggestion has "foods" (a meal_data-style selection), "meal_items"
+    and "residual".
+    """
+    start = time.perf_counter()
+    deadline = start + time_budget_ms / 1000
+    workers = workers or os.cpu_count() or 1
+    if workers > 1:
+        # Only the suggestion search uses threads, so workers that never suggest skip the import
+        from concurrent.futures import ThreadPoolExecutor
+    pool = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+    run = pool.map if pool else map
+    target = np.array([0.0, protein_target, carbs_target, fat_target])
+    weights = np.array((0.0,) + MACRO_WEIGHTS)
+
+    try:
+        vegetables, fats, carbs, proteins = run(
+            lambda category: _suggestion_shortlist(category, target, weights), CATEGORY_ORDER)
+        if not (len(vegetables) and len(carbs) and len(proteins)):
+            return [], {"time_ms": (time.perf_counter() - start) * 1000, "searched": 0, "exhaustive": True}
+
+        macros = slice(PROTEIN, None)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # 1. Remaining macros after every vegetable and fat (-1 is no fat)
+            after_veg = target - FOOD_MATRIX[vegetables] * 100.0 / 100
+            fat_portions = _fat_portion(fats[None, :], after_veg[:, None, FAT])
+            fat_added = FOOD_MATRIX[fats] * fat_portions[..., None] / 100
+            prefix_remaining = np.concatenate([after_veg[:, None], after_veg[:, None] - fat_added],
+                                              axis=1).reshape(-1, len(NUTRIENTS))
+            # The same with the fat's macros rounded like the meal items; vegetables stay unrounded
+            after_fat_rounded = after_veg[:, None, macros] - _round_like_python(fat_added[..., macros], 1)
+            prefix_rounded = np.concatenate([after_veg[:, None, macros], after_fat_rounded],
+                                            axis=1).reshape(-1, len(NUTRIENTS) - PROTEIN)
+            prefix_veg = np.repeat(vegetables, len(fats) + 1)
+            prefix_fat = np.tile(np.concatenate([[-1], fats]), len(vegetables))
+
+            # 2. Carbs and proteins add at least their smallest portions and nothing takes macros
+            # away, so any overshoot left after that, less what rounding can shift, is a lower bound
+            # on a prefix's final residual
+            least_added = (FOOD_MATRIX[carbs].min(axis=0) * CARB_MIN_PORTION / 100
+                           + FOOD_MATRIX[proteins].min(axis=0) * PROTEIN_MIN_PORTION / 100)
+            bound = np.sqrt(((np.minimum(prefix_remaining - least_added, 0) * weights) ** 2).sum(axis=1))
+            bound -= SUGGESTION_ROUNDING_SLACK
+            order = np.argsort(bound, kind="stable")
+            chunks = [order[chunk_start:chunk_start + SUGGESTION_PREFIX_CHUNK]
+                      for chunk_start in range(0, len(order), SUGGESTION_PREFIX_CHUNK)]
+
+        def complete(chunk):
+            """Best k carb/protein completions of a chunk of prefixes, as (residuals, combos)"""
+            with np.errstate(divide="ignore", invalid="ignore"):
+                remaining = prefix_remaining[chunk]
+                carb_portions = _carb_portion(carbs[None, :], remaining[:, None, CARBS])
+                carb_added = FOOD_MATRIX[carbs] * carb_portions[..., None] / 100
+                after_carb = remaining[:, None] - carb_added
+                protein_portions = _protein_portion(proteins[None, None, :], after_carb[:, :, None, PROTEIN])
+                protein_added = FOOD_MATRIX[proteins][..., macros] * protein_portions[..., None] / 100
+                final = (prefix_rounded[chunk][:, None, None]
+                         - _round_like_python(carb_added[..., macros], 1)[:, :, None]
+                         - _round_like_python(protein_added, 1))
+                residuals = np.sqrt(((final * weights[macros]) ** 2).sum(axis=-1)).ravel()
+
+            top = np.argpartition(residuals, k - 1)[:k] if len(residuals) > k else np.arange(len(residuals))
+            prefix, carb, protein = np.unravel_index(top, final.shape[:3])
+            combos = np.column_stack([prefix_veg[chunk[prefix]], prefix_fat[chunk[prefix]], carbs[carb],
+                                      proteins[protein]])
+            return residuals[top], combos
+
+        # 3. Branch and bound over the prefixes, one wave of chunks at a time
+        best_residuals = np.empty(0)
+        best_combos = np.empty((0, 4), dtype=np.intp)
+        searched = 0
+        wave_time = 0.0
+        for wave_start in range(0, len(chunks), workers):
+            wave = chunks[wave_start:wave_start + workers]
+            if len(best_residuals) == k and bound[wave[0][0]] >= best_residuals[-1]:
+                searched = len(order)
+                break
+            # Stop before a wave that would not finish within the budget
+            wave_started = time.perf_counter()
+            if wave_start and wave_started + wave_time > deadline:
+                break
+
+            for residuals, combos in run(complete, wave):
+                best_residuals = np.concatenate([best_residuals, residuals])
+                best_combos = np.concatenate([best_combos, combos])
+            keep = np.argsort(best_residuals, kind="stable")[:k]
+            best_residuals, best_combos = best_residuals[keep], best_combos[keep]
+            searched += sum(len(chunk) for chunk in wave)
+            wave_time = time.perf_counter() - wave_started
+    finally:
+        if pool:
+            pool.shutdown()
+
+    # 4. Portion the winners with the real engine
+    selections = [
+        {"proteins": [int(protein)], "carbs": [int(carb)], "vegetables": [int(veg)],
+         "fats": [int(fat)] if fat >= 0 else []}
+        for veg, fat, carb, protein in best_combos.tolist()
+    ]
+    suggestions = [
+        {"foods": {category: [FOOD_CATALOG.name_of(food) for food in foods] for category, foods in selection.items()},
+         "meal_items": meal_items,
+         "residual": portion_residual(meal_items, protein_target, carbs_target, fat_target)}
+        for selection, meal_items in zip(
+            selections, calculate_portions_many(selections, protein_target, carbs_target, fat_target))
+    ]
+    suggestions.sort(key=lambda suggestion: suggestion["residual"])
+    info = {"time_ms": (time.perf_counter() - start) * 1000, "searched": searched,
+            "exhaustive": searched == len(order)}
+    return suggestions, info
+
+
+# Meal table column holding each macro
+MACRO_COLUMNS = {"calories": "Calories", "protein": "Protein (g)", "carbs": "Carbs (g)", "fat": "Fat (g)"}
+
+
+def meal_targets(macro_data, num_meals):
+    """Even per-meal split of the daily average targets"""
+    return {macro: round(macro_data[macro]['avg'] / num_meals) for macro in MACRO_COLUMNS}
+
+
+def meal_totals(meal_items):
+    """TOTAL row of a meal table"""
+    totals = {"Food": "TOTAL", "Amount (g)": sum(item["Amount (g)"] for item in meal_items)}
+    for column in MACRO_COLUMNS.values():
+        total = sum(item[column] for item in meal_items)
+        totals[column] = round(total) if column == "Calories" else round(total, 1)
+    return totals
+
+
+# Micronutrient targets per 1000 kcal eaten, as (bound, amount): fiber is a floor, sugar and
+# sodium are ceilings. Nutrients the catalog tracks without a limit are reported without a target.
+MICRONUTRIENT_LIMITS = {"fiber": ("at least", 14), "sugar": ("at most", 25), "sodium": ("at most", 1150)}
+
+
+@reads_catalog
+def micronutrient_totals(meal_items, portions=None):
+    """Every micronutrient the catalog tracks, summed over meal items with one sparse matrix-vector
+    product (an empty dict when the catalog tracks none)
+
+    portions are the solver's unrounded grams in meal item order (solver_info["portions"]), the
+    ones the macros were computed from; without them the rounded amounts are used. Foods no
+    longer in the catalog are left out.
+    """
+    micros = FOOD_CATALOG.micros
+    if not micros.names:
+        return {}
+    if portions is None:
+        portions = [item["Amount (g)"] for item in meal_items]
+    ids, grams = [], []
+    for item, portion in zip(meal_items, portions):
+        if item["Food"] in FOOD_CATALOG:
+            ids.append(_food_values(item["Food"])[1])
+            grams.append(portion)
+    totals = micros.totals(ids, grams)
+    return dict(zip(micros.names, np.round(totals, 1).tolist()))
+
+
+def micronutrient_targets(calories):
+    """(bound, amount) for each tracked micronutrient with a limit, scaled to calories"""
+    return {name: (bound, round(amount * calories / 1000, 1)) for name, (bound, amount) in MICRONUTRIENT_LIMITS.items()
+            if name in FOOD_CATALOG.micros.names}
+
+
+def missing_categories(foods):
+    """Required categories with nothing selected"""
+    required = (("proteins", "protein"), ("carbs", "carbs"), ("vegetables", "vegetables"))
+    return [label for category, label in required if not foods.get(category)]
+
+
+@timed("plan_day")
+@reads_catalog
+def plan_day(meals, macro_data, solver="greedy", carry_over=False):
+    """Calculate portions for every meal of a day in one pass
+
+    meals holds one food selection per meal (None to leave a meal out). Each meal gets the
+    even split of the daily averages; with carry_over, what earlier meals missed or overshot
+    is spread over the meals that follow, so the day totals track the daily targets.
+    Returns {"meals": [{"targets", "meal_items", "totals", "solver_info"} or None], "totals"}.
+    """
+    num_meals = len(meals)
+    even_targets = meal_targets(macro_data, num_meals)
+    results = [None] * num_meals
+
+    if solver == "greedy" and not carry_over:
+        # Independent meals go through the vectorized engine together
+        start = time.perf_counter()
+        planned = [meal_idx for meal_idx, foods in enumerate(meals) if foods is not None]
+        stack = calculate_portions_many([meals[meal_idx] for meal_idx in planned], even_targets["protein"],
+                                        even_targets["carbs"], even_targets["fat"], with_portions=True)
+        time_ms = (time.perf_counter() - start) * 1000 / max(len(planned), 1)
+        for meal_idx, (meal_items, portions) in zip(planned, stack):
+            residual = portion_residual(meal_items, even_targets["protein"], even_targets["carbs"],
+                                        even_targets["fat"])
+            results[meal_idx] = {
+                "targets": dict(even_targets),
+                "meal_items": meal_items,
+                "totals": meal_totals(meal_items),
+                "solver_info": {"solver": solver, "time_ms": time_ms, "residual": residual, "portions": portions}
+            }
+    else:
+        remaining = {macro: macro_data[macro]['avg'] for macro in MACRO_COLUMNS}
+        for meal_idx, foods in enumerate(meals):
+            if carry_over:
+                meals_left = num_meals - meal_idx
+                targets = {macro: max(0, round(remaining[macro] / meals_left)) for macro in MACRO_COLUMNS}
+            else:
+                targets = dict(even_targets)
+            if foods is None:
+                continue
+
+            meal_items, solver_info = solve_portions(foods, targets["protein"], targets["carbs"], targets["fat"],
+                                                     solver=solver)
+            totals = meal_totals(meal_items)
+            results[meal_idx] = {"targets": targets, "meal_items": meal_items, "totals": totals,
+                                 "solver_info": solver_info}
+            for macro, column in MACRO_COLUMNS.items():
+                remaining[macro] -= totals[column]
+
+    day_totals = {
+        macro: round(sum(result["totals"][column] for result in results if result is not None), 1)
+        for macro, column in MACRO_COLUMNS.items()
+    }
+    day_totals["calories"] = round(day_totals["calories"])
+    return {"meals": results, "totals": day_totals}
+
+
+def calculate_macros(weight, goal, activity_level, split=None, body_type=None):
+    """Calculate macros using MakeMeal's calorie ranges with the standard, a custom or a body type's
+    macro split (standard splits are cached across sessions)"""
+    return macro_dict(macro_values(weight, goal, activity_level, split=split, body_type=body_type))
+
+
+def _foods_changed(ids):
+    """Pick up catalog rows a recipe change added or rewrote: rebind FOOD_MATRIX and drop the
+    solver entries built from changed rows (runs under the catalog's write lock, so no plan in
+    progress sees the swap)"""
+    global FOOD_MATRIX
+    FOOD_MATRIX = FOOD_CATALOG.nutrients
+    _food_cache.clear()
+    changed = set(ids)
+    with _solver_lock:
+        for key in [key for key in _solver_cache if changed.intersection(key)]:
+            del _solver_cache[key]
+
+
+# Recipes from the MACROCOUNTER_RECIPES file are catalog rows like any other food
+RECIPE_BOOK = RecipeBook(FOOD_CATALOG, on_change=_foods_changed)
+RECIPES_PATH = os.environ.get("MACROCOUNTER_RECIPES")
+_reload_recipes = watch_recipe_file(RECIPE_BOOK, RECIPES_PATH) if RECIPES_PATH else None
+
+
+def reload_recipes():
+    """Load the recipe file again if it changed; returns the names of the recomputed recipes"""
+    return _reload_recipes() if _reload_recipes is not None else []
+
+
+try:
+    reload_recipes()
+except (OSError, ValueError) as e:
+    # A broken recipe file leaves the built-in foods usable; it is loaded again once it changes
+    print(f"Recipe file {RECIPES_PATH} not loaded: {e}", file=sys.stderr)
+
+
+# Command line tools, none of which load Streamlit
+COMMANDS = ("batch", "serve", "grocery", "build-food-db", "build-macro-table")
+
+
+def main(argv=None):
+    """Run one of COMMANDS with its arguments"""
+    argv = sys.argv[1:] if argv is None else argv
+    command, argv = (argv[0], argv[1:]) if argv else (None, [])
+    if command == "batch":
+        import batch
+        return batch.main(argv)
+    if command == "serve":
+        import service
+        return service.main(argv)
+    if command == "grocery":
+        import grocery
+        return grocery.main(argv)
+    if command == "build-food-db":
+        return build_food_db(argv)
+    if command == "build-macro-table":
+        return build_macro_table(argv)
+    print(f"Usage: python planner.py {'|'.join(COMMANDS)} ...", file=sys.stderr)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+"""Recipes: composite foods made of weighted catalog ingredients, flattened into catalog rows
+
+A recipe (a shake, a meal-prep box, a home recipe) lists grams of catalog foods, which may
+be other recipes, and optionally its finished weight. Each recipe becomes an ordinary
+catalog row holding its nutrients per 100 g, so the planner portions it exactly like a
+single ingredient. The row is computed once from the rows of its ingredients; nested
+recipes are resolved in dependency order rather than expanded down to base foods, and
+when a food or recipe changes only the recipes that (transitively) use it are recomputed.
+
+Recipe files are JSON objects of name -> recipe:
+
+    {"Protein Shake": {"category": "proteins", "ingredients": {"Greek Yogurt": 250, "Oats": 40}},
+     "Prep Box": {"category": "carbs", "ingredients": {"Protein Shake": 100, "Brown Rice (cooked)": 200},
+                  "yield_g": 280}}
+
+Set MACROCOUNTER_RECIPES to a recipe file to add its recipes to the planner's catalog, or
+compile them into a food database with 'python planner.py build-food-db --recipes FILE'.
+"""
+import json
+import os
+import threading
+
+import numpy as np
+
+from food_db import CATEGORIES
+
+
+def read_recipes(path):
+    """Recipe definitions from a JSON recipe file"""
+    with open(path) as f:
+        recipes = json.load(f)
+    if not isinstance(recipes, dict):
+        raise ValueError(f"{path} must hold a JSON object of recipe name -> recipe")
+    return recipes
+
+
+def _normalize(name, recipe):
+    """Validated copy of one recipe definition"""
+    if recipe.get("category") not in CATEGORIES:
+        raise ValueError(f"Recipe '{name}' needs a category, one of {', '.join(CATEGORIES)}")
+    ingredients = recipe.get("ingredients")
+    if not isinstance(ingredients, dict) or not ingredients:
+        raise ValueError(f"Recipe '{name}' needs ingredients as a food name -> grams object")
+    for food, grams in ingredients.items():
+        if isinstance(grams, bool) or not isinstance(grams, (int, float)) or not grams > 0:
+            raise ValueError(f"Recipe '{name}': grams of '{food}' must be a positive number")
+    total = sum(ingredients.values())
+    yield_g = recipe.get("yield_g", total)
+    if isinstance(yield_g, bool) or not isinstance(yield_g, (int, float)) or not yield_g > 0:
+        raise ValueError(f"Recipe '{name}': yield_g must be a positive number")
+    return {"category": recipe.get("category"), "ingredients": dict(ingredients), "yield_g": yield_g}
+
+
+class RecipeBook:
+    """Recipes of one catalog, kept in sync with their rows in it
+
+    on_change(ids) is called with the catalog ids whose nutrients were added or changed,
+    so holders of caches keyed on food rows can drop them. Changes, and on_change, run
+    under the catalog's write lock.
+    """
+
+    def __init__(self, catalog, on_change=None):
+        self.catalog = catalog
+        self.on_change = on_change
+        self.recipes = {}
+        self.ids = {}
+        self.dependents = {}  # Food id -> names of the recipes that use it directly
+        self._inputs = {}  # Recipe name -> (ingredient ids, grams / yield)
+
+    def __contains__(self, name):
+        return name in self.recipes
+
+    def ingredients_of(self, name, grams=None):
+        """A recipe's ingredients as food name -> grams, scaled to a portion of grams if given"""
+        recipe = self.recipes[name]
+        scale = 1 if grams is None else grams / recipe["yield_g"]
+        return {food: amount * scale for food, amount in recipe["ingredients"].items()}
+
+    def update(self, recipes):
+        """Add or redefine recipes; recomputes them and every recipe that uses them
+
+        Returns the names of the recomputed recipes, in the order they were computed.
+        """
+        with self.catalog.lock.writing():
+            recipes = {name: _normalize(name, recipe) for name, recipe in recipes.items()}
+            recipes = {name: recipe for name, recipe in recipes.items() if self.recipes.get(name) != recipe}
+            if not recipes:
+                return []
+            for name, recipe in recipes.items():
+                if name in self.recipes and recipe["category"] != self.recipes[name]["category"]:
+                    raise ValueError(f"Recipe '{name}' cannot move from {self.recipes[name]['category']} "
+                                     f"to {recipe['category']}")
+                if name not in self.recipes and name in self.catalog:
+                    raise ValueError(f"'{name}' is already a food in the catalog")
+            defined = dict(self.recipes, **recipes)
+            unknown = sorted({food for recipe in recipes.values() for food in recipe["ingredients"]
+                              if food not in defined and food not in self.catalog})
+            if unknown:
+                raise ValueError(f"Unknown ingredients: {', '.join(unknown)}")
+            self._order(recipes, defined)
+
+            # New recipes get their rows first, so recipes can use each other in any order
+            new = [name for name in recipes if name not in self.recipes]
+            if new:
+                new_ids = self.catalog.add_foods(new, [recipes[name]["category"] for name in new],
+                                                 np.zeros((len(new), self.catalog.nutrients.shape[1])))
+                self.ids.update(zip(new, new_ids.tolist()))
+            for name, recipe in recipes.items():
+                if name in self.recipes:
+                    for food in self.recipes[name]["ingredients"]:
+                        self.dependents[self._id_of(food)].discard(name)
+                self.recipes[name] = recipe
+                ingredient_ids = np.array([self._id_of(food) for food in recipe["ingredients"]], dtype=np.intp)
+                shares = np.array(list(recipe["ingredients"].values()), dtype=np.float64) / recipe["yield_g"]
+                self._inputs[name] = (ingredient_ids, shares)
+                for food_id in ingredient_ids.tolist():
+                    self.dependents.setdefault(food_id, set()).add(name)
+            return self._recompute(set(recipes) | self._affected([self.ids[name] for name in recipes]))
+
+    def update_food(self, name, nutrients, micronutrients=None):
+        """Change a base food's nutrients (and optionally micronutrients) per 100 g and recompute
+        the recipes that use it"""
+        with self.catalog.lock.writing():
+            if name in self.recipes:
+                raise ValueError(f"'{name}' is a recipe; change its ingredients instead")
+            food_id = self.catalog.id_of(name)
+            self.catalog.set_nutrients([food_id], [nutrients], None if micronutrients is None else [micronutrients])
+            return self._recompute(self._affected([food_id]), [food_id])
+
+    def load(self, path):
+        """Add or redefine the recipes of a recipe file; unchanged recipes are not recomputed"""
+        return self.update(read_recipes(path))
+
+    def _id_of(self, food):
+        return self.ids[food] if food in self.ids else self.catalog.id_of(food)
+
+    def _order(self, recipes, defined):
+        """Names of recipes in dependency order (ingredients first); ValueError on a cycle"""
+        order, state, wanted = [], {}, set(recipes)
+
+        def visit(name, path):
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "visiting":
+                raise ValueError(f"Recipes use each other in a cycle: {' -> '.join(path + [name])}")
+            state[name] = "visiting"
+            for food in defined[name]["ingredients"]:
+                if food in defined:
+                    visit(food, path + [name])
+            state[name] = "done"
+            if name in wanted:
+                order.append(name)
+
+        for name in recipes:
+            visit(name, [])
+        return order
+
+    def _affected(self, food_ids):
+        """Names of the recipes using any of food_ids, directly or through other recipes"""
+        affected, pending = set(), list(food_ids)
+        while pending:
+            for name in self.dependents.get(pending.pop(), ()):
+                if name not in affected:
+                    affected.add(name)
+                    pending.append(self.ids[name])
+        return affected
+
+    def _recompute(self, names, changed_ids=()):
+        """Recompute the rows of recipes from their ingredients' rows, ingredients first
+
+        Recipes are grouped into levels, each one above the highest recomputed recipe among
+        its ingredients, so a whole level is one weighted sum over its ingredients' rows.
+        """
+        order = self._order(sorted(names), self.recipes)
+        levels = {}
+        for name in order:
+            levels[name] = 1 + max((levels.get(food, -1) for food in self.recipes[name]["ingredients"]), default=-1)
+        recomputed = []
+        for level in range(max(levels.values(), default=-1) + 1):
+            level_names = [name for name in order if levels[name] == level]
+            inputs = [self._inputs[name] for name in level_names]
+            ingredient_ids = np.concatenate([ids for ids, _ in inputs])
+            shares = np.concatenate([shares for _, shares in inputs])
+            starts = np.cumsum([0] + [len(ids) for ids, _ in inputs[:-1]])
+            rows = np.add.reduceat(self.catalog.nutrients[ingredient_ids] * shares[:, None], starts, axis=0)
+            micro_rows = np.add.reduceat(self.catalog.micros.dense(ingredient_ids) * shares[:, None], starts, axis=0)
+            ids = [self.ids[name] for name in level_names]
+            self.catalog.set_nutrients(ids, rows, micro_rows)
+            recomputed += ids
+        if self.on_change is not None and (recomputed or changed_ids):
+            self.on_change(recomputed + list(changed_ids))
+        return order
+
+
+def watch_recipe_file(book, path):
+    """Reload function for a recipe file: loads it when its modification time changed since the last
+    call and returns the recomputed recipe names"""
+    seen = {"mtime": None}
+    lock = threading.Lock()
+
+    def reload():
+        with lock:
+            mtime = os.stat(path).st_mtime_ns
+            if mtime == seen["mtime"]:
+                return []
+            # A broken file is reported once, not on every call until it changes again
+            seen["mtime"] = mtime
+            return book.load(path)
+
+    return reload
@@ -0,0 +1,62 @@
+import csv
+
+import pyarrow.parquet as pq
+
+import batch
+from batch import run_batch
+
+ROW = {"weight": 180, "goal": "maintenance", "activity_level": "moderate", "meals_per_day": 2,
+       "proteins": "Salmon", "carbs": "Oats", "vegetables": "Kale", "fats": ""}
+
+
+def write_roster(path, rows):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=batch.ROSTER_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def test_rows_missing_a_required_category_are_skipped(tmp_path):
+    write_roster(tmp_path / "roster.csv", [
+        dict(ROW, name="ok"),
+        dict(ROW, name="no veg", vegetables=""),
+        dict(ROW, name="no carb in meal 2", carbs="Oats|"),
+    ])
+    stats = run_batch(str(tmp_path / "roster.csv"), str(tmp_path / "plan.parquet"), workers=1)
+    assert stats["clients"] == 3 and stats["skipped"] == 2
+    assert stats["errors"] == ["no veg: meal 1: select at least one food for: vegetables",
+                               "no carb in meal 2: meal 2: select at least one food for: carbs"]
+    assert set(pq.read_table(tmp_path / "plan.parquet").column("client").to_pylist()) == {"ok"}
+
+
+def test_error_messages_are_a_bounded_sample(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch, "MAX_ERROR_SAMPLE", 3)
+    write_roster(tmp_path / "roster.csv", [dict(ROW, name=f"client {i}", goal="bulk") for i in range(50)])
+    stats = run_batch(str(tmp_path / "roster.csv"), str(tmp_path / "plan.parquet"), workers=1, chunk_size=7)
+    assert stats["skipped"] == 50
+    assert len(stats["errors"]) == 3
+
+
+def test_rows_come_out_in_client_and_meal_order(tmp_path):
+    write_roster(tmp_path / "roster.csv", [
+        dict(ROW, name="a", meals_per_day=3, proteins="Salmon|Salmon;Egg Whites|Salmon"),
+        dict(ROW, name="b", meals_per_day=3, proteins="Salmon;Egg Whites|Salmon|Salmon;Egg Whites"),
+    ])
+    run_batch(str(tmp_path / "roster.csv"), str(tmp_path / "plan.parquet"), workers=1)
+    table = pq.read_table(tmp_path / "plan.parquet")
+    owners = list(zip(table.column("client").to_pylist(), table.column("meal").to_pylist()))
+    assert owners == sorted(owners)
+    assert [food for (client, meal), food in zip(owners, table.column("food").to_pylist())
+            if (client, meal) == ("a", 2)] == ["Kale", "Oats", "Salmon", "Egg Whites"]
+
+
+def test_weights_must_be_whole_numbers(tmp_path):
+    rows = [dict(ROW, name=f"client {i}") for i in range(20000)]
+    rows += [dict(ROW, name="fraction", weight=150.7), dict(ROW, name="text", weight="heavy"),
+             dict(ROW, name="whole float", weight="150.0")]
+    write_roster(tmp_path / "roster.csv", rows)
+    *_, last = batch.read_roster(str(tmp_path / "roster.csv"), 5000)
+    columns, _, errors = batch.plan_chunk(last)
+    assert errors == ["fraction: weight must be a whole number, got '150.7'",
+                      "text: weight must be a whole number, got 'heavy'"]
+    assert "whole float" in columns["client"]
@@ -0,0 +1,21 @@
+from client_store import ClientStore
+from planner import calculate_macros
+
+
+def test_body_type_and_split_round_trip(tmp_path):
+    store = ClientStore(str(tmp_path / "clients.db"))
+    macro_data = calculate_macros(180, "maintenance", "moderate", split=(0.3, 0.5, 0.2))
+    store.save_client("Dana", 180, "maintenance", "moderate", macro_data, split=(0.3, 0.5, 0.2))
+    store.save_client("Sam", 150, "weight_loss", "sedentary", calculate_macros(150, "weight_loss", "sedentary",
+                                                                       body_type="ectomorph"), body_type="ectomorph")
+
+    dana = store.get_client("Dana")
+    assert dana["split"] == (0.3, 0.5, 0.2) and dana["body_type"] is None
+    assert dana["macro_data"] == macro_data
+    assert [(client["name"], client["body_type"], client["split"]) for client in store.list_clients()] == [
+        ("Dana", None, (0.3, 0.5, 0.2)), ("Sam", "ectomorph", None)]
+
+    # Saving again without a custom split clears it
+    store.save_client("Dana", 180, "maintenance", "moderate", calculate_macros(180, "maintenance", "moderate"))
+    assert store.get_client("Dana")["split"] is None
+
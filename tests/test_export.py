@@ -0,0 +1,57 @@
+import io
+import json
+import zipfile
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc as pa_ipc
+import pyarrow.parquet as pq
+
+from batch import run_batch
+from export import PLAN_SCHEMA, TARGETS_SCHEMA, export_bytes
+from planner import calculate_macros, calculate_portions
+from test_batch import ROW, write_roster
+
+FOODS = {"proteins": ["Salmon"], "carbs": ["Oats"], "vegetables": ["Kale"], "fats": []}
+
+
+def plan_meals():
+    return [("ann", 1, meal, calculate_portions(FOODS, 40.0 + meal, 60.0, 15.0)) for meal in (1, 2)]
+
+
+def test_plan_round_trips_as_typed_columns():
+    meals = plan_meals()
+    items = [item for *_, meal_items in meals for item in meal_items]
+    table = pq.read_table(io.BytesIO(export_bytes(meals)))
+    assert table.schema == PLAN_SCHEMA
+    assert table.column("food").to_pylist() == [item["Food"] for item in items]
+    assert table.column("amount_g").to_pylist() == [item["Amount (g)"] for item in items]
+    assert table.column("meal").to_pylist() == [meal for _, _, meal, meal_items in meals for _ in meal_items]
+
+    with pa_ipc.open_file(pa.BufferReader(export_bytes(meals, format="arrow"))) as reader:
+        assert reader.read_all().equals(table.cast(reader.schema))
+
+
+def test_arrow_files_take_batches_with_different_foods(tmp_path):
+    write_roster(tmp_path / "roster.csv", [dict(ROW, name="a"), dict(ROW, name="b", carbs="Quinoa (cooked)"),
+                                           dict(ROW, name="c", proteins="Chicken Breast (skinless)")])
+    run_batch(str(tmp_path / "roster.csv"), str(tmp_path / "plan.arrow"), workers=1, chunk_size=1)
+    run_batch(str(tmp_path / "roster.csv"), str(tmp_path / "plan.parquet"), workers=1)
+    with pa_ipc.open_file(tmp_path / "plan.arrow") as reader:
+        assert reader.num_record_batches == 3
+        table = reader.read_all()
+    assert table.equals(pq.read_table(tmp_path / "plan.parquet").cast(table.schema))
+
+
+def test_bundle_holds_plan_targets_and_manifest():
+    macro_data = calculate_macros(180, "maintenance", "moderate")
+    data = export_bytes(plan_meals(), [("ann", macro_data)], format="zip", metadata={"client": "ann"})
+    with zipfile.ZipFile(io.BytesIO(data)) as bundle:
+        manifest = json.loads(bundle.read("manifest.json"))
+        targets = pq.read_table(io.BytesIO(bundle.read("targets.parquet")))
+        plan = pq.read_table(io.BytesIO(bundle.read("plan.parquet")))
+    assert manifest["client"] == "ann"
+    assert manifest["tables"]["plan"]["rows"] == plan.num_rows
+    assert targets.schema.names == TARGETS_SCHEMA.names
+    protein = targets.filter(pc.equal(targets.column("nutrient").cast(pa.string()), "protein"))
+    assert protein.column("avg").to_pylist() == [macro_data["protein"]["avg"]]
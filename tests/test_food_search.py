@@ -0,0 +1,69 @@
+import gc
+import random
+
+import numpy as np
+
+import food_search
+from food_db import FoodCatalog
+from food_search import CANDIDATE_LIMIT, ExtendedSearchIndex, FoodSearchIndex, search_index, tokenize
+from planner import FOOD_CATALOG, FOOD_DATA
+
+
+def brute_force(names, query):
+    terms = tokenize(query)
+    return {food for food, name in enumerate(names)
+            if all(any(word.startswith(term) for word in tokenize(name)) for term in terms)}
+
+
+def test_multi_word_match_beyond_the_shortest_names():
+    # Each word alone matches thousands of shorter names; only one long name has both
+    names = ([f"Chicken thigh {i}" for i in range(5000)] + [f"Turkey breast {i}" for i in range(5000)]
+             + ["Chicken breast, roasted, skinless, with a long seasoning description"])
+    index = FoodSearchIndex(range(len(names)), names)
+    assert index.search("chicken breast") == [len(names) - 1]
+    assert index.search("breast chick") == [len(names) - 1]
+
+
+def test_multi_word_queries_find_min_k_matches():
+    rng = random.Random(0)
+    words = "chicken beef rice oat broccoli kale cooked raw fried lean olive almond".split()
+    names = [" ".join(rng.sample(words, 3)).title() + f" {'x' * rng.randint(0, 40)} #{i}"
+             for i in range(3 * CANDIDATE_LIMIT)]
+    index = FoodSearchIndex(range(len(names)), names)
+    for query in ("rice brocc", "kale c", "oat fried lean", "o al"):
+        matches = brute_force(names, query)
+        found = index.search(query, k=10)
+        assert len(found) == len(set(found)) == min(10, len(matches))
+        assert set(found) <= matches
+
+
+def test_added_foods_are_indexed_without_a_rebuild(monkeypatch):
+    monkeypatch.setattr(food_search, "ADDED_INDEX_LIMIT", 3)
+    catalog = FoodCatalog.from_food_data(FOOD_DATA)
+    base = search_index(catalog, "proteins")
+    nutrients = FOOD_CATALOG.nutrients[[FOOD_CATALOG.id_of("Salmon")]]
+
+    shake = catalog.add_foods(["Salmon Shake"], ["proteins"], nutrients)[0]
+    index = search_index(catalog, "proteins")
+    assert isinstance(index, ExtendedSearchIndex) and index.base is base
+    assert index.search("salmon", k=2) == [catalog.id_of("Salmon"), shake]
+    assert index.search("shake") == [shake]
+    assert search_index(catalog, "proteins") is index
+
+    catalog.add_foods([f"Salmon Bowl {size}" for size in range(3)], ["proteins"] * 3,
+                      nutrients.repeat(3, axis=0))
+    rebuilt = search_index(catalog, "proteins")
+    assert isinstance(rebuilt, FoodSearchIndex) and len(rebuilt) == len(catalog.ids_in("proteins"))
+
+
+def test_indexes_follow_their_catalog_object():
+    catalog = FoodCatalog.from_food_data(FOOD_DATA)
+    assert search_index(catalog).search("salmon") == [catalog.id_of("Salmon")]
+    cached = len(food_search._indexes)
+    del catalog
+    gc.collect()
+    assert len(food_search._indexes) == cached - 1
+
+    # A new catalog (which may get the old one's id()) never gets the old index
+    catalog = FoodCatalog.from_records(["Salmon Shake", "Salmon"], ["proteins", "proteins"], np.ones((2, 4)))
+    assert search_index(catalog).search("salmon") == [catalog.id_of("Salmon"), catalog.id_of("Salmon Shake")]
@@ -0,0 +1,28 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from batch import run_batch
+from grocery import aggregate
+from test_batch import ROW, write_roster
+
+
+def test_totals_add_up_across_plans(tmp_path):
+    pq.write_table(pa.table({"food": ["Oats", "Kale", "Oats", None], "amount_g": [80.0, 50.0, 40.0, 10.0]}),
+                   tmp_path / "week1.parquet", row_group_size=2)
+    (tmp_path / "week2.csv").write_text("client,food,amount_g\na,Kale,25\nb,Salmon,150\nb,Oats,\n")
+    totals, stats = aggregate([str(tmp_path / "week1.parquet"), str(tmp_path / "week2.csv")], workers=1)
+    assert totals.grams == {"Oats": 120.0, "Kale": 75.0, "Salmon": 150.0}
+    assert totals.items == {"Oats": 2, "Kale": 2, "Salmon": 1}
+    assert stats == {"skipped": 0, "errors": []}
+
+
+def test_roster_totals_match_the_written_plan(tmp_path):
+    write_roster(tmp_path / "roster.csv", [dict(ROW, name="a"), dict(ROW, name="b", weight=150),
+                                           dict(ROW, name="no veg", vegetables="")])
+    run_batch(str(tmp_path / "roster.csv"), str(tmp_path / "plan.parquet"), workers=1)
+    planned, _ = aggregate([str(tmp_path / "plan.parquet")], workers=1)
+    totals, stats = aggregate([str(tmp_path / "roster.csv")], roster=True, workers=1, chunk_size=2)
+    assert totals.items == planned.items
+    assert totals.grams.keys() == planned.grams.keys()
+    assert all(abs(totals.grams[name] - planned.grams[name]) < 1e-6 for name in planned.grams)
+    assert stats["skipped"] == 1 and stats["errors"][0].startswith("no veg:")
@@ -0,0 +1,64 @@
+import random
+
+import numpy as np
+
+from food_db import FoodCatalog, SparseNutrients
+from planner import (CATEGORY_ORDER, FOOD_CATALOG, calculate_portions_many, iter_portion_stacks, micronutrient_totals,
+                     solve_portions)
+
+
+def test_micronutrients_use_the_solver_portions():
+    rng = random.Random(0)
+    meals = [{category: rng.sample(FOOD_CATALOG.names_in(category), rng.randint(category != "fats", 2))
+              for category in CATEGORY_ORDER} for _ in range(300)]
+    targets = [[rng.uniform(low, high) for _ in meals] for low, high in ((20, 70), (20, 90), (5, 35))]
+    engine = np.full((len(meals), 8), np.nan)
+    for meal_indices, _, _, portions, _ in iter_portion_stacks(meals, *targets):
+        engine[meal_indices, :portions.shape[1]] = portions
+
+    # The array engine (one stack of 300 meals) and plain Python (one meal at a time) carry the same portions
+    stacked = calculate_portions_many(meals, *targets, with_portions=True)
+    for meal_idx, (meal_items, portions) in enumerate(stacked):
+        assert portions == engine[meal_idx, :len(portions)].tolist()
+        _, info = solve_portions(meals[meal_idx], *(target[meal_idx] for target in targets))
+        assert info["portions"] == portions
+        ids = [FOOD_CATALOG.id_of(item["Food"]) for item in meal_items]
+        assert list(micronutrient_totals(meal_items, portions).values()) == np.round(
+            FOOD_CATALOG.micros.totals(ids, portions), 1).tolist()
+
+        _, info = solve_portions(meals[meal_idx], *(target[meal_idx] for target in targets), solver="optimize")
+        assert len(info["portions"]) == len(meal_items)
+
+
+def test_foods_gone_from_the_catalog_are_left_out():
+    meal_items, portions = calculate_portions_many([{"proteins": ["Salmon"], "carbs": ["Oats"], "vegetables": ["Kale"],
+                                                     "fats": []}], 40, 50, 15, with_portions=True)[0]
+    gone = dict(meal_items[0], Food="Discontinued Recipe")
+    assert micronutrient_totals(meal_items + [gone], portions + [250.0]) == micronutrient_totals(meal_items, portions)
+    assert micronutrient_totals([gone]) == dict.fromkeys(FOOD_CATALOG.micros.names, 0.0)
+
+
+def test_sparse_sums_match_the_dense_product():
+    rng = np.random.default_rng(0)
+    dense = rng.random((500, 6)) * 100
+    dense[rng.random(dense.shape) < 0.8] = np.nan
+    sparse = SparseNutrients.from_dense([f"n{index}" for index in range(6)], dense)
+    assert len(sparse.data) == np.count_nonzero(~np.isnan(dense))
+    known = np.nan_to_num(dense)
+
+    for items in (0, 1, 7, 300):
+        # Repeated foods count once per item
+        ids = rng.integers(0, len(dense), items)
+        grams = rng.uniform(10, 300, items)
+        totals = sparse.totals(ids, grams)
+        assert totals.dtype == np.float64
+        assert np.allclose(totals, grams / 100 @ known[ids])
+        assert np.array_equal(sparse.dense(ids), known[ids])
+
+
+def test_added_and_rewritten_rows_keep_the_sums_right():
+    catalog = FoodCatalog.from_records(["A", "B"], ["carbs", "fats"], np.ones((2, 4)), ["fiber", "sodium"],
+                                       [[2.0, np.nan], [0.0, 300.0]])
+    catalog.add_foods(["C"], ["proteins"], np.ones((1, 4)), [[1.0, 50.0]])
+    catalog.set_nutrients([0], np.ones((1, 4)), [[4.0, 10.0]])
+    assert catalog.micros.totals([0, 1, 2, 2], [100, 50, 200, 100]).tolist() == [4.0 + 3.0, 10 + 150 + 150.0]
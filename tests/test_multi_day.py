@@ -0,0 +1,45 @@
+from collections import Counter
+
+import pytest
+
+from multi_day import DAYS_PER_WEEK, generate_plan
+from planner import calculate_macros
+
+
+def week_counts(plan, category):
+    weeks = [Counter() for _ in range(-(-plan.days // DAYS_PER_WEEK))]
+    for day, selections in enumerate(plan.selections):
+        for foods in selections:
+            weeks[day // DAYS_PER_WEEK].update(foods[category])
+    return weeks
+
+
+def test_generated_plan_keeps_the_variety_rules():
+    plan, _ = generate_plan(calculate_macros(180, "maintenance", "moderate"), days=10, num_meals=3,
+                            pools={"carbs": ["Oats", "Quinoa (cooked)", "Brown Rice (cooked)"]})
+    for selections in plan.selections:
+        proteins = [food for foods in selections for food in foods["proteins"]]
+        assert len(proteins) == len(set(proteins))
+    assert all(max(counts.values()) <= 7 for counts in week_counts(plan, "carbs"))
+    assert all(day_plan is not None for day_plan in plan.day_plans)
+
+    with pytest.raises(ValueError, match="cannot fill 21 meals a week"):
+        generate_plan(calculate_macros(180, "maintenance", "moderate"), pools={"carbs": ["Oats", "Quinoa (cooked)"]})
+    # A repeated pool entry passes the size check but runs out on the day
+    with pytest.raises(ValueError, match=r"leave no carbs for day 1, meal 2 \(each at most 1 per day"):
+        generate_plan(calculate_macros(180, "maintenance", "moderate"), num_meals=2, max_per_day={"carbs": 1},
+                      pools={"carbs": ["Oats", "Oats"]})
+
+
+def test_swapping_a_meal_replans_only_its_day():
+    plan, _ = generate_plan(calculate_macros(180, "maintenance", "moderate"), days=3, num_meals=2)
+    before = [day_plan["totals"] for day_plan in plan.day_plans]
+    foods = dict(plan.selections[1][0], carbs=["Oats"])
+    assert plan.swap_meal(1, 0, foods) == [1]
+    assert plan.selections[1][0]["carbs"] == ["Oats"]
+    assert plan.day_plans[0]["totals"] == before[0] and plan.day_plans[2]["totals"] == before[2]
+
+    with pytest.raises(ValueError, match="variety rules"):
+        plan.swap_meal(1, 0, dict(foods, proteins=plan.selections[1][1]["proteins"]))
+    with pytest.raises(ValueError, match="vegetables"):
+        plan.swap_meal(1, 0, dict(foods, vegetables=[]))
@@ -0,0 +1,69 @@
+import random
+import threading
+from collections import OrderedDict
+
+import pytest
+
+import planner
+from planner import (CATEGORY_ORDER, FOOD_CATALOG, calculate_portions, calculate_portions_many, portion_residual,
+                     solve_portions, suggest_meals)
+
+
+def random_meals(count, seed=0):
+    rng = random.Random(seed)
+    for _ in range(count):
+        foods = {category: rng.sample(FOOD_CATALOG.names_in(category), rng.randint(category != "fats", 2))
+                 for category in CATEGORY_ORDER}
+        yield foods, (rng.uniform(20, 70), rng.uniform(20, 90), rng.uniform(5, 35))
+
+
+def test_optimize_never_worse_than_greedy_after_rounding():
+    for foods, targets in random_meals(1000):
+        meal_items, _ = solve_portions(foods, *targets, solver="optimize")
+        assert portion_residual(meal_items, *targets) <= portion_residual(calculate_portions(foods, *targets), *targets)
+
+
+def test_solver_cache_shared_across_threads(monkeypatch):
+    monkeypatch.setattr(planner, "SOLVER_CACHE_SIZE", 8)
+    monkeypatch.setattr(planner, "_solver_cache", OrderedDict())
+    meals = list(random_meals(200, seed=1))
+    errors = []
+
+    def plan():
+        try:
+            for foods, targets in meals:
+                solve_portions(foods, *targets, solver="optimize")
+        except Exception as e:
+            errors.append(e)
+
+    def invalidate():
+        for food in range(0, len(FOOD_CATALOG), 3):
+            planner._foods_changed([food])
+
+    threads = [threading.Thread(target=plan) for _ in range(4)] + [threading.Thread(target=invalidate)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert len(planner._solver_cache) <= 8
+
+
+def brute_force_residuals(protein_target, carbs_target, fat_target, k):
+    ids = {category: FOOD_CATALOG.distinct_in(category)[0].tolist() for category in CATEGORY_ORDER}
+    selections = [{"proteins": [protein], "carbs": [carb], "vegetables": [veg], "fats": [fat] if fat >= 0 else []}
+                  for veg in ids["vegetables"] for fat in [-1] + ids["fats"] for carb in ids["carbs"]
+                  for protein in ids["proteins"]]
+    meals = calculate_portions_many(selections, protein_target, carbs_target, fat_target)
+    return sorted(portion_residual(meal_items, protein_target, carbs_target, fat_target) for meal_items in meals)[:k]
+
+
+def test_suggest_meals_matches_brute_force():
+    # The built-in catalog fits in the shortlists, so an exhaustive search must find the true top k
+    rng = random.Random(0)
+    for _ in range(40):
+        targets = (rng.randint(20, 70), rng.randint(20, 90), rng.randint(5, 35))
+        suggestions, info = suggest_meals(*targets, k=5, time_budget_ms=60000)
+        assert info["exhaustive"]
+        assert [suggestion["residual"] for suggestion in suggestions] == pytest.approx(
+            brute_force_residuals(*targets, k=5), abs=1e-9)
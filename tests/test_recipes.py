@@ -0,0 +1,70 @@
+import threading
+
+import numpy as np
+import pytest
+
+from food_db import FoodCatalog
+from planner import FOOD_DATA
+from recipes import RecipeBook
+
+SHAKE = {"category": "proteins", "ingredients": {"Greek Yogurt": 250, "Oats": 40}}
+BOX = {"category": "carbs", "ingredients": {"Protein Shake": 100, "Brown Rice (cooked)": 200}, "yield_g": 250}
+
+
+def row(catalog, name):
+    return catalog.nutrients[catalog.id_of(name)]
+
+
+def test_nested_recipes_are_computed_ingredients_first():
+    catalog = FoodCatalog.from_food_data(FOOD_DATA)
+    book = RecipeBook(catalog)
+    # The box is listed before the shake it uses
+    assert book.update({"Prep Box": BOX, "Protein Shake": SHAKE}) == ["Protein Shake", "Prep Box"]
+
+    shake = (250 * row(catalog, "Greek Yogurt") + 40 * row(catalog, "Oats")) / 290
+    assert np.allclose(row(catalog, "Protein Shake"), shake)
+    assert np.allclose(row(catalog, "Prep Box"), (100 * shake + 200 * row(catalog, "Brown Rice (cooked)")) / 250)
+
+    # Changing a base food recomputes only the recipes above it, in order
+    assert book.update_food("Oats", row(catalog, "Oats") * 2) == ["Protein Shake", "Prep Box"]
+    assert book.update_food("Salmon", row(catalog, "Salmon") * 2) == []
+    shake = (250 * row(catalog, "Greek Yogurt") + 40 * row(catalog, "Oats")) / 290
+    assert np.allclose(row(catalog, "Prep Box"), (100 * shake + 200 * row(catalog, "Brown Rice (cooked)")) / 250)
+
+
+def test_cycles_are_rejected_without_adding_rows():
+    catalog = FoodCatalog.from_food_data(FOOD_DATA)
+    book = RecipeBook(catalog)
+    foods = len(catalog)
+    with pytest.raises(ValueError, match="cycle"):
+        book.update({"A": {"category": "carbs", "ingredients": {"B": 10, "Oats": 10}},
+                     "B": {"category": "carbs", "ingredients": {"A": 10}}})
+    assert len(catalog) == foods and "A" not in book
+
+    book.update({"Protein Shake": SHAKE})
+    with pytest.raises(ValueError, match="cycle"):
+        book.update({"Protein Shake": {"category": "proteins", "ingredients": {"Protein Shake": 10, "Oats": 40}}})
+    assert book.recipes["Protein Shake"]["ingredients"] == SHAKE["ingredients"]
+
+
+def test_recipe_micronutrients_are_weighted_like_macros():
+    catalog = FoodCatalog.from_food_data(FOOD_DATA)
+    RecipeBook(catalog).update({"Protein Shake": SHAKE})
+    ids = [catalog.id_of(name) for name in ("Greek Yogurt", "Oats", "Protein Shake")]
+    yogurt, oats, shake = catalog.micros.dense(ids)
+    assert np.allclose(shake, (250 * yogurt + 40 * oats) / 290)
+
+
+def test_recipe_changes_wait_for_planning_readers():
+    catalog = FoodCatalog.from_food_data(FOOD_DATA)
+    book = RecipeBook(catalog)
+    writer = threading.Thread(target=book.update, args=({"Protein Shake": SHAKE},))
+    with catalog.lock:
+        writer.start()
+        writer.join(0.1)
+        assert writer.is_alive() and "Protein Shake" not in catalog
+        # Readers do not queue behind a waiting writer, so nested reads cannot deadlock
+        with catalog.lock:
+            assert len(catalog) == len(FOOD_DATA)
+    writer.join(5)
+    assert not writer.is_alive() and "Protein Shake" in catalog
@@ -0,0 +1,68 @@
+import asyncio
+import json
+import time
+from unittest import mock
+
+import tornado.testing
+from tornado.gen import multi
+from tornado.httpclient import AsyncHTTPClient
+
+from planner import calculate_macros, calculate_portions, solve_portions
+from service import make_app
+
+FOODS = {"proteins": ["Salmon"], "carbs": ["Oats"], "vegetables": ["Kale"], "fats": []}
+
+
+class ServiceTest(tornado.testing.AsyncHTTPTestCase):
+    def get_app(self):
+        return make_app(batch_window_ms=50)
+
+    def post(self, path, body):
+        response = self.fetch(path, method="POST", body=json.dumps(body), raise_error=False)
+        assert response.reason == ("OK" if response.code == 200 else "Bad Request")
+        return response.code, json.loads(response.body)
+
+    def test_macros_match_the_planner(self):
+        code, body = self.post("/macros", {"weight": 180, "goal": "maintenance", "activity_level": "moderate"})
+        assert code == 200 and body == calculate_macros(180, "maintenance", "moderate")
+
+    @tornado.testing.gen_test
+    async def test_concurrent_portions_share_a_batch_and_match_one_by_one(self):
+        targets = [(40 + meal, 50, 15) for meal in range(5)]
+        client = AsyncHTTPClient()
+        responses = await multi([
+            client.fetch(self.get_url("/portions"), method="POST",
+                         body=json.dumps({"foods": FOODS, "protein": protein, "carbs": carbs, "fat": fat}))
+            for protein, carbs, fat in targets])
+        for response, (protein, carbs, fat) in zip(responses, targets):
+            assert json.loads(response.body)["meal_items"] == calculate_portions(FOODS, protein, carbs, fat)
+        assert self._app.settings["batcher"].stats()["largest"] == len(targets)
+
+    def test_invalid_requests_answer_400_with_a_reason(self):
+        assert self.post("/portions", {"foods": dict(FOODS, vegetables=[]), "protein": 40, "carbs": 50, "fat": 15}) \
+            == (400, {"error": "Select at least one food for: vegetables"})
+        assert self.post("/macros", {"weight": 180, "goal": "bulk", "activity_level": "moderate"})[0] == 400
+        assert self.post("/portions", {"foods": FOODS, "protein": -1, "carbs": 50, "fat": 15}) \
+            == (400, {"error": "'protein' must be a non-negative number"})
+
+    def test_client_text_stays_out_of_the_status_line(self):
+        for name in ("Salmon\r\nX-Injected: 1", "Caf\u00e9 au lait", "x" * 10000):
+            assert self.post("/portions", {"foods": dict(FOODS, proteins=[name]), "protein": 40, "carbs": 50,
+                                           "fat": 15}) == (400, {"error": f"Unknown foods: {name}"})
+
+    @tornado.testing.gen_test
+    async def test_optimize_requests_do_not_hold_up_the_event_loop(self):
+        def slow_solve(*args, **kwargs):
+            time.sleep(0.5)
+            return solve_portions(*args, **kwargs)
+
+        client = AsyncHTTPClient()
+        with mock.patch("service.solve_portions", slow_solve):
+            start = time.monotonic()
+            optimize = client.fetch(self.get_url("/portions"), method="POST", body=json.dumps(
+                {"foods": FOODS, "protein": 40, "carbs": 50, "fat": 15, "solver": "optimize"}))
+            await asyncio.sleep(0.05)
+            await client.fetch(self.get_url("/portions"), method="POST",
+                               body=json.dumps({"foods": FOODS, "protein": 40, "carbs": 50, "fat": 15}))
+            assert time.monotonic() - start < 0.4
+            assert (await optimize).code == 200